@@ -0,0 +1,350 @@
+"""
+Cold-start benchmark for the blueprint Lambdas.
+
+For each function, a fresh interpreter imports the handler module, builds its
+AWS clients, invokes the handler once (first invocation) and then repeatedly
+(warm invocations). AWS calls are answered in-process by canned responses
+hooked into each client's ``before-call`` event, so requests are still
+serialised and validated by botocore but never leave the machine. The
+DataMasque Lambdas talk to a local fake DataMasque HTTP server.
+
+Usage (from the repo root):
+    python benchmarks/cold_start.py                     # all functions
+    python benchmarks/cold_start.py check_masking_run   # just one
+    python benchmarks/cold_start.py --json > bench.json # machine-readable
+    python benchmarks/cold_start.py --baseline bench.json --tolerance 0.5
+    python benchmarks/cold_start.py --snapstart         # simulate a SnapStart init
+
+With --baseline, the run exits non-zero when any function's import, init or
+warm median exceeds the baseline by more than the tolerance (a fraction).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER = os.path.join(REPO, "layers", "common")
+
+RDS_INSTANCE = {
+    "DBInstanceIdentifier": "src-datamasque",
+    "DBInstanceClass": "db.r6g.large",
+    "DBInstanceStatus": "available",
+    "Engine": "postgres",
+    "AvailabilityZone": "ap-southeast-2a",
+    "DBSubnetGroup": {"DBSubnetGroupName": "default"},
+    "OptionGroupMemberships": [],
+    "DBParameterGroups": [{"DBParameterGroupName": "default.postgres16"}],
+}
+SNAPSHOT = {
+    "DBSnapshotIdentifier": "src-snap",
+    "DBInstanceIdentifier": "src",
+    "Status": "available",
+    "SnapshotCreateTime": datetime(2026, 1, 1, tzinfo=timezone.utc),
+}
+DB_SECRET = {
+    "username": "app",
+    "password": "pw",
+    "engine": "postgres",
+    "host": "src.abc.ap-southeast-2.rds.amazonaws.com",
+    "port": "5432",
+    "dbname": "app",
+    "schema": "public",
+}
+
+# function -> (event, {operation: response | ("error", code)})
+SCENARIOS = {
+    "check_db_availability": (
+        {"StageDB": "src-datamasque", "DBType": "RDS"},
+        {"DescribeDBInstances": {"DBInstances": [RDS_INSTANCE]}},
+    ),
+    "check_masked_snapshot": (
+        {"StageDB": "src-datamasque", "DBType": "RDS", "MaskedDBSnapshotIdentifier": "masked"},
+        {"DescribeDBSnapshots": {"DBSnapshots": [{**SNAPSHOT, "Status": "creating"}]}},
+    ),
+    "create_masked_snapshot": (
+        {"StageDB": "src-datamasque", "DBType": "RDS"},
+        {"CreateDBSnapshot": {"DBSnapshot": {"DBSnapshotIdentifier": "masked", "Status": "creating"}}},
+    ),
+    "describe_db_instances": (
+        {"DBSnapshotIdentifier": "src-snap", "DBInstanceIdentifier": "src", "DBType": "RDS"},
+        {"DescribeDBInstances": {"DBInstances": [RDS_INSTANCE]}},
+    ),
+    "describe_db_snapshots": (
+        {"DBInstanceIdentifier": "src"},
+        {
+            "DescribeDBClusters": ("error", "DBClusterNotFoundFault"),
+            "DescribeDBInstances": {"DBInstances": [RDS_INSTANCE]},
+            "DescribeDBSnapshots": {"DBSnapshots": [SNAPSHOT]},
+        },
+    ),
+    "restore_db_instance_from_db_snapshot": (
+        {
+            "DBType": "RDS",
+            "parameters": {
+                "DBSnapshotIdentifier": "src-snap",
+                "DBInstanceIdentifier": "src-datamasque",
+                "DBInstanceClass": "db.r6g.large",
+                "AvailabilityZone": "ap-southeast-2a",
+                "DBSubnetGroupName": "default",
+                "DeletionProtection": False,
+            },
+        },
+        {"RestoreDBInstanceFromDBSnapshot": {"DBInstance": {"DBInstanceIdentifier": "src-datamasque"}}},
+    ),
+    "datamasque_run": (
+        {
+            "DBInstanceIdentifier": "src",
+            "DataMasqueRulesetId": "ruleset-1",
+            "DBSecretIdentifier": "datamasque/app-connections",
+            "StageDB": "src-datamasque",
+        },
+        {
+            "GetSecretValue": lambda params: {
+                "ARN": params["SecretId"],
+                "SecretString": json.dumps(
+                    DB_SECRET if params["SecretId"].startswith("datamasque/") else {"username": "u", "password": "p"}
+                ),
+            }
+        },
+    ),
+    "preflight": (
+        {
+            "DBInstanceIdentifier": "src",
+            "DataMasqueRulesetId": "ruleset-1",
+            "DBSecretIdentifier": "datamasque/app-connections",
+        },
+        {
+            "GetSecretValue": lambda params: {
+                "ARN": params["SecretId"],
+                "SecretString": json.dumps(
+                    DB_SECRET if params["SecretId"].startswith("datamasque/") else {"username": "u", "password": "p"}
+                ),
+            }
+        },
+    ),
+    "check_masking_run": (
+        {
+            "MaskRunId": "run-1",
+            "StageDB": "src-datamasque",
+            "DBSecretIdentifier": "datamasque/app-connections",
+        },
+        {
+            "GetSecretValue": {
+                "ARN": "dm",
+                "SecretString": json.dumps({"username": "u", "password": "p"}),
+            }
+        },
+    ),
+}
+
+SERVICES = {"datamasque_run": "secretsmanager", "check_masking_run": "secretsmanager", "preflight": "secretsmanager"}
+
+
+class _FakeDataMasque(BaseHTTPRequestHandler):
+    """Minimal keep-alive DataMasque API answering the calls the Lambdas make."""
+
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment so delayed ACKs don't add ~40 ms.
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain" if isinstance(payload, bytes) else "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _drain(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+    def do_POST(self):
+        self._drain()
+        if self.path.endswith("/auth/token/login/"):
+            self._reply(200, {"key": "tok", "date_time_expires": "2999-01-01T00:00:00Z"})
+        elif self.path.endswith("/connections/test/"):
+            self._reply(200, {})
+        elif self.path.endswith("/connections/"):
+            self._reply(201, {"id": "conn-1", "name": "database_app_datamasque_temp"})
+        elif self.path.endswith("/runs/"):
+            self._reply(201, {"id": "run-1", "status": "queued"})
+        else:
+            self._reply(204, {})
+
+    def do_GET(self):
+        self._drain()
+        if "/rulesets/" in self.path:
+            self._reply(200, {"id": "ruleset-1", "name": "bench", "is_valid": True})
+        elif self.path.endswith("/log/"):
+            self._reply(206, b"Masked 1,000 rows in table customers\n")
+        elif "/runs/" in self.path:
+            self._reply(200, {"id": "run-1", "status": "running", "connection": "conn-1"})
+        elif "/connections/conn-1/" in self.path:
+            self._reply(200, {"id": "conn-1", "name": "database_app_datamasque_temp"})
+        elif "/connections/" in self.path:
+            self._reply(200, [])
+        else:
+            self._reply(200, {})
+
+    def do_DELETE(self):
+        self._drain()
+        self._reply(204, {})
+
+
+def _canned(responses):
+    """``before-call`` handler that short-circuits the request with a canned response."""
+    from botocore.awsrequest import AWSResponse
+
+    def handler(model, params, **kwargs):
+        response = responses[model.name]
+        if isinstance(response, tuple):
+            # botocore maps a >=300 status to the client's modeled exception.
+            error = {"Error": {"Code": response[1], "Message": "stubbed"}, "ResponseMetadata": {}}
+            return AWSResponse(None, 400, {}, None), error
+        if callable(response):
+            # JSON-protocol services (Secrets Manager) carry the params as the body.
+            response = response(json.loads(params["body"] or "{}"))
+        return AWSResponse(None, 200, {}, None), response
+
+    return handler
+
+
+def run_child(function: str, invocations: int) -> dict:
+    """Measure one function inside this (fresh) interpreter."""
+    event, responses = SCENARIOS[function]
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeDataMasque)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.update(
+        {
+            "AWS_DEFAULT_REGION": "ap-southeast-2",
+            "AWS_ACCESS_KEY_ID": "bench",
+            "AWS_SECRET_ACCESS_KEY": "bench",
+            "DATAMASQUE_BASE_URL": f"http://127.0.0.1:{server.server_port}/",
+            "DATAMASQUE_SECRET_ARN": "arn:aws:secretsmanager:ap-southeast-2:111111111111:secret:dm-AbCdEf",
+            "DATAMASQUE_SG": "sg-bench",
+        }
+    )
+    sys.path[:0] = [os.path.join(REPO, "functions", function), LAYER]
+
+    start = time.perf_counter()
+    import app  # noqa: E402  (import time is what we are measuring)
+
+    import_ms = (time.perf_counter() - start) * 1000
+
+    from blueprint_common import aws, rds
+
+    start = time.perf_counter()
+    service = SERVICES.get(function, "rds")
+    # The RDS handlers use the throttle-aware wrapper's client.
+    client = rds.client() if service == "rds" else aws.client(service)
+    init_ms = (time.perf_counter() - start) * 1000
+    client.meta.events.register("before-call.*.*", _canned(responses))
+
+    def invoke():
+        start = time.perf_counter()
+        result = app.lambda_handler(json.loads(json.dumps(event)), None)
+        elapsed = (time.perf_counter() - start) * 1000
+        if "Error" in result:
+            raise RuntimeError(f"{function} returned an error: {result['Error']}")
+        return elapsed
+
+    first_ms = invoke()
+    warm = sorted(invoke() for _ in range(invocations))
+    server.shutdown()
+    return {
+        "function": function,
+        "import_ms": round(import_ms, 2),
+        "init_ms": round(init_ms, 2),
+        "first_invoke_ms": round(first_ms, 2),
+        "warm_median_ms": round(statistics.median(warm), 3),
+        "warm_p95_ms": round(warm[int(len(warm) * 0.95) - 1], 3),
+    }
+
+
+def _measure(function: str, invocations: int) -> dict:
+    child = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", function, "--invocations", str(invocations)],
+        capture_output=True,
+        text=True,
+        cwd=REPO,
+    )
+    if child.returncode != 0:
+        raise RuntimeError(f"benchmark of {function} failed:\n{child.stderr}")
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def _regressions(results, baseline, tolerance):
+    previous = {r["function"]: r for r in baseline}
+    failures = []
+    for result in results:
+        base = previous.get(result["function"])
+        if not base:
+            continue
+        for metric in ("import_ms", "init_ms", "warm_median_ms"):
+            if result[metric] > base[metric] * (1 + tolerance):
+                failures.append(f"{result['function']}.{metric}: {result[metric]} > {base[metric]} (+{tolerance:.0%})")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("functions", nargs="*", default=sorted(SCENARIOS), help="functions to measure")
+    parser.add_argument("--invocations", type=int, default=50, help="warm invocations per function")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--baseline", help="JSON results from a previous --json run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed fractional slowdown vs baseline")
+    parser.add_argument(
+        "--snapstart",
+        action="store_true",
+        help="import handlers as a SnapStart init would (clients primed at import)",
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        # The handlers log every event; keep the child's stdout for the result.
+        sys.stdout, real_stdout = open(os.devnull, "w"), sys.stdout
+        result = run_child(args.child, args.invocations)
+        print(json.dumps(result), file=real_stdout)
+        return 0
+
+    if args.snapstart:
+        os.environ["AWS_LAMBDA_INITIALIZATION_TYPE"] = "snap-start"
+    results = [_measure(function, args.invocations) for function in args.functions]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        header = f"{'function':40} {'import':>9} {'init':>9} {'first':>9} {'warm p50':>9} {'warm p95':>9}"
+        print(header)
+        print("-" * len(header))
+        for r in results:
+            print(
+                f"{r['function']:40} {r['import_ms']:>9.1f} {r['init_ms']:>9.1f} "
+                f"{r['first_invoke_ms']:>9.1f} {r['warm_median_ms']:>9.2f} {r['warm_p95_ms']:>9.2f}"
+            )
+        print("(milliseconds)")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = _regressions(results, json.load(f), args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION {failure}", file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
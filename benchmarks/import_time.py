@@ -0,0 +1,88 @@
+"""
+Import-time profile of each Lambda handler module (``python -X importtime``).
+
+Runs ``import app`` in a fresh interpreter per function, several times, and
+reports the median cumulative import time of ``app`` plus the heaviest
+packages it pulled in. This is the part of Lambda init duration that the
+handler code controls.
+
+Usage (from the repo root):
+    python benchmarks/import_time.py                 # all functions
+    python benchmarks/import_time.py --repeat 9 datamasque_run
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER = os.path.join(REPO, "layers", "common")
+FUNCTIONS = sorted(
+    d for d in os.listdir(os.path.join(REPO, "functions")) if os.path.isfile(os.path.join(REPO, "functions", d, "app.py"))
+)
+# Top-level packages worth calling out when they are imported.
+WATCH = ("boto3", "botocore", "requests", "urllib3", "charset_normalizer", "idna", "certifi", "blueprint_common")
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+ENV = {
+    "DATAMASQUE_BASE_URL": "https://dm.example/",
+    "DATAMASQUE_SECRET_ARN": "arn:aws:secretsmanager:ap-southeast-2:111111111111:secret:dm-AbCdEf",
+    "DATAMASQUE_SG": "sg-bench",
+    "AWS_DEFAULT_REGION": "ap-southeast-2",
+}
+
+
+def profile(function: str) -> dict:
+    """Cumulative microseconds per top-level module for one ``import app``."""
+    env = {**os.environ, **ENV, "PYTHONPATH": os.pathsep.join([os.path.join(REPO, "functions", function), LAYER])}
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=REPO,
+    ).stderr
+    # importtime prints children before their parent, so the modules pulled in
+    # by ``app`` are those listed between the previous top-level entry and it
+    # (anything imported by site at startup is excluded).
+    cumulative, pending = {}, {}
+    for match in _LINE.finditer(stderr):
+        name, top_level = match.group(4), match.group(3) == " "
+        if name.split(".")[0] in WATCH and name == name.split(".")[0]:
+            pending[name] = int(match.group(2))
+        if top_level:
+            if name == "app":
+                cumulative.update(pending)
+                cumulative["app"] = int(match.group(2))
+            pending = {}
+    return cumulative
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("functions", nargs="*", default=FUNCTIONS)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per function (median is reported)")
+    args = parser.parse_args(argv)
+
+    print(f"{'function':40} {'app (ms)':>9}  heaviest imports (ms, cumulative)")
+    for function in args.functions:
+        runs = [profile(function) for _ in range(args.repeat)]
+        app_ms = statistics.median(r.get("app", 0) for r in runs) / 1000
+        packages = {
+            name: statistics.median(r.get(name, 0) for r in runs) / 1000
+            for name in WATCH
+            if any(name in r for r in runs)
+        }
+        detail = ", ".join(
+            f"{n} {ms:.0f}" for n, ms in sorted(packages.items(), key=lambda kv: -kv[1]) if ms >= 0.5
+        )
+        print(f"{function:40} {app_ms:>9.1f}  {detail or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,47 @@
 import json
 
-import boto3
+from blueprint_common import polling, rds, rds_events, rds_status, snapstart, staging
 
+# Builds and loads the RDS client during a SnapStart init; no-op otherwise.
+snapstart.init({"rds": ["DescribeDBInstances", "DescribeDBClusters", "CreateDBInstance"]})
+
+
+def _instance_status(client, db_identifier, since=None):
+    """Status published by the RDS status poller, else from DescribeDBInstances."""
+    cached = rds_status.read("db-instance", db_identifier, since=since)
+    if cached:
+        return cached["Status"]
+    db_response = client.describe_db_instances(
+        DBInstanceIdentifier=db_identifier,
+    )
+    return db_response["DBInstances"][0]["DBInstanceStatus"].lower()
+
+
+def _cluster_status(client, db_identifier, since=None):
+    """Status published by the RDS status poller, else from DescribeDBClusters."""
+    cached = rds_status.read("db-cluster", db_identifier, since=since)
+    if cached:
+        return cached["Status"]
+    db_response = client.describe_db_clusters(
+        DBClusterIdentifier=db_identifier,
+    )
+    return db_response["DBClusters"][0]["Status"].lower()
+
+
+def _unwatch(event):
+    """The wait is over: drop the staging DB from the RDS status poller."""
+    if event["DBType"] == "RDS":
+        rds_status.unwatch("db-instance", event["StageDB"])
+        return
+    rds_status.unwatch("db-cluster", event["StageDB"])
+    if event.get("StgDbInstanceId"):
+        rds_status.unwatch("db-instance", event["StgDbInstanceId"])
 
-def lambda_handler(event, context):
 
-    client = boto3.client("rds")
+def check_db_status(event):
+    """One poll of the staging DB (and, for Aurora, its instance) status."""
+
+    client = rds.client()
     print(json.dumps(event))
 
     # Check if the previous step failed
@@ -16,77 +52,73 @@ def lambda_handler(event, context):
         db_identifier = event["StageDB"]
         db_type = event["DBType"]  # Either "RDS" or "Aurora"
         print(f"DB Identifier: {db_identifier}, DB Type: {db_type}")
+        # Right after a resuming RDS event the cache may predate it.
+        since = rds_events.event_time(event)
 
         if db_type == "RDS":
-            db_response = client.describe_db_instances(
-                DBInstanceIdentifier=db_identifier,
-            )
-            db_instance = db_response["DBInstances"][0]
-            db_status = db_instance["DBInstanceStatus"].lower()
+            db_status = _instance_status(client, db_identifier, since)
 
             response = {
                 "status": db_status,
                 "DBInstance": db_identifier,
             }
             event["status"] = db_status
+            observed_status = db_status
 
         elif db_type == "Aurora":
-            # Check status of the Aurora cluster
-            db_response = client.describe_db_clusters(
-                DBClusterIdentifier=db_identifier,
-            )
-            db_cluster = db_response["DBClusters"][0]
-            if db_cluster["Status"].lower() == "available":
-                if "StgDbInstanceStatus" not in event:
+            cluster_status = _cluster_status(client, db_identifier, since)
+            if "StgDbInstanceStatus" not in event:
+                # The restore could not add the writer instance up front
+                # (or this execution predates that): add it once the cluster
+                # is available. Until then the cluster status is the status,
+                # so a failed restore reaches the cleanup.
+                event["status"] = cluster_status
+                observed_status = cluster_status
+                if cluster_status == "available":
                     print("Creating DB instance in the restored Aurora cluster...")
-                    instance_params = {
-                        "DBInstanceIdentifier": f'{event["parameters"]["DBInstanceIdentifier"]}-1',
-                        "DBInstanceClass": event["parameters"]["DBInstanceClass"],
-                        "Engine": event["parameters"]["Engine"],
-                        "DBClusterIdentifier": event["parameters"][
-                            "DBInstanceIdentifier"
-                        ],
-                        "DBSubnetGroupName": event["parameters"]["DBSubnetGroupName"],
-                    }
-                    # PreferredAZ is optional: describe_db_instances resolved it
-                    # into parameters.AvailabilityZone (None for Aurora when not
-                    # supplied). Only pin the AZ when one is known.
-                    az = event["parameters"].get("AvailabilityZone") or event.get(
-                        "PreferredAZ"
-                    )
-                    if az:
-                        instance_params["AvailabilityZone"] = az
-                    if event["parameters"].get("DBParameterGroupName"):
-                        instance_params["DBParameterGroupName"] = event["parameters"][
-                            "DBParameterGroupName"
-                        ]
-                    client.create_db_instance(**instance_params)
+                    client.create_db_instance(**staging.writer_instance_params(event))
                     event["status"] = "creating"
                     event["StgDbInstanceStatus"] = "creating"
-                    event["StgDbInstanceId"] = (
-                        f'{event["parameters"]["DBInstanceIdentifier"]}-1'
-                    )
+                    event["StgDbInstanceId"] = staging.writer_instance_id(event)
+                    rds_status.watch("db-instance", event["StgDbInstanceId"])
+                    observed_status = "instance-creating"
+            else:
+                # Cluster and writer instance are created in parallel; the
+                # database is usable once both are available.
+                instance_status = _instance_status(client, event["StgDbInstanceId"], since)
+                event["StgDbClusterStatus"] = cluster_status
+                event["StgDbInstanceStatus"] = instance_status
+                if cluster_status != "available" and not instance_status.startswith("fail"):
+                    event["status"] = cluster_status
                 else:
-                    db_response = client.describe_db_instances(
-                        DBInstanceIdentifier=f'{event["parameters"]["DBInstanceIdentifier"]}-1',
-                    )
-                    db_instance = db_response["DBInstances"][0]
-                    db_status = db_instance["DBInstanceStatus"].lower()
-
-                    response = {
-                        "status": db_status,
-                        "DBInstance": db_identifier,
-                    }
-                    event["status"] = db_status
-                    event["StgDbInstanceStatus"] = db_status
+                    event["status"] = instance_status
+                observed_status = f"cluster-{cluster_status}/instance-{instance_status}"
         else:
             raise ValueError(f"Invalid DBType: {db_type}. Expected 'RDS' or 'Aurora'.")
+        if _is_done(event):
+            _unwatch(event)
+        polling.schedule(event, "db_availability", observed_status)
         print(json.dumps(event))
         return event
 
     except Exception as e:
+        # Throttling that outlasted the retries is not a failure of the
+        # workflow; the state machine retries the task.
+        rds.raise_if_throttled(e)
         print(f"Error checking status of {event['StageDB'] }: {e}")
         event["status"] = "failure"
         event["Error"] = f"Error checking DB status: {e}"
         print(json.dumps(event))
         return event
+
+
+def _is_done(event):
+    status = event.get("status", "")
+    return status == "available" or status.startswith("fail")
+
+
+@rds.handler
+def lambda_handler(event, context):
+    if polling.internal_mode(event):
+        return polling.poll_internally(event, context, check_db_status, _is_done)
+    return check_db_status(event)
@@ -0,0 +1,136 @@
+"""
+Unit tests for app.py.
+
+Run from this directory:
+    pytest test_app.py -v
+"""
+import os
+import time
+
+import boto3
+import pytest
+from blueprint_common import rds_status, state_store
+from botocore.stub import Stubber
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import app
+
+
+@pytest.fixture
+def rds_client(monkeypatch):
+    monkeypatch.delenv("STATE_TABLE_NAME", raising=False)
+    state_store.reset_store()
+    client = boto3.client("rds", region_name="us-east-1")
+    monkeypatch.setattr(app.rds, "client", lambda: client)
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+    state_store.reset_store()
+
+
+def _publish(resource_type, identifier, status, observed_at):
+    state_store.get_store().put(
+        rds_status.STATUS_KIND,
+        f"{resource_type}:{identifier}",
+        {"Status": status, "PercentProgress": None, "ObservedAt": observed_at},
+    )
+
+
+def _instance(identifier, status):
+    return {"DBInstances": [{"DBInstanceIdentifier": identifier, "DBInstanceStatus": status}]}
+
+
+def test_cached_status_is_used_between_events(rds_client):
+    rds_status.watch("db-instance", "stg")
+    _publish("db-instance", "stg", "modifying", time.time())
+
+    result = app.lambda_handler({"StageDB": "stg", "DBType": "RDS"}, None)
+
+    assert result["status"] == "modifying"
+
+
+def test_cached_status_older_than_the_resuming_event_is_bypassed(rds_client):
+    _, stubber = rds_client
+    rds_status.watch("db-instance", "stg")
+    _publish("db-instance", "stg", "modifying", time.time() - 30)
+    stubber.add_response("describe_db_instances", _instance("stg", "available"), {"DBInstanceIdentifier": "stg"})
+    event_date = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - 5))
+    event = {"StageDB": "stg", "DBType": "RDS", "RdsEvent": {"EventID": "RDS-EVENT-0005", "Date": event_date}}
+
+    result = app.lambda_handler(event, None)
+
+    assert result["status"] == "available"
+    # The wait is over: the poller stops describing the instance.
+    assert state_store.get_store().items(rds_status.WATCH_KIND) == []
+
+
+def _cluster(identifier, status):
+    return {"DBClusters": [{"DBClusterIdentifier": identifier, "Status": status}]}
+
+
+def _aurora_event(**extra):
+    return {
+        "StageDB": "stg",
+        "DBType": "Aurora",
+        "WriteOptimizedStaging": False,
+        "parameters": {
+            "DBInstanceIdentifier": "stg",
+            "DBInstanceClass": "db.r6g.large",
+            "Engine": "aurora-postgresql",
+            "DBSubnetGroupName": "private",
+        },
+        **extra,
+    }
+
+
+def test_writer_is_created_once_the_cluster_is_available(rds_client):
+    # The restore could not add the writer (e.g. throttled): no StgDbInstanceStatus.
+    _, stubber = rds_client
+    stubber.add_response("describe_db_clusters", _cluster("stg", "available"), {"DBClusterIdentifier": "stg"})
+    stubber.add_response(
+        "create_db_instance",
+        {"DBInstance": {"DBInstanceIdentifier": "stg-1"}},
+        {
+            "DBInstanceIdentifier": "stg-1",
+            "DBInstanceClass": "db.r6g.large",
+            "Engine": "aurora-postgresql",
+            "DBClusterIdentifier": "stg",
+            "DBSubnetGroupName": "private",
+        },
+    )
+
+    result = app.lambda_handler(_aurora_event(), None)
+
+    assert (result["status"], result["StgDbInstanceStatus"], result["StgDbInstanceId"]) == ("creating", "creating", "stg-1")
+    assert state_store.get_store().items(rds_status.WATCH_KIND)[0][0] == "db-instance:stg-1"
+
+
+@pytest.mark.parametrize("cluster_status", ["creating", "failed"])
+def test_writer_is_not_created_before_the_cluster_is_available(rds_client, cluster_status):
+    _, stubber = rds_client
+    stubber.add_response("describe_db_clusters", _cluster("stg", cluster_status), {"DBClusterIdentifier": "stg"})
+
+    # "success" is what the restore reports when it could not add the writer.
+    result = app.lambda_handler(_aurora_event(status="success"), None)
+
+    assert result["status"] == cluster_status
+    assert "StgDbInstanceStatus" not in result
+
+
+@pytest.mark.parametrize(
+    "cluster_status, instance_status, expected",
+    [("creating", "creating", "creating"), ("available", "creating", "creating"), ("available", "available", "available")],
+)
+def test_writer_created_at_restore_is_waited_for_with_the_cluster(rds_client, cluster_status, instance_status, expected):
+    _, stubber = rds_client
+    stubber.add_response("describe_db_clusters", _cluster("stg", cluster_status), {"DBClusterIdentifier": "stg"})
+    stubber.add_response("describe_db_instances", _instance("stg-1", instance_status), {"DBInstanceIdentifier": "stg-1"})
+
+    result = app.lambda_handler(_aurora_event(StgDbInstanceId="stg-1", StgDbInstanceStatus="creating"), None)
+
+    assert (result["status"], result["StgDbClusterStatus"], result["StgDbInstanceStatus"]) == (
+        expected,
+        cluster_status,
+        instance_status,
+    )
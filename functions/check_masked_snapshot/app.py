@@ -1,36 +1,49 @@
 import json
 
-import boto3
+from blueprint_common import polling, rds, rds_events, rds_status, snapstart
 
 """
 Checks the status of the masked RDS/Aurora snapshot.
 """
 
+# Builds and loads the RDS client during a SnapStart init; no-op otherwise.
+snapstart.init({"rds": ["DescribeDBSnapshots", "DescribeDBClusterSnapshots"]})
 
-def lambda_handler(event, context):
+
+def check_snapshot_status(event):
+    """One poll of the masked snapshot status."""
 
     DBIdentifier = event["StageDB"]  # Can be an RDS instance or Aurora cluster
     DBType = event["DBType"]  # Either "RDS" or "Aurora"
 
-    client = boto3.client("rds")
+    client = rds.client()
 
     try:
         print("Checking the status of masked DB snapshot")
+        # Right after a resuming RDS event the cache may predate it.
+        since = rds_events.event_time(event)
+        resource_type = "snapshot" if DBType == "RDS" else "cluster-snapshot"
 
         if DBType == "RDS":
-            # Check the status of an RDS snapshot
-            response = client.describe_db_snapshots(
-                DBInstanceIdentifier=DBIdentifier,
-                Filters=[
-                    {
-                        "Name": "db-snapshot-id",
-                        "Values": [
-                            event["MaskedDBSnapshotIdentifier"],
-                        ],
-                    },
-                ],
-            )
-            snapshot_status = response["DBSnapshots"][0]["Status"]
+            # Check the status of an RDS snapshot, preferring the status the
+            # RDS status poller published.
+            cached = rds_status.read("snapshot", event["MaskedDBSnapshotIdentifier"], since=since)
+            if cached:
+                snapshot_status, percent = cached["Status"], cached["PercentProgress"]
+            else:
+                response = client.describe_db_snapshots(
+                    DBInstanceIdentifier=DBIdentifier,
+                    Filters=[
+                        {
+                            "Name": "db-snapshot-id",
+                            "Values": [
+                                event["MaskedDBSnapshotIdentifier"],
+                            ],
+                        },
+                    ],
+                )
+                snapshot_status = response["DBSnapshots"][0]["Status"]
+                percent = response["DBSnapshots"][0].get("PercentProgress")
             event["MaskedSnapshotStatus"] = snapshot_status
             if snapshot_status == "failed":
                 event["Error"] = (
@@ -38,19 +51,25 @@ def lambda_handler(event, context):
                 )
 
         elif DBType == "Aurora":
-            # Check the status of an Aurora cluster snapshot
-            response = client.describe_db_cluster_snapshots(
-                DBClusterIdentifier=DBIdentifier,
-                Filters=[
-                    {
-                        "Name": "db-cluster-snapshot-id",
-                        "Values": [
-                            event["MaskedDBSnapshotIdentifier"],
-                        ],
-                    },
-                ],
-            )
-            snapshot_status = response["DBClusterSnapshots"][0]["Status"]
+            # Check the status of an Aurora cluster snapshot, preferring the
+            # status the RDS status poller published.
+            cached = rds_status.read("cluster-snapshot", event["MaskedDBSnapshotIdentifier"], since=since)
+            if cached:
+                snapshot_status, percent = cached["Status"], cached["PercentProgress"]
+            else:
+                response = client.describe_db_cluster_snapshots(
+                    DBClusterIdentifier=DBIdentifier,
+                    Filters=[
+                        {
+                            "Name": "db-cluster-snapshot-id",
+                            "Values": [
+                                event["MaskedDBSnapshotIdentifier"],
+                            ],
+                        },
+                    ],
+                )
+                snapshot_status = response["DBClusterSnapshots"][0]["Status"]
+                percent = response["DBClusterSnapshots"][0].get("PercentProgress")
             event["MaskedSnapshotStatus"] = snapshot_status
             if snapshot_status == "failed":
                 event["Error"] = (
@@ -60,11 +79,28 @@ def lambda_handler(event, context):
         else:
             raise ValueError(f"Invalid DBType: {DBType}. Expected 'RDS' or 'Aurora'.")
 
+        if _is_done(event):
+            rds_status.unwatch(resource_type, event["MaskedDBSnapshotIdentifier"])
+        polling.schedule(event, "masked_snapshot", snapshot_status, percent)
         print(json.dumps(event))
         return event
 
     except Exception as e:
+        # Throttling that outlasted the retries is not a failure of the
+        # workflow; the state machine retries the task.
+        rds.raise_if_throttled(e)
         event["MaskedSnapshotStatus"] = "failed"
         event["Error"] = f"Error checking snapshot status of masked DB: {e}"
         print(f"Error checking snapshot of masked DB: {e}")
         return event
+
+
+def _is_done(event):
+    return event.get("MaskedSnapshotStatus") in ("available", "failed")
+
+
+@rds.handler
+def lambda_handler(event, context):
+    if polling.internal_mode(event):
+        return polling.poll_internally(event, context, check_snapshot_status, _is_done)
+    return check_snapshot_status(event)
@@ -1,31 +1,27 @@
 import json
 import logging
 import os
+import time
 
-import boto3
-
-import requests
+from blueprint_common import polling, run_log, run_options, snapstart
+from blueprint_common.datamasque import get_client, verify_tls_from_env
+from blueprint_common.datamasque import parse_verify_tls  # noqa: F401  (re-exported)
+from blueprint_common.secrets_cache import get_secrets_cache
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-base_url = os.environ[
-    "DATAMASQUE_BASE_URL"
-]  # change base url to the url of the DataMasque instance
-
-datamasque_secret_arn = os.environ["DATAMASQUE_SECRET_ARN"]
+# DATAMASQUE_BASE_URL / DATAMASQUE_SECRET_ARN / DATAMASQUE_VERIFY_TLS are read
+# in the handler rather than at import.
 
-def parse_verify_tls(value: str | None) -> bool:
-    """Parse the DATAMASQUE_VERIFY_TLS env value into a bool (default secure).
+# Builds the Secrets Manager client and DataMasque connection pools during a
+# SnapStart init; no-op otherwise.
+snapstart.init({"secretsmanager": ["GetSecretValue"]}, datamasque_pool=True)
 
-    TLS verification defaults to ON. Only the explicit strings false/0/no
-    (case-insensitive) disable it, for documented self-signed / private-CA
-    DataMasque instances on a trusted path.
-    """
-    return str(value).strip().lower() not in ("false", "0", "no")
 
-
-VERIFY_TLS = parse_verify_tls(os.environ.get("DATAMASQUE_VERIFY_TLS", "true"))
+def _api(base_url):
+    """Pooled DataMasque client for ``base_url`` (reused across warm invocations)."""
+    return get_client(base_url, verify=verify_tls_from_env())
 
 
 def _redacted_event(event: dict) -> dict:
@@ -64,15 +60,10 @@ def login(base_url, username, password):
          'date_time_created': '2022-02-13T21:36:23.468892Z',
          'date_time_expires': '2022-02-14T07:22:11.917111Z'}
 
+    The token is cached per container by the shared client and reused until
+    shortly before date_time_expires, so warm invocations skip this round trip.
     """
-    api = "api/auth/token/login/"
-    data = {"username": username, "password": password}
-    headers = {"Content-Type": "application/json"}
-    response = requests.post(base_url + api, json=data, headers=headers, verify=VERIFY_TLS)
-
-    # Do not log the response body: it contains the auth token.
-    logger.info("Login response status: %s", response.status_code)
-    return response.json()
+    return _api(base_url).login(username, password)
 
 
 def runs(base_url, token, run_id):
@@ -111,7 +102,7 @@ def runs(base_url, token, run_id):
 
     api = "api/runs/{}/".format(run_id)
 
-    response = requests.get(base_url + api, headers=token, verify=VERIFY_TLS)
+    response = _api(base_url).get(api, headers=token, name="runs")
     # run objects may carry the run_secret in options; log status only.
     logger.info("Get run status: %s", response.status_code)
     return response.json()
@@ -151,19 +142,55 @@ def delete_connection(base_url, token, conn_id):
 
     api = f"/api/connections/{conn_id}/"
     logger.info("Deleting temporary connection - %s", conn_id)
-    response = requests.delete(base_url + api, headers=token, verify=VERIFY_TLS)
+    response = _api(base_url).delete(api, headers=token, name="delete_connection")
     logger.info("Delete connection status: %s", response.status_code)
 
 
-def lambda_handler(event, context):
+def report_progress(base_url, token, event, now=None):
+    """
+    Read the run log written since the last poll and update the progress fields.
+
+    ``MaskRunLogOffset`` is the byte cursor into the run log and
+    ``MaskRunProgress`` the progress derived from it (rows masked, rows/sec,
+    tables done and in progress, seconds since any row count moved). A log
+    that cannot be read only costs this poll its progress update.
+    """
+    offset = int(event.get("MaskRunLogOffset") or 0)
+    try:
+        lines, offset = run_log.fetch_new_lines(_api(base_url), event["MaskRunId"], offset, token)
+    except Exception as e:
+        logger.warning("Could not read the run log: %s", e)
+        return
+    event["MaskRunLogOffset"] = offset
+    event["MaskRunProgress"] = run_log.update_progress(
+        event.get("MaskRunProgress"), lines, time.time() if now is None else now
+    )
+    progress = event["MaskRunProgress"]
+    logger.info(
+        "Masking progress: %s",
+        json.dumps({k: progress[k] for k in progress if k != "tables"}),
+    )
+
+
+def _log_api_metrics(base_url):
+    """Log and reset the per-call DataMasque latency counters for this invocation."""
+    dm = _api(base_url)
+    if dm.metrics:
+        logger.info("DataMasque API latency: %s", json.dumps(dm.metrics))
+    dm.reset_metrics()
+
+
+def check_run_status(event):
+    """One poll of the masking run status."""
 
     logger.info("Event: %s", json.dumps(_redacted_event(event)))
 
-    client = boto3.client("secretsmanager")
+    base_url = os.environ["DATAMASQUE_BASE_URL"]  # url of the DataMasque instance
+    datamasque_secret_arn = os.environ["DATAMASQUE_SECRET_ARN"]
 
     try:
 
-        response = client.get_secret_value(
+        response = get_secrets_cache().get_secret_value(
             SecretId=datamasque_secret_arn,
         )
 
@@ -179,9 +206,15 @@ def lambda_handler(event, context):
         token = {"Authorization": "Token " + user_login_res["key"]}
         run_response = runs(base_url, token, run_id)
         event["MaskRunStatus"] = run_response["status"]
+        if run_response["status"] != "queued":
+            report_progress(base_url, token, event)
+        polling.schedule(event, "masking_run", run_response["status"])
         if "fail" in run_response["status"]:
             event["Error"] = f"MaskRunId {event['MaskRunId']} has failed"
-        if event["MaskRunStatus"] == "finished":
+        if event["MaskRunStatus"].startswith("finish"):
+            run_options.record_result(event, run_response)
+        # In upsert mode the temporary connection is kept for the next execution.
+        if event["MaskRunStatus"] == "finished" and event.get("ConnectionMode") != "upsert":
             conn_id = run_response["connection"]
             delete_connection(base_url, token, conn_id)
         logger.info("Result event: %s", json.dumps(_redacted_event(event)))
@@ -193,3 +226,17 @@ def lambda_handler(event, context):
         event["Error"] = f"DataMasque run failed status: {e}"
         logger.info("Result event: %s", json.dumps(_redacted_event(event)))
         return event
+
+    finally:
+        _log_api_metrics(base_url)
+
+
+def _is_done(event):
+    status = event.get("MaskRunStatus", "")
+    return status.startswith("finish") or "fail" in status
+
+
+def lambda_handler(event, context):
+    if polling.internal_mode(event):
+        return polling.poll_internally(event, context, check_run_status, _is_done)
+    return check_run_status(event)
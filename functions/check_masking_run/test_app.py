@@ -1,5 +1,5 @@
 """
-Unit tests for the TLS-verification flag parsing in app.py.
+Unit tests for app.py.
 
 Run from this directory:
     pytest test_app.py -v
@@ -16,6 +16,7 @@ os.environ.setdefault(
 )
 os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
 
+import app
 from app import parse_verify_tls
 
 
@@ -27,3 +28,69 @@ def test_parse_verify_tls_disables_only_on_explicit_falsey(value):
 @pytest.mark.parametrize("value", ["true", "True", "1", "yes", "", "anything", None])
 def test_parse_verify_tls_defaults_secure(value):
     assert parse_verify_tls(value) is True
+
+
+class _FakeSecrets:
+    def get_secret_value(self, SecretId):
+        return {"SecretString": '{"username": "u", "password": "p"}'}
+
+
+@pytest.mark.parametrize("mode, deleted", [(None, True), ("recreate", True), ("upsert", False)])
+def test_finished_run_keeps_connection_only_in_upsert_mode(monkeypatch, mode, deleted):
+    calls = []
+    monkeypatch.setattr(app, "get_secrets_cache", lambda: _FakeSecrets())
+    monkeypatch.setattr(app, "login", lambda base_url, username, password: {"key": "tok"})
+    monkeypatch.setattr(
+        app, "runs", lambda base_url, token, run_id: {"status": "finished", "connection": "conn-1"}
+    )
+    monkeypatch.setattr(app, "delete_connection", lambda base_url, token, conn_id: calls.append(conn_id))
+    monkeypatch.setattr(app, "report_progress", lambda base_url, token, event, now=None: None)
+    event = {"MaskRunId": "run-1", "StageDB": "db-datamasque", "DBSecretIdentifier": "s"}
+    if mode:
+        event["ConnectionMode"] = mode
+
+    result = app.lambda_handler(event, None)
+
+    assert result["MaskRunStatus"] == "finished"
+    assert calls == (["conn-1"] if deleted else [])
+
+
+def test_report_progress_advances_cursor_across_polls(monkeypatch):
+    log = (
+        b'{"message": "Masking table customers", "table": "customers", "rows": 0}\n'
+        b"Masked 1,000 rows in table orders\n"
+    )
+    fetched = []
+
+    def fake_fetch(client, run_id, offset, headers, **kwargs):
+        fetched.append(offset)
+        end = log.rfind(b"\n") + 1
+        return log[offset:end].decode().splitlines(), end
+
+    monkeypatch.setattr(app.run_log, "fetch_new_lines", fake_fetch)
+    event = {"MaskRunId": "run-1"}
+
+    app.report_progress("http://dm/", {}, event, now=1000.0)
+    first_offset = event["MaskRunLogOffset"]
+    log += b"Masked 3,000 rows in table orders\nTable orders completed\n"
+    app.report_progress("http://dm/", {}, event, now=1010.0)
+
+    assert fetched == [0, first_offset]
+    assert event["MaskRunLogOffset"] == len(log)
+    progress = event["MaskRunProgress"]
+    assert progress["rows_masked"] == 3000
+    assert progress["rows_per_sec"] == 200.0
+    assert progress["tables_completed"] == 1
+    assert progress["tables_in_progress"] == ["customers"]
+
+
+def test_report_progress_tolerates_unreadable_log(monkeypatch):
+    def failing_fetch(*args, **kwargs):
+        raise RuntimeError("Reading run log failed with status 404")
+
+    monkeypatch.setattr(app.run_log, "fetch_new_lines", failing_fetch)
+    event = {"MaskRunId": "run-1", "MaskRunLogOffset": 42}
+
+    app.report_progress("http://dm/", {}, event)
+
+    assert event == {"MaskRunId": "run-1", "MaskRunLogOffset": 42}
@@ -1,13 +1,17 @@
 import secrets
 from datetime import datetime
 
-import boto3
+from blueprint_common import polling, rds, rds_status, snapstart
 
+# Builds and loads the RDS client during a SnapStart init; no-op otherwise.
+snapstart.init({"rds": ["CreateDBSnapshot", "CreateDBClusterSnapshot"]})
 
+
+@rds.handler
 def lambda_handler(event, context):
     DBId = event["StageDB"]
     DBType = event["DBType"]  # Either "RDS" or "Aurora"
-    client = boto3.client("rds")
+    client = rds.client()
 
     try:
         print("Checking masked DB snapshot")
@@ -53,10 +57,17 @@ def lambda_handler(event, context):
             event["MaskedSnapshotStatus"] = "failed"
         else:
             event["MaskedSnapshotStatus"] = event["MaskedDBSnapshotIdentifierStatus"]
+            rds_status.watch(
+                "snapshot" if DBType == "RDS" else "cluster-snapshot", event["MaskedDBSnapshotIdentifier"]
+            )
+            polling.schedule(event, "masked_snapshot", event["MaskedSnapshotStatus"])
 
         return event
 
     except Exception as e:
+        # Throttling that outlasted the retries is not a failure of the
+        # workflow; the state machine retries the task.
+        rds.raise_if_throttled(e)
         event["MaskedSnapshotStatus"] = "failed"
         event["Error"] = f"Error creating snapshot: {e}"
         print(f"Error creating snapshot: {e}")
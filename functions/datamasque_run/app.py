@@ -1,33 +1,36 @@
+import hashlib
+import hmac
 import json
 import logging
 import os
 import secrets
+from concurrent import futures
 from typing import Dict, Optional
 
-import boto3
-
-import requests
+from blueprint_common import callbacks, polling, run_options, snapstart
+from blueprint_common.datamasque import get_client, verify_tls_from_env
+from blueprint_common.datamasque import parse_verify_tls  # noqa: F401  (re-exported)
+from blueprint_common.db_secret import CONNECTION_MODES, REQUIRED_KEYS, SUPPORTED_ENGINES, staging_host
+from blueprint_common.secrets_cache import get_secrets_cache
+from blueprint_common.steps import StepTimer
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-base_url = os.environ[
-    "DATAMASQUE_BASE_URL"
-]  # change base url to the url of the DataMasque instance
-
-datamasque_secret_arn = os.environ["DATAMASQUE_SECRET_ARN"]
+# DATAMASQUE_BASE_URL / DATAMASQUE_SECRET_ARN / DATAMASQUE_VERIFY_TLS are read
+# in the handler rather than at import.
 
-def parse_verify_tls(value: str | None) -> bool:
-    """Parse the DATAMASQUE_VERIFY_TLS env value into a bool (default secure).
+# State-store kind under which callback-mode runs wait for the watcher.
+MASKING_RUN_KIND = "masking_run"
 
-    TLS verification defaults to ON. Only the explicit strings false/0/no
-    (case-insensitive) disable it, for documented self-signed / private-CA
-    DataMasque instances on a trusted path.
-    """
-    return str(value).strip().lower() not in ("false", "0", "no")
+# Builds the Secrets Manager client and DataMasque connection pools during a
+# SnapStart init; no-op otherwise.
+snapstart.init({"secretsmanager": ["GetSecretValue"]}, datamasque_pool=True)
 
 
-VERIFY_TLS = parse_verify_tls(os.environ.get("DATAMASQUE_VERIFY_TLS", "true"))
+def _api(base_url):
+    """Pooled DataMasque client for ``base_url`` (reused across warm invocations)."""
+    return get_client(base_url, verify=verify_tls_from_env())
 
 
 def login(base_url, username, password):
@@ -53,15 +56,10 @@ def login(base_url, username, password):
          'date_time_created': '2022-02-13T21:36:23.468892Z',
          'date_time_expires': '2022-02-14T07:22:11.917111Z'}
 
+    The token is cached per container by the shared client and reused until
+    shortly before date_time_expires, so warm invocations skip this round trip.
     """
-    api = "api/auth/token/login/"
-    data = {"username": username, "password": password}
-    headers = {"Content-Type": "application/json"}
-    response = requests.post(base_url + api, json=data, headers=headers, verify=VERIFY_TLS)
-
-    # Do not log the response body: it contains the auth token.
-    logger.info("Login response status: %s", response.status_code)
-    return response.json()
+    return _api(base_url).login(username, password)
 
 
 def connections(base_url, token, connection_id=None):
@@ -99,16 +97,144 @@ def connections(base_url, token, connection_id=None):
         api = "api/connections/{}/".format(connection_id)
     else:
         api = "api/connections/"
-    response = requests.get(base_url + api, headers=token, verify=VERIFY_TLS)
+    response = _api(base_url).get(api, headers=token, name="connections")
     # Do not log the response body: connection objects include DB passwords.
     logger.info("List connections status: %s", response.status_code)
     return response.json()
 
 
-def create_connection(base_url: str, token: str, secret: dict, dm_ruleset_id: str, run_secret: str):
+# (base_url, connection name) -> connection id, kept across warm invocations.
+_connection_ids = {}
+
+# (base_url, connection id) -> HMAC of the DB password this container last
+# wrote to that connection. DataMasque does not return passwords reliably, so
+# upsert mode only reuses a connection whose password it knows is current.
+_written_passwords = {}
+_PASSWORD_KEY = secrets.token_bytes(32)
+
+# Page size asked of servers that paginate api/connections/.
+CONNECTION_PAGE_SIZE = 100
+
+# Connection parameters compared in upsert mode (the password is compared separately).
+FINGERPRINT_FIELDS = (
+    "host",
+    "port",
+    "database",
+    "schema",
+    "db_type",
+    "service_name",
+    "connection_fileset",
+    "user",
+    "mask_type",
+)
+
+
+def connection_mode(event: dict) -> str:
+    """The ``ConnectionMode`` execution input: ``recreate`` (default) or ``upsert``."""
+    mode = event.get("ConnectionMode") or "recreate"
+    if mode not in CONNECTION_MODES:
+        raise ValueError(f"ConnectionMode must be one of {list(CONNECTION_MODES)}, got {mode!r}")
+    return mode
+
+
+def connection_fingerprint(conn: dict) -> tuple:
+    """Comparable view of a connection's non-secret parameters."""
+    return tuple("" if conn.get(field) in (None, "") else str(conn[field]) for field in FINGERPRINT_FIELDS)
+
+
+def _password_digest(password: str) -> bytes:
+    return hmac.new(_PASSWORD_KEY, password.encode(), hashlib.sha256).digest()
+
+
+def connection_unchanged(base_url: str, existing: dict, conn_dict: dict) -> bool:
+    """True if ``existing`` already has every parameter ``conn_dict`` would write."""
+    written = _written_passwords.get((base_url, existing.get("id")))
+    return (
+        written is not None
+        and hmac.compare_digest(written, _password_digest(conn_dict["dbpassword"]))
+        and connection_fingerprint(existing) == connection_fingerprint(conn_dict)
+    )
+
+
+def remember_connection(base_url: str, name: str, connection_id: str, conn_dict: dict | None = None) -> None:
+    _connection_ids[(base_url, name)] = connection_id
+    if conn_dict is not None:
+        _written_passwords[(base_url, connection_id)] = _password_digest(conn_dict["dbpassword"])
+
+
+def forget_connection(base_url: str, name: str) -> None:
+    connection_id = _connection_ids.pop((base_url, name), None)
+    _written_passwords.pop((base_url, connection_id), None)
+
+
+def lookup_connection(base_url: str, token: dict, name: str) -> Optional[dict]:
+    """
+    Return the DataMasque connection called ``name``, or None.
+
+    A connection this container created or found before is confirmed with a
+    single ``GET api/connections/<id>/``. Otherwise the list is requested with
+    a ``name`` filter and a page size (ignored by servers that do not support
+    them) and streamed: items are decoded as they arrive, pages are followed
+    only until the first match, and the rest of the body is never read. Only
+    the id is cached; connection objects include DB passwords.
+    """
+    dm = _api(base_url)
+    cached_id = _connection_ids.get((base_url, name))
+    if cached_id:
+        response = dm.get(f"api/connections/{cached_id}/", headers=token, name="get_connection")
+        if response.status_code == 200:
+            conn = response.json()
+            if isinstance(conn, dict) and conn.get("name") == name:
+                logger.info("Temporary DataMasque connection resolved from cache.")
+                return conn
+        forget_connection(base_url, name)
+
+    items = dm.iter_list(
+        "api/connections/",
+        headers=token,
+        name="connections",
+        params={"name": name, "limit": CONNECTION_PAGE_SIZE},
+    )
+    try:
+        for conn in items:
+            if conn.get("name") == name:
+                logger.info("Existing temporary DataMasque connection found.")
+                remember_connection(base_url, name, conn["id"])
+                return conn
+    finally:
+        items.close()
+    return None
+
+
+def find_connection(base_url: str, token: dict, name: str) -> Optional[str]:
+    """The id of the DataMasque connection called ``name``, or None (see ``lookup_connection``)."""
+    conn = lookup_connection(base_url, token, name)
+    return conn["id"] if conn else None
+
+
+def create_connection(
+    base_url: str,
+    token: str,
+    secret: dict,
+    dm_ruleset_id: str,
+    run_secret: str,
+    mode: str = "recreate",
+    timer: StepTimer | None = None,
+    options: dict | None = None,
+):
     """
     Creates a database connection.
 
+    In ``upsert`` mode an existing temporary connection whose parameters
+    already match is reused without a connection test, and one that differs
+    is updated in place with ``PUT``; it is only deleted and recreated if the
+    server does not support updating it. ``recreate`` mode always deletes
+    any existing temporary connection and creates a new one; its lookup runs
+    concurrently with the connection test.
+
+    Each API call is recorded as a step on ``timer`` when one is given.
+    ``options`` are the run options (``run_options.DEFAULT_OPTIONS`` if None).
+
 
     full_url = 'https://masque.local/api/connections/'
     method = 'POST'
@@ -147,17 +273,9 @@ def create_connection(base_url: str, token: str, secret: dict, dm_ruleset_id: st
                 'oracle_wallet': None}
                ]
     """
-    keys_to_check = {
-        "username",
-        "password",
-        "engine",
-        "host",
-        "port",
-        "dbname",
-        "schema",
-    }
+    keys_to_check = set(REQUIRED_KEYS)
     if keys_to_check.issubset(secret):
-        valid_engine_type = ["postgres", "mysql", "oracle", "mariadb", "mssql"]
+        valid_engine_type = SUPPORTED_ENGINES
         if secret["engine"] not in valid_engine_type:
             logger.error(
                 "Invalid value for engine parameter in secret, valid values are: %s",
@@ -169,9 +287,7 @@ def create_connection(base_url: str, token: str, secret: dict, dm_ruleset_id: st
             }
         logger.info("All required parameters exist in the secret.")
         api = "api/connections/"
-        staging_db_id = secret["host"].split(".")
-        staging_db_id[0] = f"{staging_db_id[0]}-datamasque"
-        staging_db_endpoint = ".".join(staging_db_id)
+        staging_db_endpoint = staging_host(secret["host"])
         conn_dict = {
             "version": "1.0",
             "name": f"database_{secret['dbname']}_datamasque_temp",
@@ -193,52 +309,74 @@ def create_connection(base_url: str, token: str, secret: dict, dm_ruleset_id: st
             "mariadb",
         ]:
             conn_dict["connection_fileset"] = secret["connection_fileset"]
-        # test connection before creating it.
+        timer = timer or StepTimer()
+        existing = lookup = None
+        if mode == "upsert":
+            # The lookup decides whether the test can be skipped, so it runs first.
+            with timer.step("connection_lookup"):
+                existing = lookup_connection(base_url, token, conn_dict["name"])
+            if existing and connection_unchanged(base_url, existing, conn_dict):
+                logger.info("Reusing unchanged temporary DataMasque connection.")
+                with timer.step("create_run"):
+                    return create_run(base_url, token, existing["id"], dm_ruleset_id, run_secret, options)
+        else:
+            # Independent of the test result, so overlap it with the test.
+            lookup = timer.submit("connection_lookup", find_connection, base_url, token, conn_dict["name"])
 
-        test_response = requests.post(
-            base_url + api + "test/", json=conn_dict, headers=token, verify=VERIFY_TLS
-        )
+        # test connection before creating it.
+        dm = _api(base_url)
+        with timer.step("connection_test"):
+            test_response = dm.post(
+                api + "test/", json=conn_dict, headers=token, name="test_connection", retry=True
+            )
         logger.info("Connection test status: %s", test_response.status_code)
+        if lookup is not None:
+            futures.wait([lookup])
         if test_response.status_code in [200, 201]:
-            logger.info("DB connection test successful, creating DataMasque connection.")
-            get_conn_response = requests.get(
-                base_url + api,
-                json={
-                    "version": "1.0",
-                    "name": f"database_{secret['dbname']}_datamasque_temp",
-                },
-                headers=token,
-                verify=VERIFY_TLS,
-            )
-            found = False
-            for conn in get_conn_response.json():
-                if conn.get("name") == f"database_{secret['dbname']}_datamasque_temp":
-                    found = True
-                    # Do not log the connection object: it includes the DB password.
-                    logger.info("Existing temporary DataMasque connection found.")
-                    break
-            if found:
-                logger.info("Deleting existing temporary connection: %s", conn["name"])
-                delete_response = requests.delete(
-                    base_url + api + f"{conn['id']}/",
-                    headers=token,
-                    verify=VERIFY_TLS,
-                )
-                logger.info("Delete connection status: %s", delete_response.status_code)
-            conn_response = requests.post(
-                base_url + api, json=conn_dict, headers=token, verify=VERIFY_TLS
-            )
-
-            logger.info("Create connection status: %s", conn_response.status_code)
-            if conn_response.status_code == 201:
-
-                create_run_response = create_run(
-                    base_url, token, conn_response.json()["id"], dm_ruleset_id, run_secret
-                )
+            conn_response = None
+            if existing:
+                logger.info("Updating temporary DataMasque connection in place.")
+                with timer.step("update_connection"):
+                    conn_response = dm.put(
+                        api + f"{existing['id']}/", json=conn_dict, headers=token, name="update_connection"
+                    )
+                logger.info("Update connection status: %s", conn_response.status_code)
+                if conn_response.status_code in (404, 405):
+                    if conn_response.status_code == 405:
+                        dm.delete(api + f"{existing['id']}/", headers=token, name="delete_connection")
+                    forget_connection(base_url, conn_dict["name"])
+                    conn_response = None
+            elif lookup is not None:
+                conn_id = lookup.result()
+                if conn_id:
+                    logger.info("Deleting existing temporary connection: %s", conn_dict["name"])
+                    with timer.step("delete_connection"):
+                        delete_response = dm.delete(
+                            api + f"{conn_id}/",
+                            headers=token,
+                            name="delete_connection",
+                        )
+                    logger.info("Delete connection status: %s", delete_response.status_code)
+                    forget_connection(base_url, conn_dict["name"])
+            if conn_response is None:
+                logger.info("DB connection test successful, creating DataMasque connection.")
+                with timer.step("create_connection"):
+                    conn_response = dm.post(
+                        api, json=conn_dict, headers=token, name="create_connection"
+                    )
+                logger.info("Create connection status: %s", conn_response.status_code)
+
+            if conn_response.status_code in (200, 201):
+                conn_id = conn_response.json()["id"]
+                remember_connection(base_url, conn_dict["name"], conn_id, conn_dict)
+                with timer.step("create_run"):
+                    create_run_response = create_run(
+                        base_url, token, conn_id, dm_ruleset_id, run_secret, options
+                    )
                 return create_run_response
             else:
                 logger.error(
-                    "Unexpected status code creating connection: %s",
+                    "Unexpected status code saving connection: %s",
                     conn_response.status_code,
                 )
                 return {
@@ -280,12 +418,13 @@ def get_secret(secret_name: str) -> Optional[Dict]:
         Optional[, Dict]:
             - If the secret is a JSON string, returns the secret as a dictionary.
             - Returns None if there's an error or the secret cannot be retrieved.
-    """
 
-    client = boto3.client("secretsmanager")
+    Lookups go through the per-container secrets cache.
+    """
+    from botocore.exceptions import ClientError
 
     try:
-        response = client.get_secret_value(SecretId=secret_name)
+        response = get_secrets_cache().get_secret_value(SecretId=secret_name)
 
         if "SecretString" in response:
             secret = response["SecretString"]
@@ -293,12 +432,16 @@ def get_secret(secret_name: str) -> Optional[Dict]:
         else:
             return None
 
-    except client.exceptions.ResourceNotFoundException:
-        logger.error("Error: The requested secret '%s' was not found", secret_name)
-    except client.exceptions.InvalidRequestException as e:
-        logger.error("Error: The request was invalid due to: %s", e)
-    except client.exceptions.InvalidParameterException as e:
-        logger.error("Error: The request had invalid params: %s", e)
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code")
+        if code == "ResourceNotFoundException":
+            logger.error("Error: The requested secret '%s' was not found", secret_name)
+        elif code == "InvalidRequestException":
+            logger.error("Error: The request was invalid due to: %s", e)
+        elif code == "InvalidParameterException":
+            logger.error("Error: The request had invalid params: %s", e)
+        else:
+            logger.error("An unexpected error occurred: %s", e)
     except Exception as e:
         logger.error("An unexpected error occurred: %s", e)
 
@@ -336,14 +479,14 @@ def rulesets(base_url, token, ruleset_id=None):
         api = "api/rulesets/{}/".format(ruleset_id)
     else:
         api = "api/rulesets/"
-    response = requests.get(base_url + api, headers=token, verify=VERIFY_TLS)
+    response = _api(base_url).get(api, headers=token, name="rulesets")
     logger.info("List rulesets status: %s", response.status_code)
     return response.json()
 
 
-def create_run(base_url, token, conn_id, dm_ruleset_id, run_secret):
+def create_run(base_url, token, conn_id, dm_ruleset_id, run_secret, options=None):
     """
-    Create a run
+    Create a run with ``options`` (``run_options.DEFAULT_OPTIONS`` if None)
 
     full_url = 'https://masque.local/api/runs/'
     method = 'POST'
@@ -381,16 +524,11 @@ def create_run(base_url, token, conn_id, dm_ruleset_id, run_secret):
         "name": "datamasque_blueprint",
         "connection": conn_id,
         "ruleset": dm_ruleset_id,
-        "options": {
-            "dry_run": False,
-            "buffer_size": 10000,
-            "continue_on_failure": False,
-            "run_secret": run_secret,
-        },
+        "options": {**(options or run_options.DEFAULT_OPTIONS), "run_secret": run_secret},
     }
     api = "api/runs/"
     # run_dict carries the run_secret; never log the request body.
-    response = requests.post(base_url + api, json=run_dict, headers=token, verify=VERIFY_TLS)
+    response = _api(base_url).post(api, json=run_dict, headers=token, name="create_run")
     logger.info("Create run status: %s", response.status_code)
     return response.json()
 
@@ -409,6 +547,9 @@ def resolve_run_secret(event, secrets_client):
                                    SecretBinary is not supported.
       - Neither present         -> generate a fresh URL-safe 32-byte token (Random mode).
     If both are present, "RunSecret" wins (matches admin-server precedence).
+
+    ``secrets_client`` is anything with a boto3-style ``get_secret_value``;
+    the handler passes the shared SecretsCache.
     """
     if "RunSecret" in event:
         rs = event["RunSecret"]
@@ -437,32 +578,57 @@ def _redacted_event(event):
     return redacted
 
 
-def lambda_handler(event, context):
+def _log_api_metrics(base_url):
+    """Log and reset the per-call DataMasque latency counters for this invocation."""
+    dm = _api(base_url)
+    if dm.metrics:
+        logger.info("DataMasque API latency: %s", json.dumps(dm.metrics))
+    dm.reset_metrics()
 
-    logger.info("Event: %s", json.dumps(_redacted_event(event)))
 
-    client = boto3.client("secretsmanager")
+def _login_with_secret(base_url, secret_arn, secrets_cache):
+    """Log in to DataMasque with the credentials stored in ``secret_arn``."""
+    datamasque_credential = secrets_cache.get_secret_json(secret_arn)
+    return login(base_url, datamasque_credential["username"], datamasque_credential["password"])
 
-    try:
 
-        response = client.get_secret_value(
-            SecretId=datamasque_secret_arn,
-        )
+def start_run(event):
+    """Start the masking run described by the execution state ``event``."""
 
-        datamasque_credential = json.loads(response["SecretString"])
+    logger.info("Event: %s", json.dumps(_redacted_event(event)))
 
-        user_username = datamasque_credential["username"]
-        user_password = datamasque_credential["password"]
+    base_url = os.environ["DATAMASQUE_BASE_URL"]  # url of the DataMasque instance
+    datamasque_secret_arn = os.environ["DATAMASQUE_SECRET_ARN"]
+
+    secrets_cache = get_secrets_cache()
+    timer = StepTimer()
+
+    try:
         dm_ruleset_id = event["DataMasqueRulesetId"]
         DBSecretIdentifier = event["DBSecretIdentifier"]
-        run_secret = resolve_run_secret(event, client)
-        secret_response = get_secret(DBSecretIdentifier)
+        mode = connection_mode(event)
+        options = run_options.resolve(event)
+        # Progress read from a previous (benchmark) run's log.
+        event.pop("MaskRunLogOffset", None)
+        event.pop("MaskRunProgress", None)
+
+        # The credential lookup + login, the DB secret and the run secret are
+        # independent; fetch them concurrently.
+        login_future = timer.submit(
+            "datamasque_login", _login_with_secret, base_url, datamasque_secret_arn, secrets_cache
+        )
+        db_secret_future = timer.submit("db_secret", get_secret, DBSecretIdentifier)
+        run_secret_future = timer.submit("run_secret", resolve_run_secret, event, secrets_cache)
+        futures.wait([login_future, db_secret_future, run_secret_future])
+
+        run_secret = run_secret_future.result()
+        secret_response = db_secret_future.result()
         if secret_response:
-            user_login_res = login(base_url, user_username, user_password)
+            user_login_res = login_future.result()
 
             token = {"Authorization": "Token " + user_login_res["key"]}
             create_connection_response = create_connection(
-                base_url, token, secret_response, dm_ruleset_id, run_secret
+                base_url, token, secret_response, dm_ruleset_id, run_secret, mode, timer, options
             )
             if create_connection_response["status"] == "failure":
                 event["MaskRunStatus"] = create_connection_response["status"]
@@ -471,6 +637,7 @@ def lambda_handler(event, context):
             else:
                 event["MaskRunStatus"] = create_connection_response["status"]
                 event["MaskRunId"] = create_connection_response["id"]
+                polling.schedule(event, "masking_run", event["MaskRunStatus"])
         logger.info("Result event: %s", json.dumps(_redacted_event(event)))
         return event
 
@@ -480,3 +647,41 @@ def lambda_handler(event, context):
         event["Error"] = f"Error executing datamasque run: {e}"
         logger.info("Result event: %s", json.dumps(_redacted_event(event)))
         return event
+
+    finally:
+        event["StepTimings"] = timer.as_dict()
+        logger.info("Step timings (ms): %s", json.dumps(event["StepTimings"]))
+        _log_api_metrics(base_url)
+
+
+def start_run_with_callback(event, task_token):
+    """
+    ``.waitForTaskToken`` variant: start the run and park the task token.
+
+    The masking run watcher resumes the execution with ``SendTaskSuccess``
+    when the run finishes. If the run could not be started the execution is
+    resumed straight away with the failure.
+    """
+    event = start_run(event)
+    try:
+        if event.get("MaskRunId") and not event.get("MaskRunStatus", "").startswith(("fail", "finish")):
+            callbacks.register(MASKING_RUN_KIND, str(event["MaskRunId"]), task_token, event)
+        else:
+            callbacks.succeed(task_token, event)
+    except Exception as e:
+        logger.error("Could not register the masking run callback: %s", e)
+        callbacks.fail(task_token, "CallbackRegistrationFailed", str(e))
+    return event
+
+
+def lambda_handler(event, context):
+    if "TaskToken" in event:
+        state = event["Input"]
+        # A state resumed by the watcher was parked without RunSecret
+        # (callbacks.UNSTORED_FIELDS); a later benchmark run takes it from the
+        # execution input again rather than falling back to a random secret.
+        execution_input = event.get("ExecutionInput") or {}
+        if "RunSecret" not in state and "RunSecret" in execution_input:
+            state["RunSecret"] = execution_input["RunSecret"]
+        return start_run_with_callback(state, event["TaskToken"])
+    return start_run(event)
@@ -8,3 +8,8 @@ _here = os.path.dirname(__file__)
 if _here not in sys.path:
     sys.path.insert(0, _here)
 sys.modules.pop("app", None)
+
+# The shared CommonLayer is mounted on /opt/python in Lambda; mirror that here.
+_layer = os.path.join(_here, "..", "..", "layers", "common")
+if _layer not in sys.path:
+    sys.path.append(_layer)
@@ -4,10 +4,13 @@ Unit tests for resolve_run_secret in app.py.
 Run from this directory:
     pytest test_app.py -v
 """
+import json
 import os
+import time
 from unittest.mock import MagicMock
 
 import pytest
+from blueprint_common.datamasque import DataMasqueClient
 from botocore.exceptions import ClientError
 
 # app.py reads these at import time; stub them before importing.
@@ -171,15 +174,16 @@ def test_create_connection_derives_staging_endpoint(monkeypatch):
     """First host label gets the -datamasque suffix; the rest is preserved."""
     captured = {}
 
-    def fake_post(url, json=None, headers=None, verify=None):
+    def fake_post(self, api, json=None, headers=None, **kwargs):
         # The connection-test call is the first POST and carries conn_dict.
-        if url.endswith("/test/"):
+        if api.endswith("/test/"):
             captured["conn_dict"] = json
-            captured["verify"] = verify
+            captured["verify"] = self.verify
             return _FakeResponse(400)  # short-circuit after capturing
         return _FakeResponse(400)
 
-    monkeypatch.setattr(app.requests, "post", fake_post)
+    monkeypatch.setattr(DataMasqueClient, "post", fake_post)
+    monkeypatch.setattr(app, "find_connection", lambda base_url, token, name: None)
 
     result = create_connection(
         "http://dm/", {"Authorization": "Token x"}, _valid_secret(), "ruleset-id", "rs"
@@ -189,7 +193,296 @@ def test_create_connection_derives_staging_endpoint(monkeypatch):
     assert conn["host"] == "mydb-datamasque.cluster-abc.ap-southeast-2.rds.amazonaws.com"
     assert conn["port"] == 5432  # cast to int
     assert conn["db_type"] == "postgres"
-    # TLS verification flag is threaded through to requests.
-    assert captured["verify"] is app.VERIFY_TLS
+    # TLS verification flag is threaded through to the pooled client.
+    assert captured["verify"] is app.verify_tls_from_env()
     # Connection test failed (400) -> failure result, no connection created.
     assert result["status"] == "failure"
+
+
+# --- temporary connection lookup -------------------------------------------
+
+
+def test_find_connection_scans_once_then_uses_cached_id(monkeypatch):
+    calls = []
+
+    def fake_iter_list(self, api, headers=None, name=None, params=None):
+        calls.append(("list", params))
+        yield {"id": "other", "name": "database_other_datamasque_temp"}
+        yield {"id": "conn-1", "name": "database_appdb_datamasque_temp"}
+        raise AssertionError("read past the first match")
+
+    def fake_get(self, api, headers=None, **kwargs):
+        calls.append(("get", api))
+        return _FakeResponse(200, {"id": "conn-1", "name": "database_appdb_datamasque_temp"})
+
+    monkeypatch.setattr(DataMasqueClient, "iter_list", fake_iter_list)
+    monkeypatch.setattr(DataMasqueClient, "get", fake_get)
+    monkeypatch.setattr(app, "_connection_ids", {})
+    name = "database_appdb_datamasque_temp"
+
+    assert app.find_connection("http://dm/", {}, name) == "conn-1"
+    assert app.find_connection("http://dm/", {}, name) == "conn-1"
+
+    assert calls == [
+        ("list", {"name": name, "limit": app.CONNECTION_PAGE_SIZE}),
+        ("get", "api/connections/conn-1/"),
+    ]
+
+
+def test_find_connection_rescans_when_cached_id_is_gone(monkeypatch):
+    monkeypatch.setattr(DataMasqueClient, "iter_list", lambda self, api, **kwargs: (c for c in []))
+    monkeypatch.setattr(DataMasqueClient, "get", lambda self, api, **kwargs: _FakeResponse(404))
+    monkeypatch.setattr(app, "_connection_ids", {("http://dm/", "c"): "stale"})
+
+    assert app.find_connection("http://dm/", {}, "c") is None
+    assert app._connection_ids == {}
+
+
+# --- upsert connection mode ------------------------------------------------
+
+
+@pytest.fixture
+def dm_calls(monkeypatch):
+    """Records DataMasque calls; tests set ``existing`` and ``put_status``."""
+    state = {"calls": [], "existing": None, "put_status": 200}
+
+    def fake_lookup(base_url, token, name):
+        state["calls"].append("lookup")
+        return state["existing"]
+
+    def fake_post(self, api, json=None, headers=None, **kwargs):
+        state["calls"].append(("POST", api))
+        if api.endswith("/test/"):
+            return _FakeResponse(200)
+        if api == "api/runs/":
+            return _FakeResponse(201, {"id": "run-1", "status": "queued"})
+        return _FakeResponse(201, {"id": "conn-new"})
+
+    def fake_put(self, api, json=None, headers=None, **kwargs):
+        state["calls"].append(("PUT", api))
+        return _FakeResponse(state["put_status"], {"id": "conn-1"})
+
+    def fake_delete(self, api, headers=None, **kwargs):
+        state["calls"].append(("DELETE", api))
+        return _FakeResponse(204)
+
+    monkeypatch.setattr(app, "lookup_connection", fake_lookup)
+    monkeypatch.setattr(DataMasqueClient, "post", fake_post)
+    monkeypatch.setattr(DataMasqueClient, "put", fake_put)
+    monkeypatch.setattr(DataMasqueClient, "delete", fake_delete)
+    monkeypatch.setattr(app, "_connection_ids", {})
+    monkeypatch.setattr(app, "_written_passwords", {})
+    return state
+
+
+def _server_copy(secret, conn_id="conn-1", **overrides):
+    """The connection as DataMasque would return it after we wrote ``secret``."""
+    conn = {
+        "id": conn_id,
+        "name": f"database_{secret['dbname']}_datamasque_temp",
+        "user": secret["username"],
+        "db_type": secret["engine"],
+        "database": secret["dbname"],
+        "host": "mydb-datamasque.cluster-abc.ap-southeast-2.rds.amazonaws.com",
+        "port": 5432,
+        "schema": secret["schema"],
+        "mask_type": "database",
+        "service_name": None,
+    }
+    conn.update(overrides)
+    return conn
+
+
+def test_upsert_reuses_unchanged_connection_without_testing_it(dm_calls):
+    secret = _valid_secret()
+    app.remember_connection("http://dm/", "database_appdb_datamasque_temp", "conn-1", {"dbpassword": "s3cr3t"})
+    dm_calls["existing"] = _server_copy(secret)
+
+    result = create_connection("http://dm/", {}, secret, "ruleset-id", "rs", mode="upsert")
+
+    assert result["id"] == "run-1"
+    assert dm_calls["calls"] == ["lookup", ("POST", "api/runs/")]
+
+
+@pytest.mark.parametrize(
+    "remembered_password, overrides",
+    [("s3cr3t", {"port": 3306}), ("old-password", {}), (None, {})],
+)
+def test_upsert_updates_changed_connection_in_place(dm_calls, remembered_password, overrides):
+    secret = _valid_secret()
+    if remembered_password:
+        app.remember_connection(
+            "http://dm/", "database_appdb_datamasque_temp", "conn-1", {"dbpassword": remembered_password}
+        )
+    dm_calls["existing"] = _server_copy(secret, **overrides)
+
+    result = create_connection("http://dm/", {}, secret, "ruleset-id", "rs", mode="upsert")
+
+    assert result["id"] == "run-1"
+    assert dm_calls["calls"] == [
+        "lookup",
+        ("POST", "api/connections/test/"),
+        ("PUT", "api/connections/conn-1/"),
+        ("POST", "api/runs/"),
+    ]
+    # The password now written is remembered, so the next run can reuse it.
+    assert app.connection_unchanged("http://dm/", _server_copy(secret), {**_server_copy(secret), "dbpassword": "s3cr3t"})
+
+
+def test_upsert_recreates_when_update_is_not_supported(dm_calls):
+    secret = _valid_secret()
+    dm_calls["existing"] = _server_copy(secret, port=1)
+    dm_calls["put_status"] = 405
+
+    create_connection("http://dm/", {}, secret, "ruleset-id", "rs", mode="upsert")
+
+    assert dm_calls["calls"][2:] == [
+        ("PUT", "api/connections/conn-1/"),
+        ("DELETE", "api/connections/conn-1/"),
+        ("POST", "api/connections/"),
+        ("POST", "api/runs/"),
+    ]
+
+
+def test_connection_mode_validates_input():
+    assert app.connection_mode({}) == "recreate"
+    assert app.connection_mode({"ConnectionMode": "upsert"}) == "upsert"
+    with pytest.raises(ValueError, match="ConnectionMode"):
+        app.connection_mode({"ConnectionMode": "patch"})
+
+
+# --- concurrent handler steps ----------------------------------------------
+
+
+class _FakeSecretsCache:
+    def get_secret_value(self, SecretId, **kwargs):
+        time.sleep(0.1)
+        if SecretId.startswith("datamasque/"):
+            return {"SecretString": json.dumps(_valid_secret())}
+        return {"SecretString": json.dumps({"username": "u", "password": "p"})}
+
+    def get_secret_json(self, secret_id):
+        return json.loads(self.get_secret_value(SecretId=secret_id)["SecretString"])
+
+
+def test_handler_overlaps_independent_calls_and_records_timings(monkeypatch):
+    def slow_login(base_url, username, password):
+        time.sleep(0.1)
+        return {"key": "tok"}
+
+    def slow_lookup(base_url, token, name):
+        time.sleep(0.1)
+        return None
+
+    def fake_post(self, api, json=None, headers=None, **kwargs):
+        if api.endswith("/test/"):
+            time.sleep(0.1)
+            return _FakeResponse(200)
+        if api == "api/runs/":
+            return _FakeResponse(201, {"id": "run-1", "status": "queued"})
+        return _FakeResponse(201, {"id": "conn-1"})
+
+    cache = _FakeSecretsCache()
+    monkeypatch.setattr(app, "get_secrets_cache", lambda: cache)
+    monkeypatch.setattr(app, "login", slow_login)
+    monkeypatch.setattr(app, "find_connection", slow_lookup)
+    monkeypatch.setattr(DataMasqueClient, "post", fake_post)
+    event = _base_event()
+    event["RunSecret"] = "rs"
+
+    result = app.lambda_handler(event, None)
+
+    assert result["MaskRunId"] == "run-1"
+    timings = result["StepTimings"]
+    assert {"datamasque_login", "db_secret", "run_secret", "connection_test", "connection_lookup",
+            "create_connection", "create_run", "total"} <= set(timings)
+    # Login (secret + login), DB secret, test and lookup each take >= 100ms;
+    # run sequentially they would take >= 500ms.
+    assert timings["datamasque_login"] >= 200
+    assert timings["total"] < 450
+
+
+@pytest.mark.parametrize(
+    "inputs, buffer_size",
+    [
+        ({}, 10000),
+        ({"RunOptions": {"buffer_size": 2500, "continue_on_failure": True}}, 2500),
+        ({"RunOptions": {"buffer_size": "auto"}, "parameters": {"DBInstanceClass": "db.r6g.xlarge"}}, 40000),
+        ({"BenchmarkBufferSizes": [5000, 20000]}, 5000),
+    ],
+)
+def test_handler_posts_resolved_run_options(monkeypatch, inputs, buffer_size):
+    posted = {}
+
+    def fake_post(self, api, json=None, headers=None, **kwargs):
+        if api.endswith("/test/"):
+            return _FakeResponse(200)
+        if api == "api/runs/":
+            posted.update(json)
+            return _FakeResponse(201, {"id": "run-1", "status": "queued"})
+        return _FakeResponse(201, {"id": "conn-1"})
+
+    cache = _FakeSecretsCache()
+    monkeypatch.setattr(app, "get_secrets_cache", lambda: cache)
+    monkeypatch.setattr(app, "login", lambda base_url, username, password: {"key": "tok"})
+    monkeypatch.setattr(app, "find_connection", lambda base_url, token, name: None)
+    monkeypatch.setattr(app.run_options, "history", lambda ruleset_id: {})
+    monkeypatch.setattr(DataMasqueClient, "post", fake_post)
+    event = {**_base_event(), **inputs, "RunSecret": "rs", "MaskRunProgress": {"rows_masked": 1}}
+
+    result = app.lambda_handler(event, None)
+
+    assert posted["options"]["buffer_size"] == buffer_size
+    assert posted["options"]["run_secret"] == "rs"
+    assert posted["options"]["continue_on_failure"] is inputs.get("RunOptions", {}).get("continue_on_failure", False)
+    assert "MaskRunProgress" not in result  # belongs to the previous run
+
+
+def test_handler_records_timings_on_failure(monkeypatch):
+    event = _base_event()
+    event["ConnectionMode"] = "bogus"
+
+    result = app.lambda_handler(event, None)
+
+    assert result["MaskRunStatus"] == "failure"
+    assert "total" in result["StepTimings"]
+
+
+@pytest.mark.parametrize(
+    "started, parked",
+    [
+        ({"MaskRunStatus": "queued", "MaskRunId": 7}, True),
+        ({"MaskRunStatus": "failure", "Error": "boom"}, False),
+    ],
+)
+def test_callback_mode_parks_token_until_run_ends(monkeypatch, started, parked):
+    sent = {}
+    registered = {}
+    monkeypatch.setattr(app, "start_run", lambda event: {**event, **started})
+    monkeypatch.setattr(app.callbacks, "register", lambda kind, key, token, output: registered.update({key: token}))
+    monkeypatch.setattr(app.callbacks, "succeed", lambda token, output: sent.update({token: output}))
+
+    result = app.lambda_handler({"Input": _base_event(), "TaskToken": "tok"}, None)
+
+    assert result["MaskRunStatus"] == started["MaskRunStatus"]
+    assert registered == ({"7": "tok"} if parked else {})
+    assert sent == ({} if parked else {"tok": result})
+
+
+def test_callback_mode_restores_run_secret_from_execution_input(monkeypatch):
+    seen = {}
+
+    def start_run(event):
+        seen.update(event)
+        return {**event, "MaskRunStatus": "queued", "MaskRunId": 8}
+
+    monkeypatch.setattr(app, "start_run", start_run)
+    monkeypatch.setattr(app.callbacks, "register", lambda kind, key, token, output: None)
+    resumed = {**_base_event(), "Benchmark": {"Pending": [2000], "Results": []}}
+
+    app.lambda_handler(
+        {"Input": resumed, "TaskToken": "tok", "ExecutionInput": {**_base_event(), "RunSecret": "caller-secret"}},
+        None,
+    )
+
+    assert seen["RunSecret"] == "caller-secret"
@@ -1,13 +1,20 @@
-import boto3
+from blueprint_common import rds, snapstart, staging
 
+# Builds and loads the RDS client during a SnapStart init; no-op otherwise.
+snapstart.init({"rds": ["DescribeDBInstances", "DescribeDBClusters"]})
 
+
+@rds.handler
 def lambda_handler(event, context):
 
-    db_snapshot_identifier = event["DBSnapshotIdentifier"]
+    # None when the staging DB is restored to a point in time or cloned
+    # rather than restored from a snapshot (RestoreSource "point_in_time" /
+    # "clone").
+    db_snapshot_identifier = event.get("DBSnapshotIdentifier")
     db_instance_identifier = event["DBInstanceIdentifier"]
     db_type = event["DBType"]  # 'RDS' or 'Aurora'
 
-    client = boto3.client("rds")
+    client = rds.client()
 
     parameters = {}
 
@@ -23,7 +30,6 @@ def lambda_handler(event, context):
         parameters = {
             "DBSnapshotIdentifier": db_snapshot_identifier,
             "DBInstanceIdentifier": instance["DBInstanceIdentifier"] + "-datamasque",
-            "DBInstanceClass": instance["DBInstanceClass"],
             # `or` (not get's default) so an explicit null/empty PreferredAZ in
             # the input still falls back to the source AZ; boto3 rejects None.
             "AvailabilityZone": event.get("PreferredAZ") or instance["AvailabilityZone"],
@@ -40,6 +46,13 @@ def lambda_handler(event, context):
             ),
             "DeletionProtection": False,
         }
+        source = {
+            "Engine": instance["Engine"],
+            "DBInstanceClass": instance["DBInstanceClass"],
+            "StorageType": instance.get("StorageType"),
+            "AllocatedStorage": instance.get("AllocatedStorage"),
+            "Iops": instance.get("Iops"),
+        }
 
     elif db_type == "Aurora":
         # Generate parameters for Aurora cluster restoration
@@ -64,9 +77,11 @@ def lambda_handler(event, context):
         instance_response = client.describe_db_instances(
             DBInstanceIdentifier=cluster["DBClusterMembers"][0]["DBInstanceIdentifier"],
         )
-        parameters["DBInstanceClass"] = instance_response["DBInstances"][0][
-            "DBInstanceClass"
-        ]
+        source = {
+            "Engine": cluster["Engine"],
+            "DBInstanceClass": instance_response["DBInstances"][0]["DBInstanceClass"],
+            "ServerlessV2ScalingConfiguration": cluster.get("ServerlessV2ScalingConfiguration"),
+        }
         parameters["DBParameterGroupName"] = instance_response["DBInstances"][0][
             "DBParameterGroups"
         ][0]["DBParameterGroupName"]
@@ -74,6 +89,16 @@ def lambda_handler(event, context):
     else:
         raise ValueError(f"Invalid DBType '{db_type}'. Expected 'RDS' or 'Aurora'.")
 
+    # Staging instance class, storage and Serverless v2 capacity: copied from
+    # the source unless StagingProfile / StagingInstance say otherwise.
+    staging.apply_profile(
+        parameters,
+        db_type,
+        source,
+        profile=event.get("StagingProfile"),
+        overrides=event.get("StagingInstance"),
+    )
+
     # Update the event with generated parameters
     event["parameters"] = parameters
     return event
@@ -2,139 +2,165 @@ import json
 import os
 import secrets
 from datetime import datetime
-from operator import itemgetter
 
-import boto3
+from blueprint_common import polling, rds, snapshots, snapstart, staging
 
 """
-Creates a snapshot of the specified RDS DB instance.
-
+Selects the newest usable snapshot of the source RDS instance or Aurora
+cluster (see blueprint_common/snapshots.py), or creates one if there is none.
+With MaxSnapshotAgeHours, a stale source is restored to its latest
+restorable time instead (RestoreSource "point_in_time"); with StagingMode
+"clone", an Aurora source is cloned (RestoreSource "clone").
 
 Returns:
-	dict: Response from AWS RDS create_db_snapshot API call.
-    
+	dict: The event with DBType, RestoreSource, DBSnapshotIdentifier,
+	SourceDBSnapshotStatus and SourceSnapshotAgeHours set.
 """
 
+# Builds and loads the RDS client during a SnapStart init; no-op otherwise.
+snapstart.init(
+    {
+        "rds": [
+            "DescribeDBClusters",
+            "DescribeDBInstances",
+            "DescribeDBSnapshots",
+            "DescribeDBClusterSnapshots",
+            "CreateDBSnapshot",
+            "CreateDBClusterSnapshot",
+        ]
+    }
+)
+
+
+def detect_db_type(client, DBInstanceIdentifier):
+    """"Aurora" or "RDS" for the source identifier."""
+    DBType = None
+    try:
+        cluster_response = client.describe_db_clusters(
+            DBClusterIdentifier=DBInstanceIdentifier
+        )
+        if cluster_response["DBClusters"]:
+            print(f"{DBInstanceIdentifier} is an Aurora cluster.")
+            DBType = "Aurora"
+    except client.exceptions.DBClusterNotFoundFault:
+        try:
+            instance_response = client.describe_db_instances(
+                DBInstanceIdentifier=DBInstanceIdentifier
+            )
+            if instance_response["DBInstances"]:
+                db_instance = instance_response["DBInstances"][0]
+                engine = db_instance["Engine"]
+                if engine.startswith("aurora"):
+                    print(
+                        f"{DBInstanceIdentifier} is an Aurora instance (part of a cluster)."
+                    )
+                    DBType = "Aurora"
+                else:
+                    print(f"{DBInstanceIdentifier} is an RDS instance.")
+                    DBType = "RDS"
+        except client.exceptions.DBInstanceNotFoundFault:
+            print(
+                f"{DBInstanceIdentifier} is neither an Aurora cluster nor an RDS instance."
+            )
+            raise Exception("Unknown DBInstanceIdentifier")
+    return DBType
+
+
+def create_snapshot(client, DBType, DBInstanceIdentifier):
+    """Start a manual snapshot of the source; returns the new snapshot."""
+    current_date = f"{datetime.now().strftime('%d%b%Y%H%M%S')}-{secrets.token_hex(3)}"
+    snapshot_identifier = f"{DBInstanceIdentifier}-datamasque-{current_date}"
+    if DBType == "Aurora":
+        response = client.create_db_cluster_snapshot(
+            DBClusterSnapshotIdentifier=snapshot_identifier,
+            DBClusterIdentifier=DBInstanceIdentifier,
+        )
+        return response["DBClusterSnapshot"]
+    db_instance_resp = client.describe_db_instances(
+        DBInstanceIdentifier=DBInstanceIdentifier,
+    )
+    source = db_instance_resp["DBInstances"][0]["DBInstanceIdentifier"]
+    response = client.create_db_snapshot(
+        DBSnapshotIdentifier=f"{source}-datamasque-{current_date}",
+        DBInstanceIdentifier=source,
+    )
+    return response["DBSnapshot"]
 
+
+@rds.handler
 def lambda_handler(event, context):
 
     DBInstanceIdentifier = event["DBInstanceIdentifier"]
-    client = boto3.client("rds")
+    client = rds.client()
 
     try:
-        DBType = None
-        try:
-            cluster_response = client.describe_db_clusters(
-                DBClusterIdentifier=DBInstanceIdentifier
-            )
-            if cluster_response["DBClusters"]:
-                print(f"{DBInstanceIdentifier} is an Aurora cluster.")
-                DBType = "Aurora"
-        except client.exceptions.DBClusterNotFoundFault:
-            try:
-                instance_response = client.describe_db_instances(
-                    DBInstanceIdentifier=DBInstanceIdentifier
-                )
-                if instance_response["DBInstances"]:
-                    db_instance = instance_response["DBInstances"][0]
-                    engine = db_instance["Engine"]
-                    if engine.startswith("aurora"):
-                        print(
-                            f"{DBInstanceIdentifier} is an Aurora instance (part of a cluster)."
-                        )
-                        DBType = "Aurora"
-                    else:
-                        print(f"{DBInstanceIdentifier} is an RDS instance.")
-                        DBType = "RDS"
-            except client.exceptions.DBInstanceNotFoundFault:
-                print(
-                    f"{DBInstanceIdentifier} is neither an Aurora cluster nor an RDS instance."
-                )
-                raise Exception("Unknown DBInstanceIdentifier")
+        DBType = event.get("DBType")
+        if DBType is None:
+            DBType = detect_db_type(client, DBInstanceIdentifier)
 
         event["DBType"] = DBType
 
-        if DBType == "Aurora":
-            response = client.describe_db_cluster_snapshots(
-                DBClusterIdentifier=DBInstanceIdentifier,
-                IncludeShared=True,
-            )
+        if staging.clone_mode(event):
+            if DBType == "Aurora":
+                # The staging cluster is cloned from the source cluster; no
+                # snapshot to select or wait for.
+                event["RestoreSource"] = "clone"
+                print(json.dumps(event))
+                return event
+            print("StagingMode clone applies to Aurora only; restoring from a snapshot")
 
-            if not response["DBClusterSnapshots"]:
-                print(
-                    "No existing Aurora cluster snapshots found. Generating a new snapshot."
-                )
-                current_date = f"{datetime.now().strftime('%d%b%Y%H%M%S')}-{secrets.token_hex(3)}"
-                snapshot_identifier = (
-                    f"{DBInstanceIdentifier}-datamasque-{current_date}"
-                )
-                response = client.create_db_cluster_snapshot(
-                    DBClusterSnapshotIdentifier=snapshot_identifier,
-                    DBClusterIdentifier=DBInstanceIdentifier,
-                )
-                event["DBSnapshotIdentifier"] = response["DBClusterSnapshot"][
-                    "DBClusterSnapshotIdentifier"
-                ]
-                event["SourceDBSnapshotStatus"] = response["DBClusterSnapshot"][
-                    "Status"
-                ]
-            else:
-                snapshots = response["DBClusterSnapshots"]
-                sorted_list = sorted(
-                    snapshots, key=itemgetter("SnapshotCreateTime"), reverse=True
-                )
-                event["DBSnapshotIdentifier"] = sorted_list[0][
-                    "DBClusterSnapshotIdentifier"
-                ]
-                event["SourceDBSnapshotStatus"] = sorted_list[0]["Status"]
-                if sorted_list[0]["Status"] == "failed":
-                    event["Error"] = (
-                        f"Error capturing snapshot: {sorted_list[0]['DBClusterSnapshotIdentifier']}"
-                    )
-                    event["SourceDBSnapshotStatus"] = "failed"
-
-        elif DBType == "RDS":
-            # Handle RDS Instance Snapshots
-            response = client.describe_db_snapshots(
-                DBInstanceIdentifier=DBInstanceIdentifier,
-                IncludePublic=False,
-                IncludeShared=True,
+        if event.get("DBSnapshotIdentifier") and event.get("SourceDBSnapshotStatus") in snapshots.IN_PROGRESS:
+            # A previous poll picked (or created) this snapshot and is waiting
+            # for it: re-read just that one.
+            snapshot = snapshots.describe_snapshot(client, DBType, event["DBSnapshotIdentifier"])
+        else:
+            snapshot = snapshots.latest_snapshot(
+                client,
+                DBType,
+                DBInstanceIdentifier,
+                snapshot_types=event.get("SourceSnapshotTypes"),
+                include_shared=event.get("IncludeSharedSnapshots", True),
             )
+            max_age = event.get("MaxSnapshotAgeHours")
+            if not snapshots.is_fresh(snapshot, max_age):
+                restorable = None
+                if max_age is not None:
+                    restorable = snapshots.latest_restorable_time(client, DBType, DBInstanceIdentifier)
+                if restorable is not None:
+                    # No fresh enough snapshot: restore the staging DB to the
+                    # latest restorable time instead of taking one and waiting.
+                    print(f"No snapshot within {max_age} hours; restoring to point in time {restorable.isoformat()}")
+                    event.pop("DBSnapshotIdentifier", None)
+                    event["RestoreSource"] = "point_in_time"
+                    event["SourceRestoreTime"] = restorable.isoformat()
+                    event["SourceSnapshotAgeHours"] = snapshots.age_hours(snapshot) if snapshot else None
+                    print(json.dumps(event))
+                    return event
+                print("No usable snapshot found. Generating a new snapshot.")
+                snapshot = create_snapshot(client, DBType, DBInstanceIdentifier)
 
-            if not response["DBSnapshots"]:
-                print("No existing RDS snapshots found. Generating a new snapshot.")
-                db_instance_resp = client.describe_db_instances(
-                    DBInstanceIdentifier=DBInstanceIdentifier,
-                )
-                current_date = f"{datetime.now().strftime('%d%b%Y%H%M%S')}-{secrets.token_hex(3)}"
-                snapshot_identifier = f"{db_instance_resp['DBInstances'][0]['DBInstanceIdentifier']}-datamasque-{current_date}"
-                response = client.create_db_snapshot(
-                    DBSnapshotIdentifier=snapshot_identifier,
-                    DBInstanceIdentifier=db_instance_resp["DBInstances"][0][
-                        "DBInstanceIdentifier"
-                    ],
-                )
-                event["DBSnapshotIdentifier"] = response["DBSnapshot"][
-                    "DBSnapshotIdentifier"
-                ]
-                event["SourceDBSnapshotStatus"] = response["DBSnapshot"]["Status"]
-            else:
-                snapshots = response["DBSnapshots"]
-                sorted_list = sorted(
-                    snapshots, key=itemgetter("SnapshotCreateTime"), reverse=True
-                )
-                event["DBSnapshotIdentifier"] = sorted_list[0]["DBSnapshotIdentifier"]
-                event["SourceDBSnapshotStatus"] = sorted_list[0]["Status"]
-                if sorted_list[0]["Status"] == "failed":
-                    event["Error"] = (
-                        f"Error capturing snapshot: {sorted_list[0]['DBSnapshotIdentifier']}"
-                    )
-                    event["SourceDBSnapshotStatus"] = "failed"
+        event["RestoreSource"] = "snapshot"
+        event["DBSnapshotIdentifier"] = snapshots.snapshot_identifier(DBType, snapshot)
+        event["SourceDBSnapshotStatus"] = snapshot["Status"]
+        event["SourceSnapshotAgeHours"] = snapshots.age_hours(snapshot)
+        print(
+            f"Selected snapshot {event['DBSnapshotIdentifier']} "
+            f"({snapshot['Status']}, {event['SourceSnapshotAgeHours']} hours old)"
+        )
+        if snapshot["Status"] != "available" and snapshot["Status"] not in snapshots.IN_PROGRESS:
+            event["Error"] = f"Error capturing snapshot: {event['DBSnapshotIdentifier']}"
+            event["SourceDBSnapshotStatus"] = "failed"
 
+        polling.schedule(
+            event, "source_snapshot", event["SourceDBSnapshotStatus"], snapshot.get("PercentProgress")
+        )
         print(json.dumps(event))
         return event
 
     except Exception as e:
+        # Throttling that outlasted the retries is not a failure of the
+        # workflow; the state machine retries the task.
+        rds.raise_if_throttled(e)
         event["SourceDBSnapshotStatus"] = "failed"
         event["Error"] = f"Error capturing snapshot: {e}"
         print(f"Error capturing snapshot: {e}")
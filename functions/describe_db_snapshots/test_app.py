@@ -0,0 +1,99 @@
+"""
+Unit tests for app.py.
+
+Run from this directory:
+    pytest test_app.py -v
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import app
+
+NOW = datetime.now(timezone.utc)
+
+
+@pytest.fixture
+def stubber(monkeypatch):
+    client = boto3.client("rds", region_name="us-east-1")
+    monkeypatch.setattr(app.rds, "client", lambda: client)
+    with Stubber(client) as stub:
+        yield stub
+        stub.assert_no_pending_responses()
+
+
+def _expect_stale_snapshot(stubber):
+    stubber.add_response(
+        "describe_db_snapshots",
+        {
+            "DBSnapshots": [
+                {"DBSnapshotIdentifier": "prod-old", "Status": "available", "SnapshotCreateTime": NOW - timedelta(hours=30)}
+            ]
+        },
+        {"DBInstanceIdentifier": "prod", "IncludeShared": True, "IncludePublic": False},
+    )
+
+
+def _expect_source(stubber, **source):
+    stubber.add_response(
+        "describe_db_instances",
+        {"DBInstances": [{"DBInstanceIdentifier": "prod", **source}]},
+        {"DBInstanceIdentifier": "prod"},
+    )
+
+
+def test_stale_snapshot_restores_to_the_recorded_point_in_time(stubber):
+    restorable = NOW - timedelta(minutes=5)
+    _expect_stale_snapshot(stubber)
+    _expect_source(stubber, BackupRetentionPeriod=7, LatestRestorableTime=restorable)
+
+    result = app.lambda_handler({"DBInstanceIdentifier": "prod", "DBType": "RDS", "MaxSnapshotAgeHours": 24}, None)
+
+    assert result["RestoreSource"] == "point_in_time"
+    assert result["SourceRestoreTime"] == restorable.isoformat()
+    assert "DBSnapshotIdentifier" not in result
+
+
+def test_source_without_a_restorable_time_takes_a_snapshot(stubber):
+    _expect_stale_snapshot(stubber)
+    # Automated backups are off: no point-in-time restore is possible.
+    _expect_source(stubber, BackupRetentionPeriod=0)
+    _expect_source(stubber)
+    stubber.add_response(
+        "create_db_snapshot",
+        {"DBSnapshot": {"DBSnapshotIdentifier": "prod-datamasque-new", "Status": "creating"}},
+    )
+
+    result = app.lambda_handler({"DBInstanceIdentifier": "prod", "DBType": "RDS", "MaxSnapshotAgeHours": 24}, None)
+
+    assert result["RestoreSource"] == "snapshot"
+    assert result["DBSnapshotIdentifier"] == "prod-datamasque-new"
+    assert result["SourceDBSnapshotStatus"] == "creating"
+    assert "SourceRestoreTime" not in result
+
+
+def test_aurora_clone_skips_snapshot_selection(stubber):
+    # No responses queued: any RDS call fails the stubber.
+    result = app.lambda_handler({"DBInstanceIdentifier": "prod-cluster", "DBType": "Aurora", "StagingMode": "clone"}, None)
+
+    assert result["RestoreSource"] == "clone"
+    assert "DBSnapshotIdentifier" not in result
+    assert "Error" not in result
+
+
+def test_rds_clone_falls_back_to_a_snapshot(stubber):
+    stubber.add_response(
+        "describe_db_snapshots",
+        {"DBSnapshots": [{"DBSnapshotIdentifier": "prod-new", "Status": "available", "SnapshotCreateTime": NOW}]},
+        {"DBInstanceIdentifier": "prod", "IncludeShared": True, "IncludePublic": False},
+    )
+
+    result = app.lambda_handler({"DBInstanceIdentifier": "prod", "DBType": "RDS", "StagingMode": "clone"}, None)
+
+    assert result["RestoreSource"] == "snapshot"
+    assert result["DBSnapshotIdentifier"] == "prod-new"
@@ -0,0 +1,355 @@
+"""
+Pre-warms the restored staging database before masking ("HydrateStagingDB": true).
+
+A volume restored from a snapshot loads each block from S3 the first time
+it is read, so a masking run's first pass over every table is far slower
+than steady state. This step reads the tables the ruleset masks (its
+mask_table / mask_unique_key tasks, or the "HydrateTables" input) before the
+run starts, "HydrateWorkers" (default 4) tables at a time, each on its own
+connection:
+
+- PostgreSQL: pg_prewarm(..., 'read') over the table, its TOAST table and its
+  indexes when the pg_prewarm extension is installed, else a sequential scan;
+- MySQL / MariaDB: CHECKSUM TABLE, which reads every row including off-page
+  columns.
+
+Each invocation stops short of the Lambda timeout. Tables not finished stay
+pending and the state machine invokes the step again, up to
+"HydrateMaxPasses" (default 8) times; blocks already read stay warm, so a
+repeated scan moves on quickly. The pending list can outgrow the 256 KB
+state limit, so it is kept in the state store in pages of PENDING_PAGE_SIZE
+tables; Hydration only carries its key, page count and length. Hydration
+never fails the execution: errors are reported in Hydration and masking
+starts anyway.
+
+The drivers (pg8000, PyMySQL) and PyYAML are imported on first use.
+"""
+import json
+import logging
+import os
+import secrets
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from blueprint_common import snapstart
+from blueprint_common.datamasque import get_client, parse_verify_tls, verify_tls_from_env
+from blueprint_common.db_secret import staging_host
+from blueprint_common.secrets_cache import get_secrets_cache
+from blueprint_common.state_store import get_store
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Builds the Secrets Manager client and DataMasque connection pools during a
+# SnapStart init; no-op otherwise.
+snapstart.init({"secretsmanager": ["GetSecretValue"]}, datamasque_pool=True)
+
+HYDRATE_ENGINES = ("postgres", "mysql", "mariadb")
+
+# Ruleset task types whose table the masking run reads and rewrites.
+MASKING_TASK_TYPES = ("mask_table", "mask_unique_key")
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PASSES = 8
+
+# Stop starting tables / cancel scans this long before the Lambda timeout.
+TIME_MARGIN_SECONDS = 30
+
+# Invocation budget when there is no Lambda context (local runs, tests).
+DEFAULT_BUDGET_SECONDS = 840
+
+# State-store kind of the pending table list, stored in pages well under the
+# 400 KB DynamoDB item limit; the TTL outlives any execution's passes.
+PENDING_KIND = "hydration_pending"
+PENDING_PAGE_SIZE = 1000
+PENDING_TTL_SECONDS = 2 * 24 * 3600
+
+# Driver error codes for a scan cut off by the budget: PostgreSQL
+# query_canceled (statement_timeout), MySQL lost connection (read timeout).
+TIMEOUT_CODES = {"57014", 2013}
+
+PG_PREWARM_SQL = """
+SELECT coalesce(sum(pg_prewarm(oid, 'read')), 0) * current_setting('block_size')::bigint
+FROM pg_class
+WHERE oid = %s::regclass
+   OR oid = (SELECT reltoastrelid FROM pg_class WHERE oid = %s::regclass)
+   OR oid IN (SELECT indexrelid FROM pg_index WHERE indrelid = %s::regclass)
+"""
+
+
+def _api(base_url):
+    """Pooled DataMasque client for ``base_url`` (reused across warm invocations)."""
+    return get_client(base_url, verify=verify_tls_from_env())
+
+
+def ruleset_tables(config_yaml: str, default_schema: str) -> list:
+    """``[schema, table]`` pairs masked by the ruleset, in task order, without duplicates."""
+    import yaml
+
+    found = []
+
+    def walk(tasks):
+        for task in tasks or []:
+            if not isinstance(task, dict):
+                continue
+            if task.get("type") in MASKING_TASK_TYPES and task.get("table"):
+                schema, _, table = str(task["table"]).rpartition(".")
+                pair = [schema or default_schema, table]
+                if pair not in found:
+                    found.append(pair)
+            # parallel / serial tasks nest their own task lists
+            walk(task.get("tasks"))
+
+    walk((yaml.safe_load(config_yaml) or {}).get("tasks"))
+    return found
+
+
+def fetch_ruleset_yaml(base_url: str, secret_arn: str, ruleset_id: str) -> str:
+    """
+    full_url = 'https://masque.local/api/rulesets/<ruleset_id>/'
+    method = 'GET'
+    """
+    credential = get_secrets_cache().get_secret_json(secret_arn)
+    dm = _api(base_url)
+    token = {"Authorization": "Token " + dm.login(credential["username"], credential["password"])["key"]}
+    response = dm.get(f"api/rulesets/{ruleset_id}/", headers=token, name="rulesets")
+    if response.status_code != 200:
+        raise RuntimeError(f"Unexpected status code reading ruleset {ruleset_id}: {response.status_code}")
+    return response.json()["config_yaml"]
+
+
+def initial_tables(event: dict, secret: dict) -> list:
+    default_schema = secret.get("schema") or secret["dbname"]
+    if event.get("HydrateTables"):
+        return [
+            [schema or default_schema, table]
+            for schema, _, table in (name.rpartition(".") for name in event["HydrateTables"])
+        ]
+    config_yaml = fetch_ruleset_yaml(
+        os.environ["DATAMASQUE_BASE_URL"], os.environ["DATAMASQUE_SECRET_ARN"], event["DataMasqueRulesetId"]
+    )
+    return ruleset_tables(config_yaml, default_schema)
+
+
+def _ssl_context():
+    # Encrypted unless DB_SSL is "false" (a local database without TLS). The
+    # server certificate is verified against DB_CA_BUNDLE (the RDS global
+    # bundle packaged with the function; see the README), or the system
+    # trust store when it is unset, unless DB_VERIFY_TLS is "false".
+    if os.environ.get("DB_SSL", "true").strip().lower() == "false":
+        return None
+    if not parse_verify_tls(os.environ.get("DB_VERIFY_TLS", "true")):
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+    bundle = os.environ.get("DB_CA_BUNDLE")
+    if bundle and not os.path.exists(bundle):
+        raise RuntimeError(
+            f"CA bundle {bundle} not found: package the RDS global bundle with the function "
+            "or set DB_VERIFY_TLS to false"
+        )
+    return ssl.create_default_context(cafile=bundle or None)
+
+
+def connect(engine: str, secret: dict, host: str, timeout_seconds: float):
+    """A DB-API connection to the staging database that gives up after ``timeout_seconds``."""
+    if engine == "postgres":
+        import pg8000.dbapi
+
+        connection = pg8000.dbapi.connect(
+            user=secret["username"],
+            password=secret["password"],
+            host=host,
+            port=int(secret["port"]),
+            database=secret["dbname"],
+            ssl_context=_ssl_context(),
+        )
+        cursor = connection.cursor()
+        cursor.execute("SELECT set_config('statement_timeout', %s, false)", (str(int(timeout_seconds * 1000)),))
+        return connection
+    import pymysql
+
+    return pymysql.connect(
+        host=host,
+        port=int(secret["port"]),
+        user=secret["username"],
+        password=secret["password"],
+        database=secret["dbname"],
+        ssl=_ssl_context(),
+        connect_timeout=10,
+        read_timeout=max(1, int(timeout_seconds)),
+    )
+
+
+def _pg_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _mysql_ident(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+def hydrate_postgres(cursor, schema: str, table: str) -> int:
+    """Read ``schema.table`` into the volume; returns the bytes read."""
+    relation = f"{_pg_ident(schema)}.{_pg_ident(table)}"
+    cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'")
+    if cursor.fetchone():
+        cursor.execute(PG_PREWARM_SQL, (relation, relation, relation))
+        return int(cursor.fetchone()[0])
+    # Without pg_prewarm: a sequential scan of the heap.
+    for setting in ("enable_indexscan", "enable_indexonlyscan", "enable_bitmapscan"):
+        cursor.execute(f"SET {setting} = off")
+    cursor.execute(f"SELECT count(*) FROM {relation}")
+    cursor.fetchone()
+    cursor.execute("SELECT pg_relation_size(%s::regclass)", (relation,))
+    return int(cursor.fetchone()[0])
+
+
+def hydrate_mysql(cursor, schema: str, table: str) -> int:
+    """Read ``schema.table`` into the volume; returns the table's data length."""
+    cursor.execute(f"CHECKSUM TABLE {_mysql_ident(schema)}.{_mysql_ident(table)}")
+    cursor.fetchall()
+    cursor.execute(
+        "SELECT data_length FROM information_schema.tables WHERE table_schema = %s AND table_name = %s",
+        (schema, table),
+    )
+    row = cursor.fetchone()
+    return int(row[0] or 0) if row else 0
+
+
+def _is_timeout(error: Exception) -> bool:
+    code = error.args[0] if error.args else None
+    if isinstance(code, dict):  # pg8000 passes the server's error fields
+        code = code.get("C")
+    return code in TIMEOUT_CODES
+
+
+def hydrate_table(engine: str, secret: dict, host: str, schema: str, table: str, deadline: float) -> dict:
+    """Hydrate one table; the result's Status is "done", "pending" (out of time) or "error"."""
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return {"Status": "pending"}
+    started = time.time()
+    try:
+        connection = connect(engine, secret, host, remaining)
+        try:
+            hydrate = hydrate_postgres if engine == "postgres" else hydrate_mysql
+            size = hydrate(connection.cursor(), schema, table)
+        finally:
+            connection.close()
+    except Exception as e:
+        if _is_timeout(e):
+            return {"Status": "pending"}
+        logger.warning("Could not hydrate %s.%s: %s", schema, table, e)
+        return {"Status": "error", "Error": str(e)}
+    seconds = time.time() - started
+    logger.info("Hydrated %s.%s: %d bytes in %.1fs (%.1f MB/s)", schema, table, size, seconds, size / max(seconds, 1e-3) / 1e6)
+    return {"Status": "done", "Bytes": size, "Seconds": seconds}
+
+
+def hydrate(engine: str, secret: dict, host: str, tables: list, workers: int, deadline: float) -> dict:
+    """Hydrate ``tables`` with ``workers`` in parallel; results keyed by position."""
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="hydrate") as pool:
+        submitted = [
+            pool.submit(hydrate_table, engine, secret, host, schema, table, deadline) for schema, table in tables
+        ]
+        return {index: future.result() for index, future in enumerate(submitted)}
+
+
+def save_pending(hydration: dict, tables: list) -> None:
+    """Store ``tables`` under ``hydration["PendingKey"]``, replacing the previous list."""
+    store = get_store()
+    key = hydration["PendingKey"]
+    pages = [tables[start : start + PENDING_PAGE_SIZE] for start in range(0, len(tables), PENDING_PAGE_SIZE)]
+    for page, chunk in enumerate(pages):
+        store.put(PENDING_KIND, f"{key}/{page}", {"Tables": chunk}, ttl_seconds=PENDING_TTL_SECONDS)
+    # Pages past the new end belong to the previous, longer list.
+    for page in range(len(pages), hydration.get("PendingPages", 0)):
+        store.delete(PENDING_KIND, f"{key}/{page}")
+    hydration["PendingPages"] = len(pages)
+
+
+def load_pending(hydration: dict) -> list:
+    """The tables ``save_pending`` stored for ``hydration``."""
+    store = get_store()
+    tables = []
+    for page in range(hydration["PendingPages"]):
+        stored = store.get(PENDING_KIND, f'{hydration["PendingKey"]}/{page}')
+        if stored is None:
+            raise RuntimeError(f'Pending tables {hydration["PendingKey"]}/{page} are missing from the state store')
+        tables.extend(stored["Tables"])
+    return tables
+
+
+def _budget_seconds(context) -> float:
+    if context is not None:
+        return context.get_remaining_time_in_millis() / 1000 - TIME_MARGIN_SECONDS
+    return DEFAULT_BUDGET_SECONDS
+
+
+def lambda_handler(event, context):
+    hydration = event.get("Hydration") or {}
+    deadline = time.time() + _budget_seconds(context)
+    started = time.time()
+    try:
+        secret = get_secrets_cache().get_secret_json(event["DBSecretIdentifier"])
+        engine = secret["engine"]
+        if engine not in HYDRATE_ENGINES:
+            hydration.update(Status="skipped", Reason=f"No hydration for engine {engine}")
+            event["Hydration"] = hydration
+            return event
+
+        _ssl_context()  # a missing CA bundle fails the step once, not every table
+
+        if "PendingKey" not in hydration:
+            tables = initial_tables(event, secret)
+            hydration.update(
+                PendingKey=f'{event.get("StageDB", "staging")}/{secrets.token_hex(4)}',
+                Bytes=0,
+                Seconds=0.0,
+                Passes=0,
+                Errors={},
+            )
+        else:
+            tables = load_pending(hydration)
+        logger.info("Hydrating %d tables of the staging database", len(tables))
+
+        results = hydrate(
+            engine,
+            secret,
+            staging_host(secret["host"]),
+            tables,
+            int(event.get("HydrateWorkers") or DEFAULT_WORKERS),
+            deadline,
+        )
+        pending = []
+        for index, result in results.items():
+            schema, table = tables[index]
+            if result["Status"] == "pending":
+                pending.append([schema, table])
+            elif result["Status"] == "error":
+                hydration["Errors"][f"{schema}.{table}"] = result["Error"]
+            else:
+                hydration["Bytes"] += result["Bytes"]
+
+        hydration["Passes"] += 1
+        hydration["Seconds"] = round(hydration["Seconds"] + time.time() - started, 1)
+        hydration["BytesPerSecond"] = round(hydration["Bytes"] / max(hydration["Seconds"], 0.1))
+        hydration["PendingCount"] = len(pending)
+        if not pending:
+            hydration["Status"] = "complete"
+        elif hydration["Passes"] >= int(event.get("HydrateMaxPasses") or DEFAULT_MAX_PASSES):
+            hydration["Status"] = "incomplete"
+        else:
+            hydration["Status"] = "in_progress"
+        # Only another pass reads the list; otherwise drop it.
+        save_pending(hydration, pending if hydration["Status"] == "in_progress" else [])
+    except Exception as e:
+        logger.exception("Hydration failed; masking starts without it")
+        hydration.update(Status="failed", Error=str(e))
+
+    event["Hydration"] = hydration
+    logger.info("Hydration: %s", json.dumps(hydration))
+    return event
@@ -0,0 +1,313 @@
+"""
+Unit tests for app.py.
+
+Run from this directory:
+    pytest test_app.py -v
+
+The DB-API connections are faked. To run the integration tests against a
+local container instead, export a connection secret (JSON with username,
+password, host, port, dbname, schema) and a table in it, e.g.:
+    HYDRATE_TEST_POSTGRES='{"username": "postgres", "password": "pw", "host": "localhost",
+        "port": 5432, "dbname": "postgres", "schema": "public"}' HYDRATE_TEST_TABLE=public.t \\
+        DB_SSL=false pytest test_app.py -v -k integration
+"""
+import json
+import os
+import ssl
+import time
+
+import pytest
+from blueprint_common import state_store
+
+os.environ.setdefault("DATAMASQUE_BASE_URL", "http://localhost:8080/")
+os.environ.setdefault(
+    "DATAMASQUE_SECRET_ARN",
+    "arn:aws:secretsmanager:us-east-1:111111111111:secret:fake-AbCdEf",
+)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import app
+
+RULESET = """
+version: "1.0"
+tasks:
+  - type: run_sql
+    sql: "SELECT 1"
+  - type: mask_table
+    table: customers
+    key: id
+    rules: []
+  - type: parallel
+    tasks:
+      - type: mask_table
+        table: sales.orders
+        key: id
+        rules: []
+      - type: mask_unique_key
+        table: customers
+        key: email
+  - type: truncate_table
+    table: audit_log
+"""
+
+SECRET = {
+    "engine": "postgres",
+    "username": "u",
+    "password": "p",
+    "host": "prod.abc.us-east-1.rds.amazonaws.com",
+    "port": "5432",
+    "dbname": "app",
+    "schema": "public",
+}
+
+
+class FakeCursor:
+    """Answers the hydration queries from ``results`` (SQL prefix -> row)."""
+
+    def __init__(self, results, executed, error=None):
+        self.results = results
+        self.executed = executed
+        self.error = error
+        self.row = None
+
+    def execute(self, sql, params=None):
+        self.executed.append((" ".join(sql.split()), params))
+        if self.error is not None and sql.lstrip().startswith(("CHECKSUM", "SELECT coalesce", "SELECT count")):
+            raise self.error
+        self.row = next((row for prefix, row in self.results.items() if sql.lstrip().startswith(prefix)), None)
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return [self.row] if self.row else []
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.closed = False
+
+    def cursor(self):
+        return self._cursor
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    monkeypatch.delenv("STATE_TABLE_NAME", raising=False)
+    state_store.reset_store()
+    yield state_store.get_store()
+    state_store.reset_store()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Fake connections; ``db.results`` / ``db.error`` script the server."""
+
+    class DB:
+        results = {}
+        error = None
+        executed = []
+        connects = []
+
+    def connect(engine, secret, host, timeout_seconds):
+        DB.connects.append((engine, host))
+        return FakeConnection(FakeCursor(DB.results, DB.executed, DB.error))
+
+    DB.executed, DB.connects = [], []
+    monkeypatch.setattr(app, "connect", connect)
+    return DB
+
+
+def _secrets(monkeypatch, secret=SECRET):
+    class Secrets:
+        def get_secret_json(self, secret_id):
+            return secret
+
+    monkeypatch.setattr(app, "get_secrets_cache", lambda: Secrets())
+
+
+def test_ruleset_tables_walks_nested_tasks_once_per_table():
+    assert app.ruleset_tables(RULESET, "public") == [["public", "customers"], ["sales", "orders"]]
+
+
+def test_postgres_uses_pg_prewarm_when_installed(db):
+    db.results = {"SELECT 1 FROM pg_extension": (1,), "SELECT coalesce": (8192 * 10,)}
+
+    result = app.hydrate_table("postgres", SECRET, "stg", "public", "customers", time.time() + 60)
+
+    assert result["Status"] == "done"
+    assert result["Bytes"] == 81920
+    prewarm = [params for sql, params in db.executed if sql.startswith("SELECT coalesce")]
+    assert prewarm == [('"public"."customers"',) * 3]
+
+
+def test_postgres_falls_back_to_a_sequential_scan(db):
+    db.results = {"SELECT pg_relation_size": (4096,)}
+
+    result = app.hydrate_table("postgres", SECRET, "stg", "public", 'we"ird', time.time() + 60)
+
+    assert result == {"Status": "done", "Bytes": 4096, "Seconds": pytest.approx(result["Seconds"])}
+    statements = [sql for sql, _ in db.executed]
+    assert "SET enable_indexonlyscan = off" in statements
+    assert 'SELECT count(*) FROM "public"."we""ird"' in statements
+
+
+def test_mysql_checksums_the_table(db):
+    db.results = {"CHECKSUM": ("app.customers", 123), "SELECT data_length": (2048,)}
+
+    result = app.hydrate_table("mysql", SECRET, "stg", "app", "customers", time.time() + 60)
+
+    assert result["Bytes"] == 2048
+    assert db.executed[0][0] == "CHECKSUM TABLE `app`.`customers`"
+
+
+def test_timed_out_scan_stays_pending_and_other_errors_are_reported(db):
+    db.error = Exception({"C": "57014", "M": "canceling statement due to statement timeout"})
+    assert app.hydrate_table("postgres", SECRET, "stg", "public", "t", time.time() + 60) == {"Status": "pending"}
+
+    db.error = Exception(1146, "Table 'app.t' doesn't exist")
+    assert app.hydrate_table("mysql", SECRET, "stg", "app", "t", time.time() + 60)["Status"] == "error"
+
+
+def test_no_time_left_leaves_tables_pending_without_connecting(db):
+    assert app.hydrate_table("postgres", SECRET, "stg", "public", "t", time.time() - 1) == {"Status": "pending"}
+    assert db.connects == []
+
+
+def test_handler_hydrates_ruleset_tables_on_the_staging_host(monkeypatch, db):
+    _secrets(monkeypatch)
+    monkeypatch.setattr(app, "fetch_ruleset_yaml", lambda base_url, secret_arn, ruleset_id: RULESET)
+    db.results = {"SELECT 1 FROM pg_extension": (1,), "SELECT coalesce": (1000,)}
+    event = {"DBSecretIdentifier": "s", "DataMasqueRulesetId": "r", "HydrateWorkers": 2}
+
+    result = app.lambda_handler(event, None)
+
+    hydration = result["Hydration"]
+    assert hydration["Status"] == "complete"
+    assert hydration["Bytes"] == 2000
+    assert (hydration["PendingCount"], hydration["PendingPages"]) == (0, 0)
+    assert hydration["Passes"] == 1
+    assert {host for _, host in db.connects} == {"prod-datamasque.abc.us-east-1.rds.amazonaws.com"}
+    json.dumps(result)  # the state machine passes it on
+
+
+def test_handler_continues_pending_tables_until_max_passes(monkeypatch, db, store):
+    db.error = Exception(2013, "Lost connection to MySQL server during query (timed out)")
+    event = {"StageDB": "stg", "DBSecretIdentifier": "s", "HydrateTables": ["orders", "sales.items"], "HydrateMaxPasses": 2}
+    _secrets(monkeypatch, dict(SECRET, engine="mysql"))
+
+    event = app.lambda_handler(event, None)
+    hydration = event["Hydration"]
+    assert hydration["Status"] == "in_progress"
+    assert hydration["PendingKey"].startswith("stg/")
+    assert "Pending" not in hydration
+    assert app.load_pending(hydration) == [["public", "orders"], ["sales", "items"]]
+
+    event = app.lambda_handler(event, None)
+    assert event["Hydration"]["Status"] == "incomplete"
+    assert event["Hydration"]["Passes"] == 2
+    assert event["Hydration"]["PendingCount"] == 2
+    # Nothing reads the list after the last pass.
+    assert store.items(app.PENDING_KIND) == []
+
+
+def test_pending_tables_are_stored_in_pages(monkeypatch, store):
+    monkeypatch.setattr(app, "PENDING_PAGE_SIZE", 2)
+    hydration = {"PendingKey": "stg/abcd"}
+    tables = [["public", f"t{n}"] for n in range(5)]
+
+    app.save_pending(hydration, tables)
+    assert hydration["PendingPages"] == 3
+    assert app.load_pending(hydration) == tables
+
+    # A shorter list drops the pages past its end.
+    app.save_pending(hydration, tables[:1])
+    assert hydration["PendingPages"] == 1
+    assert [key for key, _ in store.items(app.PENDING_KIND)] == ["stg/abcd/0"]
+    assert app.load_pending(hydration) == tables[:1]
+
+
+def test_lost_pending_tables_fail_hydration(monkeypatch, db):
+    _secrets(monkeypatch)
+    event = {"DBSecretIdentifier": "s", "Hydration": {"PendingKey": "stg/gone", "PendingPages": 1, "Passes": 1}}
+
+    result = app.lambda_handler(event, None)
+
+    assert result["Hydration"]["Status"] == "failed"
+    assert "stg/gone/0" in result["Hydration"]["Error"]
+    assert db.connects == []
+
+
+def test_handler_skips_engines_without_hydration(monkeypatch, db):
+    _secrets(monkeypatch, dict(SECRET, engine="oracle"))
+
+    result = app.lambda_handler({"DBSecretIdentifier": "s"}, None)
+
+    assert result["Hydration"]["Status"] == "skipped"
+    assert db.connects == []
+
+
+def test_handler_never_raises(monkeypatch, db):
+    _secrets(monkeypatch)
+
+    def unreachable(*args):
+        raise RuntimeError("DataMasque unreachable")
+
+    monkeypatch.setattr(app, "fetch_ruleset_yaml", unreachable)
+
+    result = app.lambda_handler({"DBSecretIdentifier": "s", "DataMasqueRulesetId": "r"}, None)
+
+    assert result["Hydration"]["Status"] == "failed"
+    assert "unreachable" in result["Hydration"]["Error"]
+
+
+def test_tls_verifies_against_the_ca_bundle_unless_opted_out(monkeypatch, tmp_path):
+    monkeypatch.delenv("DB_SSL", raising=False)
+    monkeypatch.delenv("DB_VERIFY_TLS", raising=False)
+    bundles = []
+
+    def create_default_context(cafile=None):
+        bundles.append(cafile)
+        return ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+
+    monkeypatch.setattr(app.ssl, "create_default_context", create_default_context)
+    bundle = tmp_path / "global-bundle.pem"
+    bundle.write_text("")
+    monkeypatch.setenv("DB_CA_BUNDLE", str(bundle))
+
+    context = app._ssl_context()
+    assert (context.verify_mode, context.check_hostname) == (ssl.CERT_REQUIRED, True)
+    assert bundles == [str(bundle)]
+
+    monkeypatch.setenv("DB_VERIFY_TLS", "false")
+    assert app._ssl_context().verify_mode == ssl.CERT_NONE
+
+
+def test_missing_ca_bundle_fails_hydration_before_connecting(monkeypatch, db):
+    _secrets(monkeypatch)
+    monkeypatch.delenv("DB_SSL", raising=False)
+    monkeypatch.delenv("DB_VERIFY_TLS", raising=False)
+    monkeypatch.setenv("DB_CA_BUNDLE", "/var/task/missing-bundle.pem")
+
+    result = app.lambda_handler({"DBSecretIdentifier": "s", "HydrateTables": ["t"]}, None)
+
+    assert result["Hydration"]["Status"] == "failed"
+    assert "missing-bundle.pem" in result["Hydration"]["Error"]
+    assert db.connects == []
+
+
+@pytest.mark.parametrize("engine, variable", [("postgres", "HYDRATE_TEST_POSTGRES"), ("mysql", "HYDRATE_TEST_MYSQL")])
+def test_integration_against_a_local_database(engine, variable):
+    if not os.environ.get(variable) or not os.environ.get("HYDRATE_TEST_TABLE"):
+        pytest.skip(f"{variable} / HYDRATE_TEST_TABLE not set")
+    pytest.importorskip("pg8000" if engine == "postgres" else "pymysql")
+    secret = json.loads(os.environ[variable])
+    schema, _, table = os.environ["HYDRATE_TEST_TABLE"].rpartition(".")
+
+    result = app.hydrate_table(engine, secret, secret["host"], schema or secret["schema"], table, time.time() + 60)
+
+    assert result["Status"] == "done"
@@ -0,0 +1,149 @@
+"""
+Resumes executions waiting on DataMasque masking runs ("CompletionMode": "callback").
+
+Runs on a schedule. One invocation lists every in-flight run parked by
+DatamasqueRun, logs in to DataMasque once, reads each run's status
+concurrently, and sends SendTaskSuccess with the final state for runs that
+have finished or failed, deleting the temporary connection as
+CheckMaskingRunStatus would. A finished run's log is read once, so its rows
+masked reach the benchmark results and the buffer size history.
+"""
+import json
+import logging
+import os
+import time
+
+from blueprint_common import callbacks, run_log, run_options, snapstart
+from blueprint_common.datamasque import get_client, verify_tls_from_env
+from blueprint_common.secrets_cache import get_secrets_cache
+from blueprint_common.state_store import get_store
+from blueprint_common.steps import executor
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MASKING_RUN_KIND = "masking_run"
+
+# Builds the Secrets Manager / Step Functions clients and DataMasque
+# connection pools during a SnapStart init; no-op otherwise.
+snapstart.init(
+    {"secretsmanager": ["GetSecretValue"], "stepfunctions": ["SendTaskSuccess", "SendTaskFailure"]},
+    datamasque_pool=True,
+)
+
+
+def _api(base_url):
+    """Pooled DataMasque client for ``base_url`` (reused across warm invocations)."""
+    return get_client(base_url, verify=verify_tls_from_env())
+
+
+# Cap on run log reads for one finished run (run_log.DEFAULT_MAX_BYTES each).
+MAX_LOG_READS = 64
+
+
+def read_progress(base_url: str, token: dict, run_id: str, output: dict) -> None:
+    """
+    Fold the run log into ``MaskRunProgress`` once the run has ended.
+
+    In callback mode nothing polls the log while the run is going, so this is
+    the only read. A log that cannot be read only leaves the row counts out.
+    """
+    offset = int(output.get("MaskRunLogOffset") or 0)
+    progress = output.get("MaskRunProgress")
+    try:
+        for _ in range(MAX_LOG_READS):
+            lines, new_offset = run_log.fetch_new_lines(_api(base_url), run_id, offset, token)
+            if new_offset == offset:
+                break
+            progress = run_log.update_progress(progress, lines, time.time())
+            offset = new_offset
+    except Exception as e:
+        logger.warning("Could not read the log of run %s: %s", run_id, e)
+        return
+    output["MaskRunLogOffset"] = offset
+    if progress is not None:
+        output["MaskRunProgress"] = progress
+
+
+def is_terminal(status: str) -> bool:
+    return status.startswith("finish") or "fail" in status
+
+
+def resolve(base_url: str, token: dict, run_id: str, record: dict) -> str:
+    """
+    Check one parked run and resume its execution if the run has ended.
+
+    Returns what happened: "running", "finished", "failed", "missing" or "gone"
+    (the waiting execution no longer exists).
+    """
+    dm = _api(base_url)
+    store = get_store()
+    response = dm.get(f"api/runs/{run_id}/", headers=token, name="runs")
+    if response.status_code == 404:
+        logger.error("Masking run %s no longer exists", run_id)
+        sent = callbacks.fail(record["TaskToken"], "MaskRunNotFound", f"MaskRunId {run_id} was not found in DataMasque")
+        store.delete(MASKING_RUN_KIND, run_id)
+        return "missing" if sent else "gone"
+    if response.status_code != 200:
+        logger.warning("Unexpected status %s reading run %s; will retry", response.status_code, run_id)
+        return "running"
+
+    run = response.json()
+    status = run["status"]
+    if not is_terminal(status):
+        return "running"
+
+    output = dict(record["Output"])
+    output["MaskRunStatus"] = status
+    if "fail" in status:
+        output["Error"] = f"MaskRunId {run_id} has failed"
+    else:
+        read_progress(base_url, token, run_id, output)
+        run_options.record_result(output, run)
+    if "fail" not in status and output.get("ConnectionMode") != "upsert":
+        # In upsert mode the temporary connection is kept for the next execution.
+        delete_response = dm.delete(
+            f"api/connections/{run['connection']}/", headers=token, name="delete_connection"
+        )
+        logger.info("Delete connection status: %s", delete_response.status_code)
+
+    sent = callbacks.succeed(record["TaskToken"], output)
+    store.delete(MASKING_RUN_KIND, run_id)
+    logger.info("Masking run %s %s; execution %s", run_id, status, "resumed" if sent else "already gone")
+    return ("finished" if status.startswith("finish") else "failed") if sent else "gone"
+
+
+def lambda_handler(event, context):
+
+    base_url = os.environ["DATAMASQUE_BASE_URL"]  # url of the DataMasque instance
+    datamasque_secret_arn = os.environ["DATAMASQUE_SECRET_ARN"]
+
+    pending = get_store().items(MASKING_RUN_KIND)
+    summary = {"pending": len(pending)}
+    if not pending:
+        return summary
+
+    try:
+        credential = get_secrets_cache().get_secret_json(datamasque_secret_arn)
+        login = _api(base_url).login(credential["username"], credential["password"])
+        token = {"Authorization": "Token " + login["key"]}
+
+        outcomes = {}
+        tasks = {run_id: executor().submit(resolve, base_url, token, run_id, record) for run_id, record in pending}
+        for run_id, task in tasks.items():
+            try:
+                outcome = task.result()
+            except Exception as e:
+                # Leave the run parked; the next scheduled invocation retries it.
+                logger.error("Error checking masking run %s: %s", run_id, e)
+                outcome = "error"
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        summary.update(outcomes)
+        return summary
+
+    finally:
+        logger.info("Watcher summary: %s", json.dumps(summary))
+        dm = _api(base_url)
+        if dm.metrics:
+            logger.info("DataMasque API latency: %s", json.dumps(dm.metrics))
+        dm.reset_metrics()
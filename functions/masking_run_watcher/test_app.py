@@ -0,0 +1,163 @@
+"""
+Unit tests for app.py.
+
+Run from this directory:
+    pytest test_app.py -v
+"""
+import json
+import os
+
+import pytest
+from blueprint_common import callbacks, state_store
+from blueprint_common.datamasque import DataMasqueClient
+
+os.environ.setdefault("DATAMASQUE_BASE_URL", "http://localhost:8080/")
+os.environ.setdefault("DATAMASQUE_SECRET_ARN", "arn:aws:secretsmanager:us-east-1:111111111111:secret:fake-AbCdEf")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import app
+
+
+class _FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload if payload is not None else {}
+
+    def json(self):
+        return self._payload
+
+
+class _FakeLog(_FakeResponse):
+    """A streamed run log served from ``offset`` (a 206 for Range requests)."""
+
+    def __init__(self, text, offset):
+        data = text.encode()[offset:]
+        super().__init__(206 if data else 416)
+        self._data = data
+
+    def iter_content(self):
+        yield self._data
+
+    def close(self):
+        pass
+
+
+class _FakeSecrets:
+    def get_secret_json(self, secret_id):
+        return {"username": "u", "password": "p"}
+
+
+class _FakeStepFunctions:
+    def __init__(self):
+        self.succeeded = {}
+        self.failed = {}
+
+    def send_task_success(self, taskToken, output):
+        self.succeeded[taskToken] = json.loads(output)
+
+    def send_task_failure(self, taskToken, error, cause):
+        self.failed[taskToken] = error
+
+
+@pytest.fixture
+def watcher(monkeypatch):
+    """Scripted DataMasque runs (``runs``) plus a fake Step Functions client."""
+    monkeypatch.delenv("STATE_TABLE_NAME", raising=False)
+    state_store.reset_store()
+    state = {"runs": {}, "logs": {}, "deleted": [], "logins": 0, "sfn": _FakeStepFunctions()}
+
+    def fake_login(self, username, password, force=False):
+        state["logins"] += 1
+        return {"key": "tok"}
+
+    def fake_get(self, api, headers=None, **kwargs):
+        run_id = api.split("/")[2]
+        if api.endswith("/log/"):
+            offset = int(headers["Range"][len("bytes="):-1])
+            return _FakeLog(state["logs"].get(run_id, ""), offset)
+        run = state["runs"].get(run_id)
+        return _FakeResponse(404) if run is None else _FakeResponse(200, run)
+
+    def fake_delete(self, api, headers=None, **kwargs):
+        state["deleted"].append(api)
+        return _FakeResponse(204)
+
+    monkeypatch.setattr(DataMasqueClient, "login", fake_login)
+    monkeypatch.setattr(DataMasqueClient, "get", fake_get)
+    monkeypatch.setattr(DataMasqueClient, "delete", fake_delete)
+    monkeypatch.setattr(app, "get_secrets_cache", lambda: _FakeSecrets())
+    monkeypatch.setattr(callbacks.aws, "client", lambda name: state["sfn"])
+    yield state
+    state_store.reset_store()
+
+
+def _park(run_id, **output):
+    callbacks.register(app.MASKING_RUN_KIND, run_id, f"token-{run_id}", {"MaskRunId": run_id, **output})
+
+
+def test_nothing_pending_skips_login(watcher):
+    assert app.lambda_handler({}, None) == {"pending": 0}
+    assert watcher["logins"] == 0
+
+
+def test_resumes_only_ended_runs(watcher):
+    watcher["runs"] = {
+        "1": {"status": "running", "connection": "c1"},
+        "2": {"status": "finished", "connection": "c2"},
+        "3": {"status": "failed", "connection": "c3"},
+    }
+    for run_id in ("1", "2", "3"):
+        _park(run_id)
+
+    summary = app.lambda_handler({}, None)
+
+    assert summary == {"pending": 3, "running": 1, "finished": 1, "failed": 1}
+    assert watcher["logins"] == 1
+    sfn = watcher["sfn"]
+    assert sfn.succeeded["token-2"]["MaskRunStatus"] == "finished"
+    assert sfn.succeeded["token-3"]["Error"] == "MaskRunId 3 has failed"
+    assert "token-1" not in sfn.succeeded
+    assert watcher["deleted"] == ["api/connections/c2/"]
+    assert [key for key, _ in state_store.get_store().items(app.MASKING_RUN_KIND)] == ["1"]
+
+
+def test_upsert_mode_keeps_connection(watcher):
+    watcher["runs"] = {"1": {"status": "finished_with_warnings", "connection": "c1"}}
+    _park("1", ConnectionMode="upsert")
+
+    app.lambda_handler({}, None)
+
+    assert watcher["sfn"].succeeded["token-1"]["MaskRunStatus"] == "finished_with_warnings"
+    assert watcher["deleted"] == []
+
+
+def test_missing_run_fails_the_task(watcher):
+    _park("9")
+
+    summary = app.lambda_handler({}, None)
+
+    assert summary["missing"] == 1
+    assert watcher["sfn"].failed == {"token-9": "MaskRunNotFound"}
+    assert state_store.get_store().items(app.MASKING_RUN_KIND) == []
+
+
+def test_finished_run_records_rows_from_its_log(watcher):
+    watcher["runs"] = {
+        "1": {
+            "status": "finished",
+            "connection": "c1",
+            "options": {"buffer_size": 5000},
+            "start_time": "2026-10-18T10:00:00+00:00",
+            "end_time": "2026-10-18T10:01:40+00:00",
+        }
+    }
+    watcher["logs"] = {"1": 'Masked 6,000 rows in table "customers"\nMasked 4,000 rows in table "orders"\n'}
+    _park("1", DataMasqueRulesetId="rs-1", Benchmark={"Pending": [], "Results": []})
+
+    app.lambda_handler({}, None)
+
+    output = watcher["sfn"].succeeded["token-1"]
+    assert output["MaskRunProgress"]["rows_masked"] == 10000
+    assert output["Benchmark"]["Results"] == [
+        {"BufferSize": 5000, "Seconds": 100.0, "Rows": 10000, "RowsPerSecond": 100.0}
+    ]
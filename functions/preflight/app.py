@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+
+from blueprint_common import callbacks, polling, rds_events, run_options, snapstart, staging
+from blueprint_common.datamasque import get_client, verify_tls_from_env
+from blueprint_common.db_secret import CONNECTION_MODES, validate_db_secret
+from blueprint_common.secrets_cache import get_secrets_cache
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# DATAMASQUE_BASE_URL / DATAMASQUE_SECRET_ARN / DATAMASQUE_VERIFY_TLS are read
+# in the handler rather than at import.
+
+# Builds the Secrets Manager client and DataMasque connection pools during a
+# SnapStart init; no-op otherwise.
+snapstart.init({"secretsmanager": ["GetSecretValue"]}, datamasque_pool=True)
+
+
+def _api(base_url):
+    """Pooled DataMasque client for ``base_url`` (reused across warm invocations)."""
+    return get_client(base_url, verify=verify_tls_from_env())
+
+
+def _redacted_event(event):
+    """Copy of the event with sensitive run-secret fields masked for logging."""
+    redacted = dict(event)
+    for key in ("RunSecret", "AwsSecretArn"):
+        if key in redacted:
+            redacted[key] = "***redacted***"
+    return redacted
+
+
+def check_db_secret(secret_id: str) -> str | None:
+    """Return why the DB connection secret is unusable, or None if it is fine."""
+    from botocore.exceptions import ClientError
+
+    try:
+        response = get_secrets_cache().get_secret_value(SecretId=secret_id)
+    except ClientError as e:
+        return f"Cannot read DBSecretIdentifier {secret_id}: {e.response.get('Error', {}).get('Code')}"
+    try:
+        secret = json.loads(response.get("SecretString") or "")
+    except ValueError:
+        return f"DBSecretIdentifier {secret_id} is not a JSON SecretString"
+    if not isinstance(secret, dict):
+        return f"DBSecretIdentifier {secret_id} is not a JSON object"
+    return validate_db_secret(secret)
+
+
+def check_ruleset(base_url: str, token: dict, ruleset_id: str) -> str | None:
+    """
+    Return why the ruleset cannot be used for a run, or None if it can.
+
+    full_url = 'https://masque.local/api/rulesets/<ruleset_id>/'
+    method = 'GET'
+
+    status_code[200] == Success, with 'is_valid' false for a ruleset whose
+    YAML does not validate.
+    """
+    response = _api(base_url).get(f"api/rulesets/{ruleset_id}/", headers=token, name="rulesets")
+    logger.info("Get ruleset status: %s", response.status_code)
+    if response.status_code == 404:
+        return f"DataMasque ruleset {ruleset_id} does not exist"
+    if response.status_code != 200:
+        return f"Unexpected status code reading ruleset {ruleset_id}: {response.status_code}"
+    ruleset = response.json()
+    if not ruleset.get("is_valid", True):
+        return f"DataMasque ruleset {ruleset.get('name', ruleset_id)} is not valid"
+    return None
+
+
+def preflight(base_url: str, credential: dict, event: dict) -> list:
+    """Run every check and return the list of problems found (empty if none)."""
+    errors = []
+    for key in ("DataMasqueRulesetId", "DBSecretIdentifier"):
+        if not event.get(key):
+            errors.append(f"Missing required input {key}")
+    if event.get("PollMode", "state_machine") not in polling.POLL_MODES:
+        errors.append(f"PollMode must be one of {list(polling.POLL_MODES)}")
+    if event.get("CompletionMode", "poll") not in callbacks.COMPLETION_MODES:
+        errors.append(f"CompletionMode must be one of {list(callbacks.COMPLETION_MODES)}")
+    if (event.get("ConnectionMode") or "recreate") not in CONNECTION_MODES:
+        errors.append(f"ConnectionMode must be one of {list(CONNECTION_MODES)}")
+    if event.get("RdsWaitMode", "poll") not in rds_events.RDS_WAIT_MODES:
+        errors.append(f"RdsWaitMode must be one of {list(rds_events.RDS_WAIT_MODES)}")
+    if event.get("StagingMode", "restore") not in staging.STAGING_MODES:
+        errors.append(f"StagingMode must be one of {list(staging.STAGING_MODES)}")
+    if event.get("StagingProfile", "source") not in staging.STAGING_PROFILES:
+        errors.append(f"StagingProfile must be one of {list(staging.STAGING_PROFILES)}")
+    errors.extend(staging.override_errors(event.get("StagingInstance")))
+    if not isinstance(event.get("WriteOptimizedStaging", True), bool):
+        errors.append("WriteOptimizedStaging must be true or false")
+    if not isinstance(event.get("HydrateStagingDB", False), bool):
+        errors.append("HydrateStagingDB must be true or false")
+    for key in ("HydrateWorkers", "HydrateMaxPasses"):
+        value = event.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+            errors.append(f"{key} must be a positive integer")
+    errors.extend(run_options.option_errors(event.get("RunOptions")))
+    sizes = event.get("BenchmarkBufferSizes")
+    if sizes is not None and (
+        not isinstance(sizes, list)
+        or not sizes
+        or not all(isinstance(size, int) and not isinstance(size, bool) and size > 0 for size in sizes)
+    ):
+        errors.append("BenchmarkBufferSizes must be a list of positive integers")
+    tables = event.get("HydrateTables")
+    if tables is not None and (not isinstance(tables, list) or not all(isinstance(t, str) and t for t in tables)):
+        errors.append("HydrateTables must be a list of table names")
+    max_age = event.get("MaxSnapshotAgeHours")
+    if max_age is not None and (isinstance(max_age, bool) or not isinstance(max_age, (int, float)) or max_age <= 0):
+        errors.append("MaxSnapshotAgeHours must be a positive number of hours")
+    if event.get("DBSecretIdentifier"):
+        secret_error = check_db_secret(event["DBSecretIdentifier"])
+        if secret_error:
+            errors.append(secret_error)
+
+    try:
+        login = _api(base_url).login(credential["username"], credential["password"])
+    except Exception as e:
+        errors.append(f"DataMasque instance unreachable: {e}")
+        return errors
+    if "key" not in login:
+        errors.append("DataMasque login failed, please verify the DataMasque credentials secret")
+        return errors
+
+    if event.get("DataMasqueRulesetId"):
+        token = {"Authorization": "Token " + login["key"]}
+        ruleset_error = check_ruleset(base_url, token, event["DataMasqueRulesetId"])
+        if ruleset_error:
+            errors.append(ruleset_error)
+    return errors
+
+
+def _log_api_metrics(base_url):
+    """Log and reset the per-call DataMasque latency counters for this invocation."""
+    dm = _api(base_url)
+    if dm.metrics:
+        logger.info("DataMasque API latency: %s", json.dumps(dm.metrics))
+    dm.reset_metrics()
+
+
+def lambda_handler(event, context):
+
+    logger.info("Event: %s", json.dumps(_redacted_event(event)))
+
+    base_url = os.environ["DATAMASQUE_BASE_URL"]  # url of the DataMasque instance
+    datamasque_secret_arn = os.environ["DATAMASQUE_SECRET_ARN"]
+
+    try:
+        datamasque_credential = get_secrets_cache().get_secret_json(datamasque_secret_arn)
+        errors = preflight(base_url, datamasque_credential, event)
+    except Exception as e:
+        errors = [f"Preflight check failed: {e}"]
+    finally:
+        _log_api_metrics(base_url)
+
+    if errors:
+        logger.error("Preflight failed: %s", errors)
+        event["PreflightStatus"] = "failed"
+        event["Error"] = "; ".join(errors)
+    else:
+        event["PreflightStatus"] = "passed"
+    logger.info("Result event: %s", json.dumps(_redacted_event(event)))
+    return event
@@ -0,0 +1,206 @@
+"""
+Unit tests for the preflight checks in app.py.
+
+Run from this directory:
+    pytest test_app.py -v
+"""
+import json
+import os
+
+import pytest
+from blueprint_common.datamasque import DataMasqueClient
+from botocore.exceptions import ClientError
+
+os.environ.setdefault("DATAMASQUE_BASE_URL", "http://localhost:8080/")
+os.environ.setdefault("DATAMASQUE_SECRET_ARN", "arn:aws:secretsmanager:us-east-1:111111111111:secret:fake-AbCdEf")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import app
+
+DB_SECRET = {
+    "username": "appuser",
+    "password": "s3cr3t",
+    "engine": "postgres",
+    "host": "mydb.cluster-abc.ap-southeast-2.rds.amazonaws.com",
+    "port": "5432",
+    "dbname": "appdb",
+    "schema": "public",
+}
+
+
+class _FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload if payload is not None else {}
+
+    def json(self):
+        return self._payload
+
+
+class _FakeSecrets:
+    def __init__(self, secrets):
+        self.secrets = secrets
+
+    def get_secret_value(self, SecretId):
+        if SecretId not in self.secrets:
+            raise ClientError({"Error": {"Code": "ResourceNotFoundException"}}, "GetSecretValue")
+        return {"SecretString": self.secrets[SecretId]}
+
+    def get_secret_json(self, secret_id):
+        return json.loads(self.get_secret_value(SecretId=secret_id)["SecretString"])
+
+
+@pytest.fixture
+def datamasque(monkeypatch):
+    """Scripted DataMasque: set ``login`` / ``ruleset`` / ``ruleset_status``."""
+    state = {"login": {"key": "tok"}, "ruleset": {"id": "rs-1", "name": "rs", "is_valid": True}, "ruleset_status": 200}
+    secrets = _FakeSecrets(
+        {
+            os.environ["DATAMASQUE_SECRET_ARN"]: json.dumps({"username": "u", "password": "p"}),
+            "datamasque/app-connections": json.dumps(DB_SECRET),
+        }
+    )
+
+    def fake_login(self, username, password, force=False):
+        if isinstance(state["login"], Exception):
+            raise state["login"]
+        return state["login"]
+
+    def fake_get(self, api, headers=None, **kwargs):
+        state["ruleset_api"] = api
+        return _FakeResponse(state["ruleset_status"], state["ruleset"])
+
+    monkeypatch.setattr(DataMasqueClient, "login", fake_login)
+    monkeypatch.setattr(DataMasqueClient, "get", fake_get)
+    monkeypatch.setattr(app, "get_secrets_cache", lambda: secrets)
+    state["secrets"] = secrets.secrets
+    return state
+
+
+def _event(**overrides):
+    event = {
+        "DBInstanceIdentifier": "src",
+        "DataMasqueRulesetId": "rs-1",
+        "DBSecretIdentifier": "datamasque/app-connections",
+    }
+    event.update(overrides)
+    return event
+
+
+def test_preflight_passes(datamasque):
+    result = app.lambda_handler(_event(), None)
+
+    assert result["PreflightStatus"] == "passed"
+    assert "Error" not in result
+    assert datamasque["ruleset_api"] == "api/rulesets/rs-1/"
+
+
+@pytest.mark.parametrize(
+    "ruleset_status, ruleset, message",
+    [
+        (404, {"detail": "Not found."}, "does not exist"),
+        (200, {"id": "rs-1", "name": "rs", "is_valid": False}, "rs is not valid"),
+        (500, {}, "Unexpected status code"),
+    ],
+)
+def test_preflight_rejects_unusable_ruleset(datamasque, ruleset_status, ruleset, message):
+    datamasque["ruleset_status"], datamasque["ruleset"] = ruleset_status, ruleset
+
+    result = app.lambda_handler(_event(), None)
+
+    assert result["PreflightStatus"] == "failed"
+    assert message in result["Error"]
+
+
+@pytest.mark.parametrize(
+    "secret, message",
+    [
+        ({k: v for k, v in DB_SECRET.items() if k != "schema"}, "Missing required parameters"),
+        ({**DB_SECRET, "engine": "db2"}, "Invalid value for engine"),
+        ("not json", "not a JSON SecretString"),
+        (None, "ResourceNotFoundException"),
+    ],
+)
+def test_preflight_rejects_bad_db_secret(datamasque, secret, message):
+    if secret is None:
+        del datamasque["secrets"]["datamasque/app-connections"]
+    else:
+        datamasque["secrets"]["datamasque/app-connections"] = secret if isinstance(secret, str) else json.dumps(secret)
+
+    result = app.lambda_handler(_event(), None)
+
+    assert result["PreflightStatus"] == "failed"
+    assert message in result["Error"]
+
+
+@pytest.mark.parametrize(
+    "login, message",
+    [
+        ({"non_field_errors": ["Unable to log in"]}, "login failed"),
+        (ConnectionError("refused"), "unreachable"),
+    ],
+)
+def test_preflight_rejects_failed_login(datamasque, login, message):
+    datamasque["login"] = login
+
+    result = app.lambda_handler(_event(), None)
+
+    assert result["PreflightStatus"] == "failed"
+    assert message in result["Error"]
+    assert "ruleset_api" not in datamasque
+
+
+def test_preflight_reports_every_problem(datamasque):
+    datamasque["ruleset_status"] = 404
+
+    result = app.lambda_handler(_event(DBSecretIdentifier=""), None)
+
+    assert result["Error"] == "Missing required input DBSecretIdentifier; DataMasque ruleset rs-1 does not exist"
+
+
+def test_preflight_rejects_unknown_poll_mode(datamasque):
+    result = app.lambda_handler(_event(PollMode="sometimes"), None)
+
+    assert result["PreflightStatus"] == "failed"
+    assert "PollMode must be one of" in result["Error"]
+
+
+@pytest.mark.parametrize("key", ["CompletionMode", "ConnectionMode", "RdsWaitMode", "StagingMode", "StagingProfile"])
+def test_preflight_rejects_unknown_wait_mode(datamasque, key):
+    result = app.lambda_handler(_event(**{key: "webhook"}), None)
+
+    assert result["PreflightStatus"] == "failed"
+    assert f"{key} must be one of" in result["Error"]
+
+
+@pytest.mark.parametrize("max_age", [0, -1, "24", True])
+def test_preflight_rejects_bad_max_snapshot_age(datamasque, max_age):
+    result = app.lambda_handler(_event(MaxSnapshotAgeHours=max_age), None)
+
+    assert result["PreflightStatus"] == "failed"
+    assert "MaxSnapshotAgeHours must be a positive number" in result["Error"]
+
+
+def test_preflight_rejects_bad_staging_instance(datamasque):
+    result = app.lambda_handler(_event(StagingInstance={"Iops": -1, "Storage": "gp3"}), None)
+
+    assert result["PreflightStatus"] == "failed"
+    assert "StagingInstance Iops must be a positive number" in result["Error"]
+    assert "Unknown StagingInstance key Storage" in result["Error"]
+
+
+@pytest.mark.parametrize(
+    "inputs, message",
+    [
+        ({"HydrateStagingDB": "yes"}, "HydrateStagingDB must be true or false"),
+        ({"HydrateWorkers": 0}, "HydrateWorkers must be a positive integer"),
+        ({"HydrateTables": "customers"}, "HydrateTables must be a list of table names"),
+        ({"RunOptions": {"buffer_size": -5}}, "RunOptions buffer_size must be a positive integer"),
+        ({"BenchmarkBufferSizes": [5000, "big"]}, "BenchmarkBufferSizes must be a list of positive integers"),
+    ],
+)
+def test_preflight_rejects_bad_tuning_inputs(datamasque, inputs, message):
+    result = app.lambda_handler(_event(**inputs), None)
+
+    assert result["PreflightStatus"] == "failed"
+    assert message in result["Error"]
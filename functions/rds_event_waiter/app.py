@@ -0,0 +1,36 @@
+import json
+
+from blueprint_common import rds_events, snapstart
+
+"""
+Event-driven RDS waits ("RdsWaitMode": "event").
+
+Invoked two ways:
+- by the state machine through lambda:invoke.waitForTaskToken with
+  {"Input": <execution state>, "TaskToken": ..., "Wait": <wait>}: parks the
+  token on the RDS identifiers the wait is for;
+- by the EventBridge rule for RDS snapshot, instance and cluster events:
+  resumes every execution parked on the event's SourceIdentifier.
+"""
+
+# Builds and loads the Step Functions client during a SnapStart init; no-op otherwise.
+snapstart.init({"stepfunctions": ["SendTaskSuccess"]})
+
+
+def lambda_handler(event, context):
+
+    if "TaskToken" in event:
+        state = event["Input"]
+        targets = rds_events.wait_targets(event["Wait"], state)
+        rds_events.park(targets, event["TaskToken"], event["Wait"])
+        print(f"Waiting for an RDS event for {', '.join(targets)} ({event['Wait']})")
+        return {"Parked": targets}
+
+    parsed = rds_events.parse(event)
+    if parsed is None:
+        print(f"Ignoring event: {json.dumps(event)}")
+        return {"Resumed": 0}
+    identifier, summary = parsed
+    resumed = rds_events.resume(identifier, summary)
+    print(f"{identifier}: {summary.get('EventID')} {summary.get('Message')} -> resumed {resumed}")
+    return {"Resumed": resumed}
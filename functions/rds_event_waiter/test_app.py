@@ -0,0 +1,72 @@
+"""
+Unit tests for app.py.
+
+Run from this directory:
+    pytest test_app.py -v
+"""
+import json
+import os
+
+import pytest
+from blueprint_common import callbacks, state_store
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import app
+
+
+class _FakeStepFunctions:
+    def __init__(self):
+        self.succeeded = {}
+
+    def send_task_success(self, taskToken, output):
+        self.succeeded[taskToken] = json.loads(output)
+
+
+@pytest.fixture
+def sfn(monkeypatch):
+    monkeypatch.delenv("STATE_TABLE_NAME", raising=False)
+    state_store.reset_store()
+    fake = _FakeStepFunctions()
+    monkeypatch.setattr(callbacks.aws, "client", lambda name: fake)
+    yield fake
+    state_store.reset_store()
+
+
+def _rds_event(identifier, detail_type="RDS DB Cluster Event", event_id="RDS-EVENT-0170"):
+    return {
+        "source": "aws.rds",
+        "detail-type": detail_type,
+        "detail": {"EventID": event_id, "Message": "DB cluster created", "SourceIdentifier": identifier},
+    }
+
+
+def _park(wait, state, token="tok"):
+    return app.lambda_handler({"Input": state, "TaskToken": token, "Wait": wait}, None)
+
+
+def test_parks_the_token_on_the_wait_target(sfn):
+    assert _park("source_snapshot", {"DBSnapshotIdentifier": "snap"}) == {"Parked": ["snap"]}
+    assert sfn.succeeded == {}
+
+
+@pytest.mark.parametrize("identifier", ["stg", "stg-writer"])
+def test_aurora_availability_is_resumed_by_the_cluster_or_the_writer(sfn, identifier):
+    _park("db_availability", {"StageDB": "stg", "StgDbInstanceId": "stg-writer"})
+
+    assert app.lambda_handler(_rds_event(identifier), None) == {"Resumed": 1}
+    assert sfn.succeeded == {"tok": {"EventID": "RDS-EVENT-0170", "Message": "DB cluster created"}}
+
+    # The token is spent on both identifiers.
+    assert app.lambda_handler(_rds_event("stg"), None) == {"Resumed": 0}
+    assert app.lambda_handler(_rds_event("stg-writer"), None) == {"Resumed": 0}
+
+
+def test_events_for_other_identifiers_leave_the_token_parked(sfn):
+    _park("masked_snapshot", {"MaskedDBSnapshotIdentifier": "masked"})
+
+    assert app.lambda_handler(_rds_event("unrelated", "RDS DB Snapshot Event"), None) == {"Resumed": 0}
+    assert app.lambda_handler({"source": "aws.ec2", "detail-type": "EC2 Event", "detail": {}}, None) == {"Resumed": 0}
+    assert sfn.succeeded == {}
+
+    assert app.lambda_handler(_rds_event("masked", "RDS DB Snapshot Event"), None) == {"Resumed": 1}
@@ -0,0 +1,30 @@
+import json
+
+from blueprint_common import rds, rds_status, snapstart
+
+"""
+Resolves the status of every RDS resource a check is waiting on in a few
+batched describe calls and publishes it to the RDS status cache.
+
+Runs on a schedule; see blueprint_common/rds_status.py.
+"""
+
+# Builds and loads the RDS client during a SnapStart init; no-op otherwise.
+snapstart.init(
+    {
+        "rds": [
+            "DescribeDBInstances",
+            "DescribeDBClusters",
+            "DescribeDBSnapshots",
+            "DescribeDBClusterSnapshots",
+        ]
+    }
+)
+
+
+@rds.handler
+def lambda_handler(event, context):
+
+    calls = rds_status.poll(rds.client())
+    print(f"Describe calls by resource type: {json.dumps(calls)}")
+    return {"DescribeCalls": calls}
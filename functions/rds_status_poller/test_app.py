@@ -0,0 +1,74 @@
+"""
+Unit tests for app.py.
+
+Run from this directory:
+    pytest test_app.py -v
+"""
+import os
+
+import boto3
+import pytest
+from blueprint_common import rds_status, state_store
+from botocore.stub import Stubber
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import app
+
+
+@pytest.fixture
+def rds_client(monkeypatch):
+    monkeypatch.delenv("STATE_TABLE_NAME", raising=False)
+    state_store.reset_store()
+    client = boto3.client("rds", region_name="us-east-1")
+    monkeypatch.setattr(app.rds, "client", lambda: client)
+    yield client
+    state_store.reset_store()
+
+
+def _instance(identifier, status):
+    return {"DBInstanceIdentifier": identifier, "DBInstanceStatus": status}
+
+
+def test_handler_batches_watched_identifiers_and_publishes_statuses(rds_client):
+    instances = [f"stg-{n:02d}" for n in range(rds_status.BATCH_SIZE + 1)]
+    for identifier in instances:
+        rds_status.watch("db-instance", identifier)
+    rds_status.watch("snapshot", "masked-snap")
+
+    with Stubber(rds_client) as stubber:
+        stubber.add_response(
+            "describe_db_instances",
+            {"DBInstances": [_instance(identifier, "Available") for identifier in instances[:-1]]},
+            {"Filters": [{"Name": "db-instance-id", "Values": instances[:-1]}]},
+        )
+        stubber.add_response(
+            "describe_db_instances",
+            {"DBInstances": [_instance(instances[-1], "creating")]},
+            {"Filters": [{"Name": "db-instance-id", "Values": instances[-1:]}]},
+        )
+        stubber.add_response(
+            "describe_db_snapshots",
+            {"DBSnapshots": [{"DBSnapshotIdentifier": "masked-snap", "Status": "creating", "PercentProgress": 40}]},
+            {"Filters": [{"Name": "db-snapshot-id", "Values": ["masked-snap"]}]},
+        )
+
+        result = app.lambda_handler({}, None)
+
+        stubber.assert_no_pending_responses()
+
+    assert result == {"DescribeCalls": {"db-instance": 2, "snapshot": 1}}
+    assert rds_status.read("db-instance", "stg-00")["Status"] == "available"
+    assert rds_status.read("db-instance", instances[-1])["Status"] == "creating"
+    assert rds_status.read("snapshot", "masked-snap")["PercentProgress"] == 40
+
+
+def test_handler_leaves_identifiers_rds_does_not_return_unpublished(rds_client):
+    rds_status.watch("db-cluster", "gone")
+
+    with Stubber(rds_client) as stubber:
+        stubber.add_response("describe_db_clusters", {"DBClusters": []})
+
+        assert app.lambda_handler({}, None) == {"DescribeCalls": {"db-cluster": 1}}
+
+    assert rds_status.read("db-cluster", "gone") is None
@@ -1,23 +1,44 @@
 import logging
 import os
 
-import boto3
+from blueprint_common import rds, rds_status, snapstart, staging
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Builds and loads the RDS client during a SnapStart init; no-op otherwise.
+snapstart.init(
+    {
+        "rds": [
+            "RestoreDBInstanceFromDBSnapshot",
+            "RestoreDBClusterFromSnapshot",
+            "RestoreDBInstanceToPointInTime",
+            "RestoreDBClusterToPointInTime",
+            "CreateDBInstance",
+            "DescribeDBParameterGroups",
+            "CreateDBParameterGroup",
+            "CopyDBParameterGroup",
+            "ModifyDBParameterGroup",
+        ]
+    }
+)
 
+
+@rds.handler
 def lambda_handler(event, context):
 
-    client = boto3.client("rds")
+    client = rds.client()
     vpc_sg = os.environ["DATAMASQUE_SG"]
 
     try:
+        point_in_time = event.get("RestoreSource") == "point_in_time"
+        clone = event.get("RestoreSource") == "clone"
+        # Restore to the time DescribeDBSnapshots recorded (and reported as
+        # SourceRestoreTime); a clone has none and takes the latest.
+        source_restore_time = event.get("SourceRestoreTime") if point_in_time else None
         if event["DBType"] == "RDS":
             params = event["parameters"]
             restore_kwargs = {
-                "DBSnapshotIdentifier": params["DBSnapshotIdentifier"],
-                "DBInstanceIdentifier": params["DBInstanceIdentifier"],
                 "DBInstanceClass": params["DBInstanceClass"],
                 # PreferredAZ is optional: describe_db_instances already resolved
                 # AvailabilityZone to the source AZ when it was not supplied.
@@ -32,28 +53,108 @@ def lambda_handler(event, context):
                 restore_kwargs["OptionGroupName"] = params["OptionGroupName"]
             if params.get("DBParameterGroupName"):
                 restore_kwargs["DBParameterGroupName"] = params["DBParameterGroupName"]
+            if staging.write_optimized(event):
+                # Throwaway copy: no standby, no automated backups, and relaxed
+                # commit/flush settings where the engine has them.
+                restore_kwargs["MultiAZ"] = False
+                restore_kwargs["BackupRetentionPeriod"] = 0
+                group = staging.staging_parameter_group(client, params.get("DBParameterGroupName"))
+                if group:
+                    restore_kwargs["DBParameterGroupName"] = group
+                    params["DBParameterGroupName"] = group
+            # Storage from the staging profile; absent, the restore keeps the
+            # snapshot's (or source's) storage settings.
+            for key in ("StorageType", "Iops", "StorageThroughput"):
+                if params.get(key):
+                    restore_kwargs[key] = params[key]
 
-            # Restore an RDS instance from a snapshot
-            restore_response = client.restore_db_instance_from_db_snapshot(**restore_kwargs)
+            if point_in_time:
+                # Restore an RDS instance to the recorded (or latest) restorable time
+                restore_time = (
+                    {"RestoreTime": source_restore_time}
+                    if source_restore_time
+                    else {"UseLatestRestorableTime": True}
+                )
+                restore_response = client.restore_db_instance_to_point_in_time(
+                    SourceDBInstanceIdentifier=event["DBInstanceIdentifier"],
+                    TargetDBInstanceIdentifier=params["DBInstanceIdentifier"],
+                    **restore_time,
+                    **restore_kwargs,
+                )
+            else:
+                # Restore an RDS instance from a snapshot
+                restore_response = client.restore_db_instance_from_db_snapshot(
+                    DBSnapshotIdentifier=params["DBSnapshotIdentifier"],
+                    DBInstanceIdentifier=params["DBInstanceIdentifier"],
+                    **restore_kwargs,
+                )
             event["status"] = "success"
             event["StageDB"] = event["parameters"]["DBInstanceIdentifier"]
+            rds_status.watch("db-instance", event["StageDB"])
             logger.info("RDS instance restore initiated: %s", restore_response.get("DBInstance", {}).get("DBInstanceIdentifier"))
 
         elif event["DBType"] == "Aurora":
-            # Restore an Aurora cluster from a snapshot
-            restore_response = client.restore_db_cluster_from_snapshot(
-                SnapshotIdentifier=event["parameters"]["DBSnapshotIdentifier"],
-                DBClusterIdentifier=event["parameters"]["DBInstanceIdentifier"],
-                Engine=event["parameters"]["Engine"],
-                EngineMode=event["parameters"]["EngineMode"],
-                DBSubnetGroupName=event["parameters"]["DBSubnetGroupName"],
-                VpcSecurityGroupIds=[vpc_sg],
-                DeletionProtection=False,
-            )
+            cluster_kwargs = {}
+            if event["parameters"].get("ServerlessV2ScalingConfiguration"):
+                cluster_kwargs["ServerlessV2ScalingConfiguration"] = event["parameters"][
+                    "ServerlessV2ScalingConfiguration"
+                ]
+            if event["parameters"].get("StorageType"):
+                # e.g. "aurora-iopt1" (I/O-Optimized) from StagingInstance
+                cluster_kwargs["StorageType"] = event["parameters"]["StorageType"]
+            if staging.write_optimized(event):
+                # Aurora cannot turn automated backups off; keep the minimum.
+                cluster_kwargs["BackupRetentionPeriod"] = 1
+            if point_in_time or clone:
+                # Restore an Aurora cluster to the recorded (or latest)
+                # restorable time, as a full copy or (StagingMode "clone") a
+                # copy-on-write clone sharing the source's storage.
+                restore_time = (
+                    {"RestoreToTime": source_restore_time}
+                    if source_restore_time
+                    else {"UseLatestRestorableTime": True}
+                )
+                restore_response = client.restore_db_cluster_to_point_in_time(
+                    SourceDBClusterIdentifier=event["DBInstanceIdentifier"],
+                    DBClusterIdentifier=event["parameters"]["DBInstanceIdentifier"],
+                    RestoreType="copy-on-write" if clone else "full-copy",
+                    **restore_time,
+                    DBSubnetGroupName=event["parameters"]["DBSubnetGroupName"],
+                    VpcSecurityGroupIds=[vpc_sg],
+                    DeletionProtection=False,
+                    **cluster_kwargs,
+                )
+            else:
+                # Restore an Aurora cluster from a snapshot
+                restore_response = client.restore_db_cluster_from_snapshot(
+                    SnapshotIdentifier=event["parameters"]["DBSnapshotIdentifier"],
+                    DBClusterIdentifier=event["parameters"]["DBInstanceIdentifier"],
+                    Engine=event["parameters"]["Engine"],
+                    EngineMode=event["parameters"]["EngineMode"],
+                    DBSubnetGroupName=event["parameters"]["DBSubnetGroupName"],
+                    VpcSecurityGroupIds=[vpc_sg],
+                    DeletionProtection=False,
+                    **cluster_kwargs,
+                )
             event["status"] = "success"
             event["StageDB"] = event["parameters"]["DBInstanceIdentifier"]
+            rds_status.watch("db-cluster", event["StageDB"])
             logger.info("Aurora cluster restore initiated: %s", restore_response.get("DBCluster", {}).get("DBClusterIdentifier"))
 
+            # Add the writer instance now rather than after the cluster is
+            # available, so both are created in parallel. If RDS refuses it
+            # this early (throttling included: retrying the task would restore
+            # the cluster again), CheckDBAvailability adds it once the cluster
+            # is up.
+            try:
+                client.create_db_instance(**staging.writer_instance_params(event))
+                event["StgDbInstanceId"] = staging.writer_instance_id(event)
+                event["StgDbInstanceStatus"] = "creating"
+                rds_status.watch("db-instance", event["StgDbInstanceId"])
+                logger.info("Aurora writer instance creation initiated: %s", event["StgDbInstanceId"])
+            except Exception as e:
+                logger.warning("Could not create the writer instance yet: %s", e)
+
         else:
             raise ValueError(
                 f"Invalid DBType '{event['DBType']}'. Expected 'RDS' or 'Aurora'."
@@ -62,6 +163,9 @@ def lambda_handler(event, context):
         return event
 
     except Exception as e:
+        # Throttling that outlasted the retries is not a failure of the
+        # workflow; the state machine retries the task.
+        rds.raise_if_throttled(e)
         logger.error("Error restoring snapshot: %s", e)
         # Preserve DBType/StageDB so the failure-cleanup routing can run.
         event["status"] = "failure"
@@ -0,0 +1,284 @@
+"""
+Unit tests for app.py.
+
+Run from this directory:
+    pytest test_app.py -v
+"""
+import os
+
+import boto3
+import pytest
+from blueprint_common import rds_status, state_store
+from botocore.stub import Stubber
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("DATAMASQUE_SG", "sg-0datamasque")
+
+import app
+
+RESTORE_TIME = "2026-10-18T09:55:00+00:00"
+
+
+@pytest.fixture
+def stubber(monkeypatch):
+    monkeypatch.delenv("STATE_TABLE_NAME", raising=False)
+    state_store.reset_store()
+    client = boto3.client("rds", region_name="us-east-1")
+    monkeypatch.setattr(app.rds, "client", lambda: client)
+    with Stubber(client) as stub:
+        yield stub
+        stub.assert_no_pending_responses()
+    state_store.reset_store()
+
+
+def _rds_event(**extra):
+    return {
+        "DBInstanceIdentifier": "prod",
+        "DBType": "RDS",
+        "WriteOptimizedStaging": False,
+        "parameters": {
+            "DBInstanceIdentifier": "prod-datamasque",
+            "DBSnapshotIdentifier": "prod-snap",
+            "DBInstanceClass": "db.m6g.large",
+            "AvailabilityZone": "us-east-1a",
+            "DBSubnetGroupName": "private",
+            "DeletionProtection": False,
+        },
+        **extra,
+    }
+
+
+def _aurora_event(**extra):
+    return {
+        "DBInstanceIdentifier": "prod-cluster",
+        "DBType": "Aurora",
+        "WriteOptimizedStaging": False,
+        "parameters": {
+            "DBInstanceIdentifier": "prod-cluster-datamasque",
+            "DBSnapshotIdentifier": "prod-cluster-snap",
+            "DBInstanceClass": "db.r6g.large",
+            "Engine": "aurora-postgresql",
+            "EngineMode": "provisioned",
+            "DBSubnetGroupName": "private",
+        },
+        **extra,
+    }
+
+
+def _expect_writer(stubber):
+    stubber.add_response(
+        "create_db_instance",
+        {"DBInstance": {"DBInstanceIdentifier": "prod-cluster-datamasque-1"}},
+        {
+            "DBInstanceIdentifier": "prod-cluster-datamasque-1",
+            "DBClusterIdentifier": "prod-cluster-datamasque",
+            "DBInstanceClass": "db.r6g.large",
+            "Engine": "aurora-postgresql",
+            "DBSubnetGroupName": "private",
+        },
+    )
+
+
+def _rds_restore_kwargs(**extra):
+    return {
+        "DBInstanceClass": "db.m6g.large",
+        "AvailabilityZone": "us-east-1a",
+        "DBSubnetGroupName": "private",
+        "VpcSecurityGroupIds": ["sg-0datamasque"],
+        "DeletionProtection": False,
+        **extra,
+    }
+
+
+def _cluster_restore_kwargs(restore_type, **extra):
+    return {
+        "SourceDBClusterIdentifier": "prod-cluster",
+        "DBClusterIdentifier": "prod-cluster-datamasque",
+        "RestoreType": restore_type,
+        "DBSubnetGroupName": "private",
+        "VpcSecurityGroupIds": ["sg-0datamasque"],
+        "DeletionProtection": False,
+        **extra,
+    }
+
+
+@pytest.mark.parametrize(
+    "extra, restore_time",
+    [
+        ({"SourceRestoreTime": RESTORE_TIME}, {"RestoreTime": RESTORE_TIME}),
+        ({}, {"UseLatestRestorableTime": True}),
+    ],
+)
+def test_rds_point_in_time_restore(stubber, extra, restore_time):
+    stubber.add_response(
+        "restore_db_instance_to_point_in_time",
+        {"DBInstance": {"DBInstanceIdentifier": "prod-datamasque"}},
+        {
+            "SourceDBInstanceIdentifier": "prod",
+            "TargetDBInstanceIdentifier": "prod-datamasque",
+            **restore_time,
+            **_rds_restore_kwargs(),
+        },
+    )
+
+    result = app.lambda_handler(_rds_event(RestoreSource="point_in_time", **extra), None)
+
+    assert (result["status"], result["StageDB"]) == ("success", "prod-datamasque")
+
+
+@pytest.mark.parametrize(
+    "extra, restore_time",
+    [
+        ({"SourceRestoreTime": RESTORE_TIME}, {"RestoreToTime": RESTORE_TIME}),
+        ({}, {"UseLatestRestorableTime": True}),
+    ],
+)
+def test_aurora_point_in_time_restore_is_a_full_copy(stubber, extra, restore_time):
+    stubber.add_response(
+        "restore_db_cluster_to_point_in_time",
+        {"DBCluster": {"DBClusterIdentifier": "prod-cluster-datamasque"}},
+        _cluster_restore_kwargs("full-copy", **restore_time),
+    )
+    _expect_writer(stubber)
+
+    result = app.lambda_handler(_aurora_event(RestoreSource="point_in_time", **extra), None)
+
+    assert (result["status"], result["StageDB"]) == ("success", "prod-cluster-datamasque")
+
+
+def test_snapshot_restore_ignores_a_restore_time(stubber):
+    stubber.add_response(
+        "restore_db_instance_from_db_snapshot",
+        {"DBInstance": {"DBInstanceIdentifier": "prod-datamasque"}},
+        {"DBSnapshotIdentifier": "prod-snap", "DBInstanceIdentifier": "prod-datamasque", **_rds_restore_kwargs()},
+    )
+
+    result = app.lambda_handler(_rds_event(RestoreSource="snapshot", SourceRestoreTime=RESTORE_TIME), None)
+
+    assert result["status"] == "success"
+
+
+def test_restore_error_is_reported_for_cleanup(stubber):
+    stubber.add_client_error("restore_db_instance_to_point_in_time", "InvalidRestoreFault")
+
+    result = app.lambda_handler(_rds_event(RestoreSource="point_in_time"), None)
+
+    assert result["status"] == "failure"
+    assert "InvalidRestoreFault" in result["Error"]
+    assert result["StageDB"] == "prod-datamasque"
+
+
+def test_clone_restores_copy_on_write_from_the_latest_time(stubber):
+    stubber.add_response(
+        "restore_db_cluster_to_point_in_time",
+        {"DBCluster": {"DBClusterIdentifier": "prod-cluster-datamasque"}},
+        _cluster_restore_kwargs("copy-on-write", UseLatestRestorableTime=True),
+    )
+    _expect_writer(stubber)
+
+    result = app.lambda_handler(_aurora_event(StagingMode="clone", RestoreSource="clone"), None)
+
+    assert (result["status"], result["StageDB"]) == ("success", "prod-cluster-datamasque")
+
+
+def test_aurora_writer_is_created_with_the_cluster(stubber):
+    stubber.add_response(
+        "restore_db_cluster_from_snapshot",
+        {"DBCluster": {"DBClusterIdentifier": "prod-cluster-datamasque"}},
+        {
+            "SnapshotIdentifier": "prod-cluster-snap",
+            "DBClusterIdentifier": "prod-cluster-datamasque",
+            "Engine": "aurora-postgresql",
+            "EngineMode": "provisioned",
+            "DBSubnetGroupName": "private",
+            "VpcSecurityGroupIds": ["sg-0datamasque"],
+            "DeletionProtection": False,
+        },
+    )
+    _expect_writer(stubber)
+
+    result = app.lambda_handler(_aurora_event(RestoreSource="snapshot"), None)
+
+    assert result["StgDbInstanceId"] == "prod-cluster-datamasque-1"
+    assert result["StgDbInstanceStatus"] == "creating"
+    watched = [key for key, _ in state_store.get_store().items(rds_status.WATCH_KIND)]
+    assert sorted(watched) == ["db-cluster:prod-cluster-datamasque", "db-instance:prod-cluster-datamasque-1"]
+
+
+def test_throttled_writer_create_is_left_to_the_availability_check(stubber):
+    stubber.add_response(
+        "restore_db_cluster_to_point_in_time",
+        {"DBCluster": {"DBClusterIdentifier": "prod-cluster-datamasque"}},
+        _cluster_restore_kwargs("copy-on-write", UseLatestRestorableTime=True),
+    )
+    stubber.add_client_error("create_db_instance", "Throttling")
+
+    result = app.lambda_handler(_aurora_event(StagingMode="clone", RestoreSource="clone"), None)
+
+    # The cluster restore stands; CheckDBAvailability adds the writer later.
+    assert result["status"] == "success"
+    assert "StgDbInstanceStatus" not in result
+    assert "StgDbInstanceId" not in result
+
+
+def test_write_optimized_rds_restore_drops_standby_and_backups(stubber):
+    event = _rds_event(RestoreSource="snapshot", WriteOptimizedStaging=True)
+    event["parameters"]["DBParameterGroupName"] = "prod-pg"
+    stubber.add_response(
+        "describe_db_parameter_groups",
+        {"DBParameterGroups": [{"DBParameterGroupName": "prod-pg", "DBParameterGroupFamily": "postgres16"}]},
+        {"DBParameterGroupName": "prod-pg"},
+    )
+    stubber.add_response("copy_db_parameter_group", {}, None)
+    stubber.add_response("modify_db_parameter_group", {"DBParameterGroupName": "datamasque-staging-prod-pg"}, None)
+    stubber.add_response(
+        "restore_db_instance_from_db_snapshot",
+        {"DBInstance": {"DBInstanceIdentifier": "prod-datamasque"}},
+        {
+            "DBSnapshotIdentifier": "prod-snap",
+            "DBInstanceIdentifier": "prod-datamasque",
+            **_rds_restore_kwargs(
+                MultiAZ=False, BackupRetentionPeriod=0, DBParameterGroupName="datamasque-staging-prod-pg"
+            ),
+        },
+    )
+
+    result = app.lambda_handler(event, None)
+
+    assert result["status"] == "success"
+    # The writer-facing parameters follow the restore's group.
+    assert result["parameters"]["DBParameterGroupName"] == "datamasque-staging-prod-pg"
+
+
+def test_write_optimized_aurora_restore_keeps_minimum_backups(stubber):
+    stubber.add_response(
+        "restore_db_cluster_from_snapshot",
+        {"DBCluster": {"DBClusterIdentifier": "prod-cluster-datamasque"}},
+        {
+            "SnapshotIdentifier": "prod-cluster-snap",
+            "DBClusterIdentifier": "prod-cluster-datamasque",
+            "Engine": "aurora-postgresql",
+            "EngineMode": "provisioned",
+            "DBSubnetGroupName": "private",
+            "VpcSecurityGroupIds": ["sg-0datamasque"],
+            "DeletionProtection": False,
+            "BackupRetentionPeriod": 1,
+        },
+    )
+    stubber.add_response(
+        "create_db_instance",
+        {"DBInstance": {"DBInstanceIdentifier": "prod-cluster-datamasque-1"}},
+        {
+            "DBInstanceIdentifier": "prod-cluster-datamasque-1",
+            "DBClusterIdentifier": "prod-cluster-datamasque",
+            "DBInstanceClass": "db.r6g.large",
+            "Engine": "aurora-postgresql",
+            "DBSubnetGroupName": "private",
+            "EnablePerformanceInsights": False,
+            "MonitoringInterval": 0,
+        },
+    )
+
+    result = app.lambda_handler(_aurora_event(RestoreSource="snapshot", WriteOptimizedStaging=True), None)
+
+    assert result["StgDbInstanceStatus"] == "creating"
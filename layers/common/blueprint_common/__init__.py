@@ -0,0 +1,6 @@
+"""
+Code shared by the blueprint Lambdas.
+
+Packaged as the CommonLayer Lambda layer (see template.yaml) and attached to
+every function, so each function imports it as ``blueprint_common``.
+"""
@@ -0,0 +1,33 @@
+"""
+Per-container boto3 clients.
+
+Building a boto3 client resolves the endpoint and loads the service's JSON
+model, which costs tens of milliseconds. Handlers call ``client("rds")``
+instead of ``boto3.client("rds")`` so that cost is paid on the first
+invocation of a container and every warm invocation reuses the same client.
+boto3 itself is imported on first use, so importing this module is cheap.
+"""
+import threading
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def client(service_name: str, **kwargs):
+    """Return the cached boto3 client for ``service_name`` (and ``kwargs``)."""
+    key = (service_name, tuple(sorted(kwargs.items())))
+    cached = _clients.get(key)
+    if cached is None:
+        with _lock:
+            cached = _clients.get(key)
+            if cached is None:
+                import boto3
+
+                cached = _clients[key] = boto3.client(service_name, **kwargs)
+    return cached
+
+
+def reset_clients() -> None:
+    """Drop every cached client; the next ``client()`` call builds a new one."""
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,67 @@
+"""
+Step Functions task-token callbacks.
+
+A ``.waitForTaskToken`` task hands its Lambda a task token and then waits,
+without polling, until something calls ``SendTaskSuccess`` or
+``SendTaskFailure`` with that token. ``register()`` parks the token and the
+state to resume with in the state store under ``(kind, key)``; whatever
+learns that the awaited thing finished (a watcher, an event consumer) looks
+it up and calls ``succeed()`` / ``fail()``.
+"""
+import json
+import logging
+import os
+
+from blueprint_common import aws
+from blueprint_common.state_store import get_store
+
+logger = logging.getLogger(__name__)
+
+# Execution input "CompletionMode": how the state machine learns a masking
+# run has ended. "poll" (default) loops through CheckMaskingRunStatus;
+# "callback" waits on a task token resumed by the masking run watcher.
+COMPLETION_MODES = ("poll", "callback")
+
+# Errors meaning the waiting task is gone (timed out, execution stopped):
+# the parked token can be dropped.
+GONE_ERRORS = frozenset({"TaskTimedOut", "TaskDoesNotExist", "InvalidToken"})
+
+# Event fields never persisted with a parked token.
+UNSTORED_FIELDS = ("RunSecret",)
+
+
+def _ttl_seconds() -> int:
+    try:
+        return int(os.environ.get("CALLBACK_TTL_SECONDS", 2 * 24 * 3600))
+    except ValueError:
+        return 2 * 24 * 3600
+
+
+def register(kind: str, key: str, task_token: str, output: dict, **extra) -> None:
+    """Park ``task_token`` until ``(kind, key)`` completes; ``output`` is the state to resume with."""
+    stored = {k: v for k, v in output.items() if k not in UNSTORED_FIELDS}
+    get_store().put(kind, key, {"TaskToken": task_token, "Output": stored, **extra}, ttl_seconds=_ttl_seconds())
+    logger.info("Registered callback for %s %s", kind, key)
+
+
+def _send(operation: str, **kwargs) -> bool:
+    from botocore.exceptions import ClientError
+
+    try:
+        getattr(aws.client("stepfunctions"), operation)(**kwargs)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in GONE_ERRORS:
+            logger.warning("Task token no longer valid (%s); dropping it", e.response["Error"]["Code"])
+            return False
+        raise
+
+
+def succeed(task_token: str, output: dict) -> bool:
+    """``SendTaskSuccess``; False if the waiting task no longer exists."""
+    return _send("send_task_success", taskToken=task_token, output=json.dumps(output))
+
+
+def fail(task_token: str, error: str, cause: str) -> bool:
+    """``SendTaskFailure``; False if the waiting task no longer exists."""
+    return _send("send_task_failure", taskToken=task_token, error=error, cause=cause[:32768])
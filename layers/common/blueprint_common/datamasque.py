@@ -0,0 +1,591 @@
+"""
+Pooled, keep-alive client for the DataMasque API.
+
+Every Lambda that talks to DataMasque goes through a ``DataMasqueClient``.
+Clients share module-level urllib3 connection pools so TCP + TLS connections
+to the DataMasque instance are reused across calls and across warm
+invocations of the same container, instead of paying a fresh handshake on
+every request.
+
+urllib3 already ships with botocore in the Lambda runtime, so this avoids
+bundling ``requests`` (and its charset/idna/certifi dependencies). It is
+imported on first use rather than at module load to keep init duration down.
+
+Auth tokens are cached at module scope too, keyed by (base_url, username), so
+a warm container logs in once and reuses the token until shortly before its
+``date_time_expires``. A 401 transparently re-authenticates once, and a token
+superseded by a refresh is logged out so it does not linger server-side.
+
+List endpoints can be streamed with ``iter_list``, which decodes items as the
+body arrives so a caller looking for one entry stops reading at the match.
+
+Configuration (all optional environment variables):
+    DATAMASQUE_CONNECT_TIMEOUT  seconds to establish a connection (default 3.05)
+    DATAMASQUE_READ_TIMEOUT     seconds to wait for a response (default 15)
+    DATAMASQUE_MAX_ATTEMPTS     total attempts for a retryable call (default 3)
+    DATAMASQUE_TOKEN_REFRESH_MARGIN
+                                refresh a cached token this many seconds before
+                                it expires (default 300)
+"""
+import codecs
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# 429 and gateway/server errors are transient on an ALB-fronted instance.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Methods that are safe to resend after the server may have seen them. POST
+# is excluded: resending create_run could start a second masking run.
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+BACKOFF_BASE_SECONDS = 0.25
+BACKOFF_CAP_SECONDS = 4.0
+
+LOGIN_API = "api/auth/token/login/"
+LOGOUT_API = "api/auth/token/logout/"
+
+# Used when a login response carries no parseable date_time_expires.
+DEFAULT_TOKEN_TTL_SECONDS = 900
+
+
+def parse_verify_tls(value: str | None) -> bool:
+    """Parse the DATAMASQUE_VERIFY_TLS env value into a bool (default secure).
+
+    TLS verification defaults to ON. Only the explicit strings false/0/no
+    (case-insensitive) disable it, for documented self-signed / private-CA
+    DataMasque instances on a trusted path.
+    """
+    return str(value).strip().lower() not in ("false", "0", "no")
+
+
+def verify_tls_from_env() -> bool:
+    """DATAMASQUE_VERIFY_TLS from the environment, parsed by parse_verify_tls."""
+    return parse_verify_tls(os.environ.get("DATAMASQUE_VERIFY_TLS", "true"))
+
+
+def _env_number(name: str, default, cast=float):
+    """Read a numeric env var, falling back to ``default`` when unset/invalid."""
+    raw = os.environ.get(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return cast(raw)
+    except ValueError:
+        logger.warning("Ignoring invalid %s=%r, using %s", name, raw, default)
+        return default
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(verify: bool = True):
+    """Return the module-level urllib3 pool manager for ``verify``, creating it on first use."""
+    pool = _pools.get(verify)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(verify)
+            if pool is None:
+                import urllib3
+
+                if not verify:
+                    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+                pool = _pools[verify] = urllib3.PoolManager(
+                    num_pools=4,
+                    maxsize=16,
+                    cert_reqs="CERT_REQUIRED" if verify else "CERT_NONE",
+                )
+    return pool
+
+
+def reset_pools() -> None:
+    """Close and drop the pooled connections; the next call opens new ones."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.clear()
+        _pools.clear()
+
+
+class Response:
+    """
+    The parts of an HTTP response the Lambdas use, with requests-style names.
+
+    For a successful (200 or 206) ``stream=True`` request the body is not
+    read: ``raw`` is the unread urllib3 response and ``content`` is empty.
+    """
+
+    __slots__ = ("status_code", "headers", "content", "raw")
+
+    def __init__(self, status_code: int, headers, content: bytes, raw=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.raw = raw
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size: int = 64 * 1024):
+        if self.raw is None:
+            yield self.content
+            return
+        try:
+            yield from self.raw.stream(chunk_size)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """
+        Give up on an unread streamed body.
+
+        The connection is closed rather than returned to the pool, since the
+        rest of the body would have to be read before it could be reused.
+        """
+        if self.raw is not None:
+            self.raw.close()
+            self.raw.release_conn()
+            self.raw = None
+
+
+def _login_body(response: Response) -> dict:
+    """
+    The JSON object of a login response.
+
+    A body that is not a JSON object (e.g. a proxy's HTML error page) raises
+    RuntimeError, as a failed listing does, rather than a JSONDecodeError.
+    """
+    content_type = (response.headers or {}).get("Content-Type") or ""
+    body = None
+    if not content_type or "json" in content_type.lower():
+        try:
+            body = response.json()
+        except ValueError:
+            pass
+    if not isinstance(body, dict):
+        raise RuntimeError(
+            f"DataMasque login failed with status {response.status_code} "
+            f"({content_type or 'no content type'}, not a JSON object)"
+        )
+    return body
+
+
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+def iter_json_array(chunks, meta: dict | None = None, key: str = "results"):
+    """
+    Yield the items of a JSON list as its text arrives in ``chunks``.
+
+    The document is either a bare array or an object whose ``key`` member is
+    the array (a paginated page); the object's other members are stored in
+    ``meta`` as they are parsed. Each item is decoded as soon as it is
+    complete, so a caller that stops iterating early never buffers or parses
+    the rest of the response.
+    """
+    decoder = json.JSONDecoder()
+    # Chunks are split at arbitrary bytes, so a multi-byte character may
+    # straddle two of them.
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf, pos, eof = "", 0, False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            eof = True
+            buf = buf[pos:] + utf8.decode(b"", final=True)
+            pos = 0
+            return False
+        buf = buf[pos:] + (utf8.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        pos = 0
+        return True
+
+    def peek() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                raise ValueError("Unexpected end of JSON document")
+
+    def value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                parsed, end = decoder.raw_decode(buf, pos)
+                # A number that runs to the end of the buffer (or stops at
+                # ".", "e", ...) may continue in the next chunk.
+                if eof or (end < len(buf) and buf[end] not in _NUMBER_CHARS):
+                    pos = end
+                    return parsed
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            more()
+
+    def items():
+        nonlocal pos
+        pos += 1  # "["
+        if peek() == "]":
+            pos += 1
+            return
+        while True:
+            yield value()
+            sep = peek()
+            pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {sep!r}")
+
+    first = peek()
+    if first == "[":
+        yield from items()
+        return
+    if first != "{":
+        raise ValueError(f"Expected a JSON array or object, got {first!r}")
+    pos += 1
+    if peek() == "}":
+        return
+    while True:
+        member = value()
+        if peek() != ":":
+            raise ValueError("Expected ':' in JSON object")
+        pos += 1
+        if member == key and peek() == "[":
+            yield from items()
+        else:
+            parsed = value()
+            if meta is not None:
+                meta[member] = parsed
+        sep = peek()
+        pos += 1
+        if sep == "}":
+            return
+        if sep != ",":
+            raise ValueError(f"Expected ',' or '}}' in JSON object, got {sep!r}")
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE_SECONDS, cap: float = BACKOFF_CAP_SECONDS) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _retry_after(response) -> float | None:
+    """Seconds from a numeric Retry-After header, if the server sent one."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _parse_expiry(value) -> float | None:
+    """Epoch seconds for a DataMasque ``date_time_expires`` timestamp."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+# (base_url, username) -> {"login": <login response json>, "expires_at": epoch}
+_tokens = {}
+_tokens_lock = threading.RLock()
+
+
+def clear_tokens() -> None:
+    """Forget every cached auth token (without logging them out)."""
+    with _tokens_lock:
+        _tokens.clear()
+
+
+class DataMasqueClient:
+    """
+    Thin wrapper over the pooled session for one DataMasque instance.
+
+    ``request`` returns a ``Response`` whatever the status; callers keep
+    deciding what a status code means. Retries apply to RETRY_STATUSES and connection
+    errors for idempotent methods, and to connect failures (request never
+    sent) for every method. Pass ``retry=True`` to opt a POST in when it is
+    safe to resend (login, connection test).
+
+    Latency for each call is recorded in ``metrics`` under ``name`` (defaults
+    to "<METHOD> <api>").
+
+    ``login`` returns a cached login response while its token is fresh. Any
+    call answered with 401 whose Authorization header carries a token issued
+    by ``login`` is re-authenticated and resent once with a new token.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        verify: bool = True,
+        connect_timeout: float | None = None,
+        read_timeout: float | None = None,
+        max_attempts: int | None = None,
+    ):
+        self.base_url = base_url
+        self.verify = verify
+        self.connect_timeout = (
+            connect_timeout
+            if connect_timeout is not None
+            else _env_number("DATAMASQUE_CONNECT_TIMEOUT", 3.05)
+        )
+        self.read_timeout = (
+            read_timeout
+            if read_timeout is not None
+            else _env_number("DATAMASQUE_READ_TIMEOUT", 15.0)
+        )
+        self.max_attempts = max(
+            1,
+            max_attempts
+            if max_attempts is not None
+            else _env_number("DATAMASQUE_MAX_ATTEMPTS", 3, int),
+        )
+        self.refresh_margin = _env_number("DATAMASQUE_TOKEN_REFRESH_MARGIN", 300.0)
+        self.metrics = {}
+        self._metrics_lock = threading.Lock()
+        # username -> password, and token key -> username, so a 401 on a
+        # token we issued can be re-authenticated without the caller.
+        self._passwords = {}
+        self._token_owners = {}
+
+    def _record(self, name: str, elapsed_ms: float, retries: int, error: bool) -> None:
+        with self._metrics_lock:
+            m = self.metrics.setdefault(
+                name, {"calls": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            m["calls"] += 1
+            m["retries"] += retries
+            m["errors"] += int(error)
+            m["total_ms"] = round(m["total_ms"] + elapsed_ms, 1)
+            m["max_ms"] = round(max(m["max_ms"], elapsed_ms), 1)
+
+    def reset_metrics(self) -> None:
+        with self._metrics_lock:
+            self.metrics = {}
+
+    def login(self, username: str, password: str, force: bool = False) -> dict:
+        """
+        Return a login response (with the token ``key``) for ``username``.
+
+        A cached token is reused until ``refresh_margin`` seconds before it
+        expires. A refreshed token replaces the cached one and the superseded
+        token is logged out. Failed logins are returned as-is and not cached.
+        """
+        cache_key = (self.base_url, username)
+        with _tokens_lock:
+            self._passwords[username] = password
+            cached = _tokens.get(cache_key)
+            if cached and not force and cached["expires_at"] - self.refresh_margin > time.time():
+                return cached["login"]
+
+            response = self._send(
+                "POST",
+                LOGIN_API,
+                name="login",
+                retry=True,
+                json={"username": username, "password": password},
+                headers={"Content-Type": "application/json"},
+            )
+            # Do not log the response body: it contains the auth token.
+            logger.info("Login response status: %s", response.status_code)
+            login = _login_body(response)
+            if response.status_code != 200 or "key" not in login:
+                return login
+
+            expires_at = _parse_expiry(login.get("date_time_expires"))
+            if expires_at is None:
+                expires_at = time.time() + DEFAULT_TOKEN_TTL_SECONDS
+            _tokens[cache_key] = {"login": login, "expires_at": expires_at}
+            self._token_owners[login["key"]] = username
+            if cached and cached["login"]["key"] != login["key"]:
+                self.logout(cached["login"]["key"])
+            return login
+
+    def logout(self, key: str) -> None:
+        """Best-effort server-side revocation of a token we no longer use."""
+        self._token_owners.pop(key, None)
+        try:
+            response = self._send(
+                "POST", LOGOUT_API, name="logout", headers={"Authorization": "Token " + key}
+            )
+            logger.info("Logout superseded token status: %s", response.status_code)
+        except Exception as e:
+            logger.warning("Could not log out superseded DataMasque token: %s", e)
+
+    def _reauthenticate(self, authorization: str | None) -> str | None:
+        """New Authorization header value after a 401, or None if not ours."""
+        if not authorization or not authorization.startswith("Token "):
+            return None
+        key = authorization[len("Token "):]
+        with _tokens_lock:
+            username = self._token_owners.get(key)
+            if username is None or username not in self._passwords:
+                return None
+            cached = _tokens.get((self.base_url, username))
+            if cached and cached["login"]["key"] != key:
+                # Another caller already refreshed it; use the newer token.
+                return "Token " + cached["login"]["key"]
+            logger.info("DataMasque token rejected (401); re-authenticating.")
+            login = self.login(username, self._passwords[username], force=True)
+            return "Token " + login["key"] if "key" in login else None
+
+    def request(self, method: str, api: str, *, name: str | None = None, retry: bool | None = None, **kwargs):
+        response = self._send(method, api, name=name, retry=retry, **kwargs)
+        if response.status_code == 401:
+            headers = kwargs.get("headers") or {}
+            authorization = self._reauthenticate(headers.get("Authorization"))
+            if authorization:
+                kwargs["headers"] = {**headers, "Authorization": authorization}
+                response = self._send(method, api, name=name, retry=retry, **kwargs)
+        return response
+
+    def iter_list(self, api: str, *, headers: dict | None = None, name: str | None = None, params: dict | None = None):
+        """
+        Yield the items of a list endpoint, parsing each page as it streams.
+
+        Works whether the endpoint returns a bare array or paginated pages
+        (``{"next": ..., "results": [...]}``); ``next`` links are followed.
+        ``params`` are sent as the query string of the first page; servers
+        that do not support them simply return the unfiltered list. Closing
+        the generator early abandons the rest of the response.
+        """
+        if params:
+            api = f"{api}?{urlencode(params)}"
+        while api:
+            response = self.get(api, headers=headers, name=name, stream=True)
+            if response.status_code != 200:
+                raise RuntimeError(f"Listing {api} failed with status {response.status_code}")
+            meta = {}
+            try:
+                yield from iter_json_array(response.iter_content(), meta)
+            finally:
+                response.close()
+            api = self._relative(meta.get("next"))
+
+    def _relative(self, url: str | None) -> str | None:
+        """An absolute ``next`` link as an API path relative to ``base_url``."""
+        if not url:
+            return None
+        if url.startswith(self.base_url):
+            return url[len(self.base_url):]
+        # e.g. the server sees a different host or scheme behind a proxy
+        parts = urlsplit(url)
+        return parts.path.lstrip("/") + (f"?{parts.query}" if parts.query else "")
+
+    def _send(self, method: str, api: str, *, name: str | None = None, retry: bool | None = None, **kwargs):
+        method = method.upper()
+        name = name or f"{method} {api}"
+        retryable = method in IDEMPOTENT_METHODS if retry is None else retry
+        from urllib3 import Timeout
+        from urllib3.exceptions import (
+            ConnectTimeoutError,
+            NewConnectionError,
+            ProtocolError,
+            ReadTimeoutError,
+            SSLError,
+        )
+
+        url = self.base_url + api
+        headers = dict(kwargs.get("headers") or {})
+        body = None
+        if kwargs.get("json") is not None:
+            body = json.dumps(kwargs["json"]).encode()
+            headers.setdefault("Content-Type", "application/json")
+        timeout = Timeout(connect=self.connect_timeout, read=self.read_timeout)
+        stream = kwargs.get("stream", False)
+
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            response = exc = None
+            try:
+                raw = get_pool(self.verify).request(
+                    method,
+                    url,
+                    body=body,
+                    headers=headers,
+                    timeout=timeout,
+                    retries=False,
+                    preload_content=not stream,
+                )
+                if stream and raw.status in (200, 206):
+                    response = Response(raw.status, raw.headers, b"", raw=raw)
+                else:
+                    response = Response(raw.status, raw.headers, raw.data)
+            except (ConnectTimeoutError, NewConnectionError) as e:
+                # Refused / unresolvable / timed out connecting: nothing
+                # reached the server. (NewConnectionError is named because it
+                # is no longer guaranteed to subclass ConnectTimeoutError.)
+                exc, can_retry, error = e, True, True
+            except (ProtocolError, ReadTimeoutError, SSLError) as e:
+                # Connection reset mid-request, no response in time, or a
+                # failed handshake: the server may have seen the request.
+                exc, can_retry, error = e, retryable, True
+            else:
+                can_retry = retryable and response.status_code in RETRY_STATUSES
+                error = response.status_code >= 500
+
+            if not can_retry or attempt + 1 >= self.max_attempts:
+                self._record(name, (time.perf_counter() - start) * 1000, attempt, error)
+                if exc is not None:
+                    raise exc
+                return response
+
+            delay = backoff_delay(attempt)
+            retry_after = _retry_after(response)
+            if retry_after is not None:
+                delay = min(max(delay, retry_after), BACKOFF_CAP_SECONDS)
+            logger.info(
+                "DataMasque %s retry %d/%d in %.2fs (%s)",
+                name,
+                attempt + 1,
+                self.max_attempts - 1,
+                delay,
+                response.status_code if response is not None else "connection error",
+            )
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, api: str, **kwargs):
+        return self.request("GET", api, **kwargs)
+
+    def post(self, api: str, **kwargs):
+        return self.request("POST", api, **kwargs)
+
+    def put(self, api: str, **kwargs):
+        return self.request("PUT", api, **kwargs)
+
+    def delete(self, api: str, **kwargs):
+        return self.request("DELETE", api, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url: str, verify: bool = True) -> DataMasqueClient:
+    """Return the per-container client for ``base_url``, creating it on first use."""
+    key = (base_url, verify)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.setdefault(key, DataMasqueClient(base_url, verify=verify))
+    return client
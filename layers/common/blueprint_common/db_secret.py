@@ -0,0 +1,47 @@
+"""
+Validation of the database connection secret (``DBSecretIdentifier``).
+
+Shared by the preflight check, which rejects a bad secret before any RDS
+work starts, by ``DatamasqueRun``, which builds the DataMasque connection
+from it, and by ``HydrateStagingDB``, which connects to the staging copy.
+"""
+
+# Keys every connection secret must contain.
+REQUIRED_KEYS = frozenset(
+    {
+        "username",
+        "password",
+        "engine",
+        "host",
+        "port",
+        "dbname",
+        "schema",
+    }
+)
+
+# Execution input "ConnectionMode": how DatamasqueRun gets its DataMasque
+# connection. "recreate" (default) deletes and recreates it for every run;
+# "upsert" reuses it while its parameters are unchanged.
+CONNECTION_MODES = ("recreate", "upsert")
+
+# DataMasque db_type values the blueprint can create connections for.
+SUPPORTED_ENGINES = ["postgres", "mysql", "oracle", "mariadb", "mssql"]
+
+
+def validate_db_secret(secret: dict) -> str | None:
+    """Return why ``secret`` cannot be used to build a connection, or None if it can."""
+    if not REQUIRED_KEYS.issubset(secret):
+        return (
+            "Missing required parameters in secrets manager, please verify "
+            f"if the secret contains {set(REQUIRED_KEYS)} parameters in it."
+        )
+    if secret["engine"] not in SUPPORTED_ENGINES:
+        return f"Invalid value for engine parameter in secret, valid values are: {SUPPORTED_ENGINES}"
+    return None
+
+
+def staging_host(host: str) -> str:
+    """The staging copy's endpoint: ``<id>.<rest>`` -> ``<id>-datamasque.<rest>``."""
+    staging_db_id = host.split(".")
+    staging_db_id[0] = f"{staging_db_id[0]}-datamasque"
+    return ".".join(staging_db_id)
@@ -0,0 +1,128 @@
+"""
+Adaptive wait between polls of a long-running operation.
+
+Each polling Lambda calls ``schedule()`` before returning a non-terminal
+status. It sets ``NextWaitSeconds`` in the event, which the state machine's
+Wait states read through ``SecondsPath``. Instead of a fixed 60-120 seconds:
+
+- the first poll of a stage, and the first poll after the status changes
+  (e.g. ``creating`` -> ``backing-up``), waits the policy's ``initial``;
+- while the status is unchanged the wait grows by ``factor`` up to
+  ``maximum``, so a multi-hour operation is polled a few times an hour
+  rather than every minute;
+- when the operation reports a ``PercentProgress``, the rate since the
+  previous poll gives an ETA and the next poll is scheduled for it.
+
+The per-poller state (last wait, status, progress and time) is carried in
+the event under ``PollState``.
+
+With ``"PollMode": "internal"`` in the execution input, the check functions
+also poll inside one invocation (``poll_internally``): they sleep for
+``NextWaitSeconds`` and poll again for as long as the next poll still fits in
+the invocation's budget, then hand back to the state machine. The frequent
+early polls therefore cost no state transitions, and only the long waits of
+a slow operation go through the Wait states.
+
+Configuration (optional environment variables):
+    POLL_INTERNAL_MAX_SECONDS   longest an invocation keeps polling (default 600)
+    POLL_SAFETY_MARGIN_SECONDS  time left unused before the Lambda timeout (default 15)
+"""
+import logging
+import os
+import time
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class WaitPolicy(NamedTuple):
+    initial: int
+    minimum: int
+    maximum: int
+    factor: float
+
+
+POLICIES = {
+    "source_snapshot": WaitPolicy(initial=30, minimum=15, maximum=600, factor=2.0),
+    "db_availability": WaitPolicy(initial=60, minimum=15, maximum=300, factor=1.5),
+    "masking_run": WaitPolicy(initial=30, minimum=15, maximum=300, factor=1.5),
+    "masked_snapshot": WaitPolicy(initial=30, minimum=15, maximum=600, factor=2.0),
+}
+
+# Seconds added to an ETA so the poll lands just after the expected finish.
+ETA_MARGIN_SECONDS = 5
+
+
+def schedule(event: dict, poller: str, status: str, percent: float | None = None, now: float | None = None) -> int:
+    """Set and return ``event["NextWaitSeconds"]`` for the next poll by ``poller``."""
+    policy = POLICIES[poller]
+    now = time.time() if now is None else now
+    state = (event.get("PollState") or {}).get(poller) or {}
+
+    if state.get("wait") is None or state.get("status") != status:
+        wait = policy.initial
+    else:
+        wait = state["wait"] * policy.factor
+
+    previous_percent, previous_at = state.get("percent"), state.get("at")
+    if percent is not None and previous_percent is not None and previous_at is not None and now > previous_at:
+        rate = (percent - previous_percent) / (now - previous_at)
+        if rate > 0:
+            wait = (100 - percent) / rate + ETA_MARGIN_SECONDS
+
+    wait = int(min(max(wait, policy.minimum), policy.maximum))
+    event.setdefault("PollState", {})[poller] = {"wait": wait, "status": status, "percent": percent, "at": now}
+    event["NextWaitSeconds"] = wait
+    return wait
+
+
+POLL_MODES = ("state_machine", "internal")
+
+
+def internal_mode(event: dict) -> bool:
+    """
+    True if the execution input asks for in-Lambda polling (``"PollMode": "internal"``).
+
+    Other values are rejected up front by the preflight check.
+    """
+    return event.get("PollMode") == "internal"
+
+
+def _env_seconds(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def poll_internally(event: dict, context, poll_once, is_done) -> dict:
+    """
+    Call ``poll_once(event)`` until ``is_done(event)`` or the budget runs out.
+
+    Between polls it sleeps for the ``NextWaitSeconds`` the poll scheduled. It
+    returns, leaving that wait to the state machine, as soon as the sleep
+    plus another poll (timed as the slowest so far) would overrun either
+    ``POLL_INTERNAL_MAX_SECONDS`` or the Lambda's remaining time less
+    ``POLL_SAFETY_MARGIN_SECONDS``.
+    """
+    start = time.monotonic()
+    budget = _env_seconds("POLL_INTERNAL_MAX_SECONDS", 600)
+    if context is not None:
+        remaining = context.get_remaining_time_in_millis() / 1000
+        budget = min(budget, remaining - _env_seconds("POLL_SAFETY_MARGIN_SECONDS", 15))
+    deadline = start + budget
+
+    polls, slowest = 0, 0.0
+    while True:
+        poll_start = time.monotonic()
+        event = poll_once(event)
+        polls += 1
+        slowest = max(slowest, time.monotonic() - poll_start)
+        wait = event.get("NextWaitSeconds")
+        if is_done(event) or wait is None or time.monotonic() + wait + slowest > deadline:
+            break
+        time.sleep(wait)
+
+    event["InternalPolls"] = polls
+    logger.info("Polled %d time(s) in %.1fs before returning", polls, time.monotonic() - start)
+    return event
@@ -0,0 +1,274 @@
+"""
+Throttle-aware RDS client shared by the RDS Lambdas.
+
+``client()`` returns the per-container RDS client with:
+
+- botocore's ``adaptive`` retry mode, which backs off and rate-limits the
+  client on throttling responses (``AWS_MAX_ATTEMPTS`` attempts, default 10);
+- optionally, a token bucket shared by every invocation, checked before each
+  call, so the fleet as a whole stays under ``RDS_RATE_LIMIT_PER_SECOND``
+  (burst ``RDS_RATE_LIMIT_BURST``, default twice the rate). The bucket lives
+  in the state table when ``STATE_TABLE_NAME`` is set and in the process
+  otherwise (``MemoryBucket`` / ``DynamoDBBucket``; anything with the same
+  ``take()`` works). A rate of 0, the default, disables it;
+- counters for calls, retried attempts, throttling responses and time spent
+  waiting for the bucket, logged by ``log_metrics()``.
+
+If throttling outlasts the retries, handlers raise ``RdsThrottled`` (see
+``raise_if_throttled`` and ``handler``) instead of reporting a failed
+status; the state machine retries those tasks.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from blueprint_common import aws
+
+logger = logging.getLogger(__name__)
+
+THROTTLING_CODES = frozenset(
+    {
+        "Throttling",
+        "ThrottlingException",
+        "RequestLimitExceeded",
+        "RequestThrottled",
+        "RequestThrottledException",
+        "TooManyRequestsException",
+    }
+)
+
+# Longest a single call waits for the shared bucket before going ahead anyway.
+MAX_WAIT_SECONDS = 30.0
+
+
+class RdsThrottled(Exception):
+    """RDS kept throttling after every retry; the state machine retries the task."""
+
+
+def is_throttling(error: Exception) -> bool:
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in THROTTLING_CODES
+
+
+def raise_if_throttled(error: Exception) -> None:
+    """Re-raise ``error`` as ``RdsThrottled`` if it is an RDS throttling error."""
+    if is_throttling(error):
+        raise RdsThrottled(str(error)) from error
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _refill(tokens: float, updated_at: float, rate: float, burst: float, now: float) -> float:
+    return min(burst, tokens + max(0.0, now - updated_at) * rate)
+
+
+class MemoryBucket:
+    """Process-local token buckets (per container)."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, name: str, rate: float, burst: float, now: float) -> float:
+        """Take one token; returns 0, or the seconds until one is available."""
+        with self._lock:
+            tokens, updated_at = self._buckets.get(name, (burst, now))
+            tokens = _refill(tokens, updated_at, rate, burst, now)
+            if tokens < 1:
+                self._buckets[name] = (tokens, now)
+                return (1 - tokens) / rate
+            self._buckets[name] = (tokens - 1, now)
+            return 0.0
+
+
+class DynamoDBBucket:
+    """
+    Token buckets shared through the state table (item ``rate_limit`` / name).
+
+    Each take reads the bucket and writes it back conditionally on the
+    ``updated_at`` it read, retrying on contention.
+    """
+
+    KIND = "rate_limit"
+    CONTENTION_RETRIES = 5
+
+    def __init__(self, table_name: str, client=None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = aws.client("dynamodb")
+        return self._client
+
+    def take(self, name: str, rate: float, burst: float, now: float) -> float:
+        key = {"kind": {"S": self.KIND}, "key": {"S": name}}
+        for _ in range(self.CONTENTION_RETRIES):
+            item = self.client.get_item(TableName=self.table_name, Key=key, ConsistentRead=True).get("Item")
+            if item:
+                previous = item["updated_at"]["N"]
+                tokens = _refill(float(item["tokens"]["N"]), float(previous), rate, burst, now)
+            else:
+                previous, tokens = None, burst
+            if tokens < 1:
+                return (1 - tokens) / rate
+            condition = {"ConditionExpression": "attribute_not_exists(#kind)", "ExpressionAttributeNames": {"#kind": "kind"}}
+            if previous is not None:
+                condition = {"ConditionExpression": "updated_at = :previous", "ExpressionAttributeValues": {":previous": {"N": previous}}}
+            try:
+                self.client.put_item(
+                    TableName=self.table_name,
+                    Item={**key, "tokens": {"N": repr(tokens - 1)}, "updated_at": {"N": repr(now)}},
+                    **condition,
+                )
+                return 0.0
+            except self.client.exceptions.ConditionalCheckFailedException:
+                continue
+        return 1 / rate
+
+
+class RateLimiter:
+    def __init__(self, name: str, rate: float, burst: float, backend, sleep=time.sleep, clock=time.time):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.backend = backend
+        self._sleep = sleep
+        self._clock = clock
+
+    def acquire(self) -> float:
+        """Block until a token is taken (or ``MAX_WAIT_SECONDS``); returns the seconds waited."""
+        waited = 0.0
+        while True:
+            try:
+                wait = self.backend.take(self.name, self.rate, self.burst, self._clock())
+            except Exception as e:
+                # Fail open: a limiter outage must not stop the workflow.
+                logger.warning("RDS rate limiter unavailable: %s", e)
+                return waited
+            if wait <= 0:
+                return waited
+            if waited + wait > MAX_WAIT_SECONDS:
+                logger.warning("Waited %.1fs for the RDS rate limiter; calling anyway", waited)
+                return waited
+            self._sleep(wait)
+            waited += wait
+
+
+_metrics = {"calls": 0, "retries": 0, "throttles": 0, "throttle_wait_ms": 0.0}
+_metrics_lock = threading.Lock()
+
+
+def _count(name: str, amount=1) -> None:
+    with _metrics_lock:
+        _metrics[name] += amount
+
+
+def metrics() -> dict:
+    with _metrics_lock:
+        return dict(_metrics, throttle_wait_ms=round(_metrics["throttle_wait_ms"], 1))
+
+
+def reset_metrics() -> None:
+    with _metrics_lock:
+        for name in _metrics:
+            _metrics[name] = 0
+
+
+def log_metrics() -> None:
+    """Print and reset this invocation's RDS call counters."""
+    if metrics()["calls"]:
+        print(f"RDS API metrics: {json.dumps(metrics())}")
+    reset_metrics()
+
+
+def rate_limiter():
+    """The shared limiter configured by the environment, or None when disabled."""
+    rate = _env_float("RDS_RATE_LIMIT_PER_SECOND", 0)
+    if rate <= 0:
+        return None
+    table_name = os.environ.get("STATE_TABLE_NAME")
+    backend = DynamoDBBucket(table_name) if table_name else _memory_bucket
+    return RateLimiter("rds", rate, _env_float("RDS_RATE_LIMIT_BURST", 2 * rate), backend)
+
+
+_memory_bucket = MemoryBucket()
+_config = None
+_hooked = set()
+_hook_lock = threading.Lock()
+
+
+def _retry_config():
+    global _config
+    if _config is None:
+        from botocore.config import Config
+
+        max_attempts = int(_env_float("AWS_MAX_ATTEMPTS", 10))
+        _config = Config(retries={"mode": "adaptive", "max_attempts": max_attempts})
+    return _config
+
+
+# Once per API call, before any attempt (retries are paced by botocore's own
+# adaptive rate limiter).
+def _before_call(**kwargs):
+    _count("calls")
+    limiter = rate_limiter()
+    if limiter is not None:
+        _count("throttle_wait_ms", limiter.acquire() * 1000)
+
+
+def _needs_retry(response=None, **kwargs):
+    if response is not None and response[1].get("Error", {}).get("Code") in THROTTLING_CODES:
+        _count("throttles")
+
+
+def _after_call(parsed=None, **kwargs):
+    _count("retries", (parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts", 0))
+
+
+def instrument(rds_client):
+    """Register the rate limiter and metrics hooks on ``rds_client`` (once)."""
+    with _hook_lock:
+        if id(rds_client) in _hooked:
+            return rds_client
+        events = rds_client.meta.events
+        events.register("before-parameter-build.rds", _before_call)
+        events.register("needs-retry.rds", _needs_retry)
+        events.register("after-call.rds", _after_call)
+        _hooked.add(id(rds_client))
+    return rds_client
+
+
+def client():
+    """The per-container RDS client with adaptive retries and the hooks above."""
+    return instrument(aws.client("rds", config=_retry_config()))
+
+
+def handler(fn):
+    """
+    Decorator for RDS Lambda handlers.
+
+    Turns a throttling error escaping the handler into ``RdsThrottled`` and
+    logs the invocation's RDS metrics.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(event, context):
+        try:
+            return fn(event, context)
+        except Exception as e:
+            raise_if_throttled(e)
+            raise
+        finally:
+            log_metrics()
+
+    return wrapper
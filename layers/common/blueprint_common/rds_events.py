@@ -0,0 +1,111 @@
+"""
+Event-driven RDS waits ("RdsWaitMode": "event").
+
+Instead of describing a snapshot, instance or cluster every few minutes, the
+state machine parks on a task token keyed by the RDS identifier it waits on
+(``park()``). RDS publishes snapshot, instance and cluster events to
+EventBridge; the consumer looks up the waiters for the event's
+``SourceIdentifier`` and resumes them (``resume()``). The resumed execution
+runs its usual check task once, so the event only says "look now" and the
+describe call stays the source of truth for the status.
+
+Events can be missed (e.g. one that fires between the check and the park),
+so each event wait task also has a timeout after which the execution polls
+once and parks again.
+"""
+import hashlib
+import logging
+import time
+from datetime import datetime
+
+from blueprint_common import callbacks
+from blueprint_common.state_store import get_store
+
+logger = logging.getLogger(__name__)
+
+RDS_WAIT_MODES = ("poll", "event")
+
+# EventBridge detail-types carrying a SourceIdentifier a wait can be parked on.
+DETAIL_TYPES = (
+    "RDS DB Instance Event",
+    "RDS DB Cluster Event",
+    "RDS DB Snapshot Event",
+    "RDS DB Cluster Snapshot Event",
+)
+
+
+def event_mode(event: dict) -> bool:
+    """True if the execution input asks for event-driven RDS waits."""
+    return event.get("RdsWaitMode") == "event"
+
+
+def event_time(event: dict) -> float | None:
+    """
+    When the RDS event that resumed the execution state ``event`` happened.
+
+    Epoch seconds from ``RdsEvent.Date``; now if the event carries no usable
+    date; None if the last wait did not end with an event (e.g. it timed out).
+    """
+    rds_event = event.get("RdsEvent") or {}
+    if not rds_event.get("EventID"):
+        return None
+    try:
+        return datetime.fromisoformat(rds_event["Date"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, AttributeError, ValueError):
+        return time.time()
+
+
+def wait_targets(wait: str, event: dict) -> list:
+    """
+    The RDS identifiers the ``wait`` step of the execution state ``event`` waits on.
+
+    ``source_snapshot`` and ``masked_snapshot`` wait on the snapshot;
+    ``db_availability`` waits on the staging DB and, once the Aurora writer
+    has been created, on that instance too: the cluster and the writer each
+    publish their own events, and either may be the last to become available.
+    """
+    if wait == "source_snapshot":
+        return [event["DBSnapshotIdentifier"]]
+    if wait == "masked_snapshot":
+        return [event["MaskedDBSnapshotIdentifier"]]
+    if wait == "db_availability":
+        return [event["StageDB"]] + ([event["StgDbInstanceId"]] if event.get("StgDbInstanceId") else [])
+    raise ValueError(f"Unknown RDS wait {wait!r}")
+
+
+def _kind(identifier: str) -> str:
+    return f"rds_wait:{identifier}"
+
+
+def park(identifiers: list, task_token: str, wait: str) -> None:
+    """Park ``task_token`` until an RDS event arrives for any of ``identifiers``."""
+    key = hashlib.sha256(task_token.encode()).hexdigest()
+    for identifier in identifiers:
+        callbacks.register(_kind(identifier), key, task_token, {}, Wait=wait, Targets=list(identifiers))
+
+
+def parse(rds_event: dict) -> tuple | None:
+    """``(SourceIdentifier, summary)`` of an EventBridge RDS event, or None if it carries none."""
+    if rds_event.get("source") != "aws.rds" or rds_event.get("detail-type") not in DETAIL_TYPES:
+        return None
+    detail = rds_event.get("detail") or {}
+    identifier = detail.get("SourceIdentifier")
+    if not identifier:
+        return None
+    summary = {k: detail.get(k) for k in ("EventID", "Message", "SourceType", "Date") if detail.get(k) is not None}
+    return identifier, summary
+
+
+def resume(identifier: str, summary: dict) -> int:
+    """Resume every execution parked on ``identifier``; returns how many were resumed."""
+    store = get_store()
+    resumed = 0
+    for key, record in store.items(_kind(identifier)):
+        if callbacks.succeed(record["TaskToken"], summary):
+            resumed += 1
+        # The token is spent: drop it from every identifier it was parked on.
+        for target in record.get("Targets") or [identifier]:
+            store.delete(_kind(target), key)
+    if resumed:
+        logger.info("Resumed %d execution(s) waiting on %s (%s)", resumed, identifier, summary.get("EventID"))
+    return resumed
@@ -0,0 +1,157 @@
+"""
+Shared RDS status cache filled by one batched poller.
+
+With many executions in flight, every ``CheckDBAvailability`` and
+``CheckMaskedSnapshot`` invocation describing its own resource multiplies
+RDS API calls by the number of executions. Instead:
+
+- the step that creates a resource calls ``watch(resource_type, identifier)``
+  once, and the check that sees it finish calls ``unwatch()``;
+- a check calls ``read(resource_type, identifier)``, which returns the status
+  the poller last published for it (None if there is none yet, it is older
+  than ``RDS_STATUS_MAX_AGE_SECONDS``, or it was observed before ``since``,
+  e.g. the RDS event that resumed the check; the check then describes the
+  resource itself, as before);
+- the ``RdsStatusPoller`` function runs every minute, lists every watched
+  identifier and resolves them with one filtered, paginated describe call per
+  resource type and batch of ``BATCH_SIZE`` identifiers (``poll()``), then
+  publishes the statuses.
+
+Both live in the state store: kind ``rds_watch`` for the watched
+identifiers, ``rds_status`` for the results, keyed by
+``"<resource type>:<identifier>"``. A watch an execution never removed (it
+failed or was stopped) lapses after ``WATCH_TTL_SECONDS``.
+"""
+import logging
+import os
+import time
+
+from blueprint_common.state_store import get_store
+
+logger = logging.getLogger(__name__)
+
+WATCH_KIND = "rds_watch"
+STATUS_KIND = "rds_status"
+WATCH_TTL_SECONDS = 2 * 24 * 3600
+STATUS_TTL_SECONDS = 10 * 60
+
+# Identifiers per describe call; each resource type accepts a filter list.
+BATCH_SIZE = 50
+
+# resource type -> (describe operation / paginator, response list key,
+#                   filter name, identifier key, status key)
+RESOURCE_TYPES = {
+    "db-instance": ("describe_db_instances", "DBInstances", "db-instance-id", "DBInstanceIdentifier", "DBInstanceStatus"),
+    "db-cluster": ("describe_db_clusters", "DBClusters", "db-cluster-id", "DBClusterIdentifier", "Status"),
+    "snapshot": ("describe_db_snapshots", "DBSnapshots", "db-snapshot-id", "DBSnapshotIdentifier", "Status"),
+    "cluster-snapshot": (
+        "describe_db_cluster_snapshots",
+        "DBClusterSnapshots",
+        "db-cluster-snapshot-id",
+        "DBClusterSnapshotIdentifier",
+        "Status",
+    ),
+}
+
+
+def _max_age_seconds() -> float:
+    try:
+        return float(os.environ.get("RDS_STATUS_MAX_AGE_SECONDS", 120))
+    except ValueError:
+        return 120.0
+
+
+def _key(resource_type: str, identifier: str) -> str:
+    if resource_type not in RESOURCE_TYPES:
+        raise ValueError(f"Unknown RDS resource type {resource_type!r}")
+    return f"{resource_type}:{identifier}"
+
+
+def watch(resource_type: str, identifier: str) -> None:
+    """Have the poller resolve ``identifier`` until it is unwatched (store errors are logged)."""
+    key = _key(resource_type, identifier)
+    try:
+        get_store().put(WATCH_KIND, key, {"Type": resource_type, "Identifier": identifier}, ttl_seconds=WATCH_TTL_SECONDS)
+    except Exception as e:
+        logger.warning("Could not watch %s: %s", key, e)
+
+
+def unwatch(resource_type: str, identifier: str) -> None:
+    """Stop polling ``identifier``: its wait is over (store errors are logged)."""
+    key = _key(resource_type, identifier)
+    try:
+        store = get_store()
+        store.delete(WATCH_KIND, key)
+        store.delete(STATUS_KIND, key)
+    except Exception as e:
+        logger.warning("Could not unwatch %s: %s", key, e)
+
+
+def read(resource_type: str, identifier: str, now: float | None = None, since: float | None = None) -> dict | None:
+    """
+    Return the status the poller published for ``identifier``, if fresh.
+
+    The result is ``{"Status": ..., "PercentProgress": ..., "ObservedAt": ...}``
+    with ``Status`` lower-cased. A status observed before ``since`` (epoch
+    seconds) is a miss. Store errors are logged and treated as a miss, so the
+    caller always has the direct describe to fall back on.
+    """
+    now = time.time() if now is None else now
+    key = _key(resource_type, identifier)
+    try:
+        status = get_store().get(STATUS_KIND, key)
+    except Exception as e:
+        logger.warning("RDS status cache unavailable for %s: %s", key, e)
+        return None
+    if status is None or now - status["ObservedAt"] > _max_age_seconds():
+        return None
+    if since is not None and status["ObservedAt"] < since:
+        return None
+    return status
+
+
+def _describe(client, resource_type: str, identifiers: list) -> dict:
+    operation, list_key, filter_name, id_key, status_key = RESOURCE_TYPES[resource_type]
+    found = {}
+    paginator = client.get_paginator(operation)
+    for page in paginator.paginate(Filters=[{"Name": filter_name, "Values": identifiers}]):
+        for resource in page[list_key]:
+            found[resource[id_key]] = {
+                "Status": resource[status_key].lower(),
+                "PercentProgress": resource.get("PercentProgress"),
+            }
+    return found
+
+
+def poll(client, now: float | None = None) -> dict:
+    """
+    Resolve every watched identifier and publish the results.
+
+    Returns ``{resource type: number of describe calls}``. Identifiers RDS
+    does not return are left unpublished; their checks describe them
+    directly and report the error.
+    """
+    store = get_store()
+    watched = {}
+    for _, watch in store.items(WATCH_KIND):
+        watched.setdefault(watch["Type"], []).append(watch["Identifier"])
+
+    calls = {}
+    for resource_type, identifiers in sorted(watched.items()):
+        identifiers = sorted(set(identifiers))
+        for start in range(0, len(identifiers), BATCH_SIZE):
+            batch = identifiers[start:start + BATCH_SIZE]
+            found = _describe(client, resource_type, batch)
+            calls[resource_type] = calls.get(resource_type, 0) + 1
+            observed_at = time.time() if now is None else now
+            for identifier, status in found.items():
+                store.put(
+                    STATUS_KIND,
+                    _key(resource_type, identifier),
+                    {**status, "ObservedAt": observed_at},
+                    ttl_seconds=STATUS_TTL_SECONDS,
+                )
+            missing = set(batch) - set(found)
+            if missing:
+                logger.info("Not found (%s): %s", resource_type, sorted(missing))
+    return calls
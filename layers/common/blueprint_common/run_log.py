@@ -0,0 +1,158 @@
+"""
+Incremental reading of a DataMasque run log and masking progress derived from it.
+
+``CheckMaskingRunStatus`` polls a run for hours. Rather than re-downloading
+the whole log on every poll it keeps a byte offset (``MaskRunLogOffset`` in
+the execution state) and asks for ``Range: bytes=<offset>-``. Servers that
+ignore the range are handled by discarding the already-seen prefix while it
+streams. Only complete lines are consumed; a partially written last line is
+read again on the next poll. At most ``max_bytes`` are consumed per poll so a
+burst of logging cannot blow the Lambda's memory or the state payload.
+
+Log lines may be JSON objects or plain text. Table names and row counts are
+taken from ``table``/``table_name`` and ``rows``/``rows_masked``/``row_count``
+fields when present, otherwise from messages such as
+``Masked 120,000 rows in table "customers"``. Row counts are treated as
+running totals per table.
+"""
+import json
+import re
+
+LOG_API = "api/runs/{}/log/"
+
+DEFAULT_MAX_BYTES = 1024 * 1024
+
+# Per-table entries kept in the progress object (completed tables are dropped
+# first) so it stays well inside the Step Functions payload limit.
+MAX_TABLES = 50
+
+_ROWS = re.compile(r"(\d[\d,]*)\s+rows?\b", re.IGNORECASE)
+_TABLE = re.compile(r"\btable\s+[\"'`\[]?([\w.$#-]+)", re.IGNORECASE)
+_TABLE_DONE = re.compile(r"\b(finished|completed|complete|done)\b", re.IGNORECASE)
+
+_TABLE_FIELDS = ("table", "table_name")
+_ROWS_FIELDS = ("rows", "rows_masked", "row_count")
+
+
+def fetch_new_lines(client, run_id, offset: int, headers: dict, max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    Return ``(lines, new_offset)``: the complete log lines after ``offset``.
+
+    ``client`` is a ``DataMasqueClient``; ``headers`` carries the auth token.
+    """
+    response = client.get(
+        LOG_API.format(run_id),
+        headers={**headers, "Range": f"bytes={offset}-"},
+        name="run_log",
+        stream=True,
+    )
+    if response.status_code == 416:  # nothing past offset yet
+        return [], offset
+    if response.status_code not in (200, 206):
+        raise RuntimeError(f"Reading run log failed with status {response.status_code}")
+
+    skip = offset if response.status_code == 200 else 0
+    data = bytearray()
+    try:
+        for chunk in response.iter_content():
+            if skip:
+                dropped = min(skip, len(chunk))
+                chunk, skip = chunk[dropped:], skip - dropped
+            data += chunk
+            if len(data) >= max_bytes:
+                break
+    finally:
+        response.close()
+
+    end = data.rfind(b"\n", 0, max_bytes) + 1
+    if end == 0 and len(data) >= max_bytes:
+        end = len(data)  # a single line longer than max_bytes: skip past it
+    return data[:end].decode("utf-8", errors="replace").splitlines(), offset + end
+
+
+def parse_line(line: str):
+    """Return ``(table, rows, table_done)`` for a progress line, or None."""
+    line = line.strip()
+    if not line:
+        return None
+    entry = None
+    if line.startswith("{"):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            entry = None
+    message = str(entry.get("message", "")) if isinstance(entry, dict) else line
+
+    table = rows = None
+    if isinstance(entry, dict):
+        table = next((entry[f] for f in _TABLE_FIELDS if entry.get(f)), None)
+        rows = next((entry[f] for f in _ROWS_FIELDS if isinstance(entry.get(f), int)), None)
+    if table is None:
+        match = _TABLE.search(message)
+        table = match.group(1) if match else None
+    if rows is None:
+        match = _ROWS.search(message)
+        rows = int(match.group(1).replace(",", "")) if match else None
+    if table is None:
+        return None
+    return str(table), rows, bool(_TABLE_DONE.search(message))
+
+
+def update_progress(progress: dict | None, lines, now: float) -> dict:
+    """
+    Fold new log ``lines`` into ``progress`` (as carried in the event) at time ``now``.
+
+    ``rows_per_sec`` values are rates since the previous poll, and
+    ``stalled_seconds`` is how long it has been since any row count moved.
+    """
+    progress = dict(progress or {})
+    tables = {name: dict(t) for name, t in (progress.get("tables") or {}).items()}
+    previous_rows = progress.get("rows_masked", 0)
+    previous_at = progress.get("updated_at", now)
+    previous_table_rows = {name: t.get("rows", 0) for name, t in tables.items()}
+    tables_completed = progress.get("tables_completed", 0)
+    tables_seen = progress.get("tables_seen", 0)
+
+    for line in lines:
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+        name, rows, done = parsed
+        if name not in tables:
+            tables[name] = {"rows": 0, "done": False}
+            tables_seen += 1
+        table = tables[name]
+        if rows is not None and rows > table["rows"]:
+            table["rows"] = rows
+        if done and not table["done"]:
+            table["done"] = True
+            tables_completed += 1
+
+    elapsed = now - previous_at
+    for name, table in tables.items():
+        moved = table["rows"] - previous_table_rows.get(name, 0)
+        table["rows_per_sec"] = round(moved / elapsed, 1) if elapsed > 0 else 0.0
+
+    rows_masked = max(previous_rows, progress.get("rows_retired", 0) + sum(t["rows"] for t in tables.values()))
+    rows_retired = progress.get("rows_retired", 0)
+    if len(tables) > MAX_TABLES:
+        for name in [n for n, t in tables.items() if t["done"]][: len(tables) - MAX_TABLES]:
+            rows_retired += tables.pop(name)["rows"]
+
+    last_progress_at = progress.get("last_progress_at", now)
+    if rows_masked > previous_rows:
+        last_progress_at = now
+
+    return {
+        "rows_masked": rows_masked,
+        "rows_per_sec": round((rows_masked - previous_rows) / elapsed, 1) if elapsed > 0 else 0.0,
+        "tables_seen": tables_seen,
+        "tables_completed": tables_completed,
+        "tables_in_progress": sorted(name for name, t in tables.items() if not t["done"]),
+        "stalled_seconds": round(now - last_progress_at),
+        "log_lines": progress.get("log_lines", 0) + len(lines),
+        "tables": tables,
+        "rows_retired": rows_retired,
+        "updated_at": now,
+        "last_progress_at": last_progress_at,
+    }
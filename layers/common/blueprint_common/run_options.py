@@ -0,0 +1,185 @@
+"""
+DataMasque run options for the masking run.
+
+``"RunOptions"`` in the execution input sets ``dry_run``, ``buffer_size``,
+``continue_on_failure`` and ``diagnostic_logging`` (``DEFAULT_OPTIONS``
+otherwise; ``run_secret`` always comes from the run secret). ``buffer_size``
+is the number of rows DataMasque fetches and writes per batch: wide rows
+thrash at a size that starves narrow lookup tables.
+
+``"buffer_size": "auto"`` picks it for the run:
+
+- the buffer size with the best rows/sec recorded for the ruleset, if any
+  (``record_result`` keeps an average per ruleset and buffer size in the
+  state store, kind ``run_stats``);
+- otherwise a size scaled to the staging instance's memory
+  (``memory_buffer_size``).
+
+``"BenchmarkBufferSizes"`` runs the ruleset once per listed size on the
+staging database, one after the other. Each run's duration and rows/sec are
+collected in ``Benchmark.Results`` and added to the history, so later
+``"auto"`` runs use the winner. The masked snapshot is taken after the last
+run.
+"""
+import logging
+import time
+from datetime import datetime
+
+from blueprint_common.state_store import get_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPTIONS = {"dry_run": False, "buffer_size": 10000, "continue_on_failure": False}
+
+OPTION_KEYS = ("dry_run", "buffer_size", "continue_on_failure", "diagnostic_logging")
+
+MIN_BUFFER_SIZE = 1000
+MAX_BUFFER_SIZE = 100000
+
+# Rows per GiB of staging instance memory for the memory heuristic (8 GiB,
+# e.g. db.m6g.large, gives the old fixed 10000).
+ROWS_PER_GIB = 1250
+
+HISTORY_KIND = "run_stats"
+HISTORY_TTL_SECONDS = 90 * 24 * 3600
+
+# Weight of the newest run in the recorded rows/sec average.
+HISTORY_WEIGHT = 0.5
+
+# vCPUs per instance size, and GiB of memory per vCPU by instance family
+# letter (db.r*: memory optimized, db.m*: general purpose, ...).
+SIZE_VCPUS = {
+    "micro": 2, "small": 2, "medium": 2, "large": 2, "xlarge": 4, "2xlarge": 8, "4xlarge": 16,
+    "8xlarge": 32, "12xlarge": 48, "16xlarge": 64, "24xlarge": 96, "32xlarge": 128, "48xlarge": 192,
+}
+BURSTABLE_GIB = {"micro": 1, "small": 2, "medium": 4, "large": 8, "xlarge": 16, "2xlarge": 32}
+GIB_PER_VCPU = {"m": 4, "r": 8, "x": 16, "z": 8}
+
+# Memory of one Aurora Serverless v2 capacity unit.
+GIB_PER_ACU = 2
+
+
+def option_errors(options) -> list:
+    """Why a "RunOptions" input is invalid (empty if it is fine)."""
+    if options is None:
+        return []
+    if not isinstance(options, dict):
+        return ["RunOptions must be an object"]
+    errors = [f"Unknown RunOptions key {key}" for key in options if key not in OPTION_KEYS]
+    size = options.get("buffer_size")
+    if size is not None and size != "auto" and (isinstance(size, bool) or not isinstance(size, int) or size < 1):
+        errors.append('RunOptions buffer_size must be a positive integer or "auto"')
+    for key in ("dry_run", "continue_on_failure", "diagnostic_logging"):
+        if key in options and not isinstance(options[key], bool):
+            errors.append(f"RunOptions {key} must be true or false")
+    return errors
+
+
+def instance_memory_gib(instance_class: str | None, scaling: dict | None = None) -> float | None:
+    """Approximate memory of an RDS instance class (None if unknown)."""
+    if not instance_class:
+        return None
+    if instance_class == "db.serverless":
+        return (scaling or {}).get("MaxCapacity", 0) * GIB_PER_ACU or None
+    _, family, size = (instance_class.split(".") + ["", ""])[:3]
+    if family.startswith("t"):
+        return BURSTABLE_GIB.get(size)
+    if size not in SIZE_VCPUS or family[:1] not in GIB_PER_VCPU:
+        return None
+    return SIZE_VCPUS[size] * GIB_PER_VCPU[family[:1]]
+
+
+def memory_buffer_size(memory_gib: float | None) -> int:
+    if not memory_gib:
+        return DEFAULT_OPTIONS["buffer_size"]
+    size = round(memory_gib * ROWS_PER_GIB, -3)
+    return int(min(max(size, MIN_BUFFER_SIZE), MAX_BUFFER_SIZE))
+
+
+def history(ruleset_id: str) -> dict:
+    """``{buffer size: {"RowsPerSecond": ..., "Runs": ...}}`` recorded for the ruleset."""
+    try:
+        stats = get_store().get(HISTORY_KIND, ruleset_id) or {}
+    except Exception as e:
+        logger.warning("Run history unavailable for %s: %s", ruleset_id, e)
+        return {}
+    return {int(size): entry for size, entry in stats.items()}
+
+
+def tuned_buffer_size(event: dict) -> tuple:
+    """``(buffer_size, reason)`` for ``"buffer_size": "auto"``."""
+    recorded = {size: entry for size, entry in history(event["DataMasqueRulesetId"]).items() if entry.get("RowsPerSecond")}
+    if recorded:
+        best = max(recorded, key=lambda size: recorded[size]["RowsPerSecond"])
+        return best, f"best recorded rows/sec for the ruleset ({recorded[best]['RowsPerSecond']})"
+    parameters = event.get("parameters") or {}
+    memory = instance_memory_gib(parameters.get("DBInstanceClass"), parameters.get("ServerlessV2ScalingConfiguration"))
+    return memory_buffer_size(memory), f"staging instance memory ({memory} GiB)"
+
+
+def resolve(event: dict) -> dict:
+    """
+    The run options for the next masking run (without ``run_secret``).
+
+    Starts or advances the buffer size benchmark when the input asks for one.
+    """
+    options = {**DEFAULT_OPTIONS, **(event.get("RunOptions") or {})}
+    benchmark = event.get("Benchmark")
+    if benchmark is None and event.get("BenchmarkBufferSizes"):
+        benchmark = event["Benchmark"] = {"Pending": list(event["BenchmarkBufferSizes"]), "Results": []}
+    if benchmark and benchmark.get("Pending"):
+        options["buffer_size"] = benchmark["Pending"].pop(0)
+        benchmark["Current"] = options["buffer_size"]
+        benchmark["Remaining"] = len(benchmark["Pending"])
+        logger.info("Benchmark run at buffer_size %s (%s more)", options["buffer_size"], benchmark["Remaining"])
+    elif options["buffer_size"] == "auto":
+        options["buffer_size"], reason = tuned_buffer_size(event)
+        logger.info("Tuned buffer_size to %s from %s", options["buffer_size"], reason)
+    return options
+
+
+def _seconds(run: dict) -> float | None:
+    try:
+        start = datetime.fromisoformat(run["start_time"])
+        end = datetime.fromisoformat(run["end_time"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return max((end - start).total_seconds(), 0.0)
+
+
+def record_result(event: dict, run: dict, now: float | None = None) -> dict | None:
+    """
+    Record a finished run's throughput in the benchmark and the ruleset history.
+
+    ``run`` is the DataMasque run object. Rows come from the run log progress
+    (``MaskRunProgress``) when it was read; without them only the duration
+    is reported and the history is left as it was.
+    """
+    buffer_size = (run.get("options") or {}).get("buffer_size")
+    seconds = _seconds(run)
+    rows = (event.get("MaskRunProgress") or {}).get("rows_masked")
+    rows_per_second = round(rows / seconds, 1) if rows and seconds else None
+    result = {"BufferSize": buffer_size, "Seconds": seconds, "Rows": rows, "RowsPerSecond": rows_per_second}
+
+    if event.get("Benchmark") is not None:
+        event["Benchmark"]["Results"].append(result)
+        logger.info("Benchmark result: %s", result)
+
+    if rows_per_second and buffer_size and event.get("DataMasqueRulesetId"):
+        ruleset_id = event["DataMasqueRulesetId"]
+        try:
+            store = get_store()
+            stats = store.get(HISTORY_KIND, ruleset_id) or {}
+            entry = stats.get(str(buffer_size)) or {"RowsPerSecond": rows_per_second, "Runs": 0}
+            entry = {
+                "RowsPerSecond": round(
+                    HISTORY_WEIGHT * rows_per_second + (1 - HISTORY_WEIGHT) * entry["RowsPerSecond"], 1
+                ),
+                "Runs": entry["Runs"] + 1,
+                "UpdatedAt": time.time() if now is None else now,
+            }
+            stats[str(buffer_size)] = entry
+            store.put(HISTORY_KIND, ruleset_id, stats, ttl_seconds=HISTORY_TTL_SECONDS)
+        except Exception as e:
+            logger.warning("Could not record run history for %s: %s", ruleset_id, e)
+    return result
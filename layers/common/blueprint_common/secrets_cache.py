@@ -0,0 +1,137 @@
+"""
+Per-container TTL cache for Secrets Manager lookups.
+
+The DataMasque Lambdas read the DataMasque credentials, the DB connection
+secret and (optionally) the run secret on every invocation; the status poller
+runs once a minute for the life of a masking run. Caching the lookups for a
+few minutes keeps warm invocations off the Secrets Manager API and well under
+its request quota when many executions poll concurrently.
+
+``SecretsCache.get_secret_value`` mirrors the boto3 call of the same name, so
+a cache can be passed anywhere a ``secretsmanager`` client is expected.
+
+Configuration (all optional environment variables):
+    SECRETS_CACHE_TTL_SECONDS           lifetime of a cached value (default 300)
+    SECRETS_CACHE_NEGATIVE_TTL_SECONDS  lifetime of a cached not-found (default 60)
+    SECRETS_CACHE_MAX_ENTRIES           entries kept before LRU eviction (default 32)
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from blueprint_common import aws
+
+logger = logging.getLogger(__name__)
+
+# Response fields worth keeping; ResponseMetadata etc. are dropped.
+_CACHED_FIELDS = ("ARN", "Name", "VersionId", "VersionStages", "SecretString", "SecretBinary")
+
+NOT_FOUND_CODES = frozenset({"ResourceNotFoundException"})
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class SecretsCache:
+    """
+    LRU + TTL cache in front of ``secretsmanager:GetSecretValue``.
+
+    Entries are keyed by (SecretId, VersionStage, VersionId); an omitted
+    VersionStage means AWSCURRENT, so AWSPENDING/AWSPREVIOUS lookups during
+    rotation never return each other's values. A ResourceNotFoundException is
+    cached for ``negative_ttl`` seconds and re-raised on each hit. Any other
+    error is raised without being cached.
+    """
+
+    def __init__(self, client=None, ttl: float | None = None, negative_ttl: float | None = None, max_entries: int | None = None):
+        self._client = client
+        self.ttl = ttl if ttl is not None else _env_int("SECRETS_CACHE_TTL_SECONDS", 300)
+        self.negative_ttl = (
+            negative_ttl
+            if negative_ttl is not None
+            else _env_int("SECRETS_CACHE_NEGATIVE_TTL_SECONDS", 60)
+        )
+        self.max_entries = max(
+            1, max_entries if max_entries is not None else _env_int("SECRETS_CACHE_MAX_ENTRIES", 32)
+        )
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The single long-lived Secrets Manager client, created on first use."""
+        if self._client is None:
+            self._client = aws.client("secretsmanager")
+        return self._client
+
+    def get_secret_value(self, SecretId: str, VersionStage: str | None = None, VersionId: str | None = None) -> dict:
+        from botocore.exceptions import ClientError
+
+        key = (SecretId, VersionStage or ("AWSCURRENT" if VersionId is None else None), VersionId)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                value = entry[1]
+                if isinstance(value, ClientError):
+                    raise value
+                return dict(value)
+
+        kwargs = {"SecretId": SecretId}
+        if VersionStage:
+            kwargs["VersionStage"] = VersionStage
+        if VersionId:
+            kwargs["VersionId"] = VersionId
+        try:
+            response = self.client.get_secret_value(**kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in NOT_FOUND_CODES:
+                self._store(key, e, self.negative_ttl)
+            raise
+        value = {k: response[k] for k in _CACHED_FIELDS if k in response}
+        self._store(key, value, self.ttl)
+        return dict(value)
+
+    def get_secret_json(self, secret_id: str) -> dict:
+        """The secret's SecretString parsed as JSON."""
+        return json.loads(self.get_secret_value(SecretId=secret_id)["SecretString"])
+
+    def _store(self, key, value, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, secret_id: str | None = None) -> None:
+        """Drop cached entries for ``secret_id``, or everything when omitted."""
+        with self._lock:
+            if secret_id is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == secret_id]:
+                    del self._entries[key]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_secrets_cache() -> SecretsCache:
+    """The per-container SecretsCache, created on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SecretsCache()
+    return _cache
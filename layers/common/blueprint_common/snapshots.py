@@ -0,0 +1,115 @@
+"""
+Source snapshot selection.
+
+``latest_snapshot()`` walks every page of ``DescribeDBSnapshots`` /
+``DescribeDBClusterSnapshots`` for the source and keeps a running best
+instead of sorting one 100-record page, so accounts with more snapshots than
+fit in a page still get the newest one. Snapshot types are filtered server
+side (``snapshot-type``); RDS has no status filter, so ``failed`` (and other
+unusable) snapshots are skipped while streaming.
+
+The newest ``available`` snapshot wins. Failing that, the newest one still
+being created is returned so the workflow waits for it rather than starting
+another; None means there is nothing to use or wait for.
+
+With ``"MaxSnapshotAgeHours"`` in the input, a snapshot older than that is
+not reused (``is_fresh``): the staging database is restored to the source's
+latest restorable time instead (``latest_restorable_time``), which needs no
+snapshot to be taken first.
+"""
+from datetime import datetime, timezone
+
+# DBType -> (operation, source filter parameter, list key, identifier key)
+OPERATIONS = {
+    "RDS": ("describe_db_snapshots", "DBInstanceIdentifier", "DBSnapshots", "DBSnapshotIdentifier"),
+    "Aurora": ("describe_db_cluster_snapshots", "DBClusterIdentifier", "DBClusterSnapshots", "DBClusterSnapshotIdentifier"),
+}
+
+SNAPSHOT_TYPES = ("automated", "manual", "shared", "awsbackup")
+
+# Statuses of a snapshot that will become available without intervention.
+IN_PROGRESS = ("creating", "copying", "pending")
+
+
+def _newer(candidate: dict, best: dict | None) -> bool:
+    created = candidate.get("SnapshotCreateTime")
+    if created is None:
+        return best is None
+    return best is None or best.get("SnapshotCreateTime") is None or created > best["SnapshotCreateTime"]
+
+
+def latest_snapshot(
+    client, db_type: str, db_identifier: str, snapshot_types=None, include_shared: bool = True
+) -> dict | None:
+    """
+    The snapshot to restore ``db_identifier`` from, in a single paginated pass.
+
+    ``snapshot_types`` limits the ``SnapshotType`` values considered (None:
+    all the API returns); ``include_shared=False`` ignores snapshots shared
+    from other accounts.
+    """
+    operation, source_param, list_key, _ = OPERATIONS[db_type]
+    kwargs = {source_param: db_identifier, "IncludeShared": include_shared}
+    if db_type == "RDS":
+        kwargs["IncludePublic"] = False
+    if snapshot_types:
+        kwargs["Filters"] = [{"Name": "snapshot-type", "Values": list(snapshot_types)}]
+
+    best_available, best_in_progress = None, None
+    for page in client.get_paginator(operation).paginate(**kwargs):
+        for snapshot in page[list_key]:
+            status = snapshot.get("Status")
+            if status == "available":
+                if _newer(snapshot, best_available):
+                    best_available = snapshot
+            elif status in IN_PROGRESS and _newer(snapshot, best_in_progress):
+                best_in_progress = snapshot
+    return best_available or best_in_progress
+
+
+def describe_snapshot(client, db_type: str, snapshot_identifier: str) -> dict:
+    """Re-read one snapshot by identifier (e.g. one the workflow is waiting on)."""
+    operation, _, list_key, id_key = OPERATIONS[db_type]
+    response = getattr(client, operation)(**{id_key: snapshot_identifier})
+    return response[list_key][0]
+
+
+def snapshot_identifier(db_type: str, snapshot: dict) -> str:
+    return snapshot[OPERATIONS[db_type][3]]
+
+
+def age_hours(snapshot: dict, now: datetime | None = None) -> float | None:
+    """Hours since ``SnapshotCreateTime`` (None while RDS has not set it)."""
+    created = snapshot.get("SnapshotCreateTime")
+    if created is None:
+        return None
+    now = datetime.now(timezone.utc) if now is None else now
+    return round((now - created).total_seconds() / 3600, 2)
+
+
+def is_fresh(snapshot: dict | None, max_age_hours: float | None, now: datetime | None = None) -> bool:
+    """
+    Whether ``snapshot`` may be reused under ``max_age_hours`` (None: any age).
+
+    A snapshot still being created has no age yet and counts as fresh.
+    """
+    if snapshot is None:
+        return False
+    if max_age_hours is None:
+        return True
+    age = age_hours(snapshot, now)
+    return age is None or age <= float(max_age_hours)
+
+
+def latest_restorable_time(client, db_type: str, db_identifier: str) -> datetime | None:
+    """
+    The source's latest point-in-time restore time, or None if it has none
+    (automated backups disabled, or none taken yet).
+    """
+    if db_type == "Aurora":
+        source = client.describe_db_clusters(DBClusterIdentifier=db_identifier)["DBClusters"][0]
+    else:
+        source = client.describe_db_instances(DBInstanceIdentifier=db_identifier)["DBInstances"][0]
+    if not source.get("BackupRetentionPeriod"):
+        return None
+    return source.get("LatestRestorableTime")
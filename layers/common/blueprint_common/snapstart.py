@@ -0,0 +1,91 @@
+"""
+Lambda SnapStart support.
+
+With SnapStart enabled (``SnapStartApplyOn: PublishedVersions`` in the
+template), Lambda runs each function's init once when a version is published,
+snapshots the memory, and restores new execution environments from that
+snapshot. Work done during that init is therefore free on scale-out, so each
+handler calls ``init()`` at import:
+
+- during a SnapStart init (``AWS_LAMBDA_INITIALIZATION_TYPE=snap-start``) it
+  imports boto3/urllib3, builds the handler's boto3 clients and loads the
+  botocore operation models it will call, so the first invocation after a
+  restore runs at warm-equivalent latency;
+- for on-demand inits it does nothing, keeping the slim lazy import path.
+
+Runtime hooks (registered when the runtime provides ``snapshot_restore_py``):
+
+- before snapshot: close pooled DataMasque sockets so none are frozen into
+  the snapshot;
+- after restore: re-seed ``random`` (backoff jitter would otherwise repeat
+  identically across every environment restored from one snapshot), drop any
+  pooled sockets, cached DataMasque tokens and cached secrets, which may be
+  stale by the time the snapshot is restored. ``secrets`` draws from
+  ``os.urandom`` and needs no re-seeding.
+"""
+import logging
+import os
+import random
+
+from blueprint_common import aws, datamasque, rds, secrets_cache
+
+logger = logging.getLogger(__name__)
+
+_hooks_registered = False
+
+
+def is_snapstart_init() -> bool:
+    return os.environ.get("AWS_LAMBDA_INITIALIZATION_TYPE") == "snap-start"
+
+
+def prime(clients: dict, datamasque_pool: bool = False) -> None:
+    """
+    Build boto3 clients and load their operation models ahead of use.
+
+    ``clients`` maps a service name to the operation names the handler calls,
+    e.g. ``{"rds": ["DescribeDBInstances"]}``.
+    """
+    for service_name, operations in clients.items():
+        # RDS goes through its throttle-aware wrapper, so the client primed
+        # is the one the handlers use.
+        client = rds.client() if service_name == "rds" else aws.client(service_name)
+        for operation in operations:
+            client.meta.service_model.operation_model(operation)
+    if datamasque_pool:
+        # Constructs the pool managers (and imports urllib3) without opening
+        # a connection; sockets are only opened after restore.
+        datamasque.get_pool(True)
+        datamasque.get_pool(False)
+
+
+def before_snapshot() -> None:
+    datamasque.reset_pools()
+
+
+def after_restore() -> None:
+    random.seed()
+    datamasque.reset_pools()
+    datamasque.clear_tokens()
+    secrets_cache.get_secrets_cache().invalidate()
+
+
+def register_hooks() -> None:
+    """Register the SnapStart runtime hooks once, if the runtime supports them."""
+    global _hooks_registered
+    if _hooks_registered:
+        return
+    try:
+        from snapshot_restore_py import register_after_restore, register_before_snapshot
+    except ImportError:
+        return  # not running on a SnapStart-capable runtime (e.g. tests)
+    register_before_snapshot(before_snapshot)
+    register_after_restore(after_restore)
+    _hooks_registered = True
+
+
+def init(clients: dict, datamasque_pool: bool = False) -> None:
+    """Handler-module entry point: register hooks and, under SnapStart, prime."""
+    register_hooks()
+    if is_snapstart_init():
+        prime(clients, datamasque_pool=datamasque_pool)
+        logger.info("SnapStart init primed clients: %s", sorted(clients))
@@ -0,0 +1,310 @@
+"""
+How the staging database is created.
+
+``"StagingMode"`` in the execution input:
+
+- ``"restore"`` (default): restore the source snapshot (or, with
+  ``MaxSnapshotAgeHours``, the latest restorable time) into a new instance
+  or cluster;
+- ``"clone"``: Aurora only. Create the staging cluster as a copy-on-write
+  clone of the source cluster (``RestoreDBClusterToPointInTime`` with
+  ``RestoreType="copy-on-write"``). A clone shares the source's storage
+  pages until either side writes them, so it is ready in minutes whatever
+  the volume size, and there is no snapshot to select or wait for. For RDS
+  sources the mode falls back to ``"restore"``.
+
+An Aurora cluster is created without instances, so the workflow adds a
+writer instance, ``<staging id>-1`` (``writer_instance_params``). It is
+created as soon as the cluster restore or clone is accepted (RDS accepts a
+member while the cluster is still ``creating``), and
+``CheckDBAvailability`` waits for the cluster and the instance together.
+
+The staging instance is sized by ``apply_profile``: ``"StagingProfile"``
+picks a policy (``"source"``, the default, copies the source's class;
+``"performance"`` scales up per ``PERFORMANCE_POLICY``) and
+``"StagingInstance"`` overrides individual settings. Masking is write-bound,
+so a larger temporary instance and faster storage usually cost less than the
+extra hours of runtime on a copy of a small production instance.
+
+The staging database is thrown away after the run, so by default
+(``"WriteOptimizedStaging"``, true unless set to false) it is also restored
+without the durability the source pays for on every write: single-AZ, no
+automated backups (one day for Aurora, the minimum), no Performance
+Insights or Enhanced Monitoring on the Aurora writer, and, for RDS
+PostgreSQL, MySQL and MariaDB, a staging parameter group with relaxed
+commit and flush settings (``staging_parameter_group``). Nothing is
+reverted afterwards.
+"""
+import logging
+
+from blueprint_common import rds
+
+logger = logging.getLogger(__name__)
+
+STAGING_MODES = ("restore", "clone")
+
+
+def clone_mode(event: dict) -> bool:
+    return event.get("StagingMode") == "clone"
+
+
+def writer_instance_id(event: dict) -> str:
+    return f'{event["parameters"]["DBInstanceIdentifier"]}-1'
+
+
+def writer_instance_params(event: dict) -> dict:
+    """``CreateDBInstance`` arguments for the staging Aurora cluster's writer."""
+    params = event["parameters"]
+    instance_params = {
+        "DBInstanceIdentifier": writer_instance_id(event),
+        "DBInstanceClass": params["DBInstanceClass"],
+        "Engine": params["Engine"],
+        "DBClusterIdentifier": params["DBInstanceIdentifier"],
+        "DBSubnetGroupName": params["DBSubnetGroupName"],
+    }
+    # PreferredAZ is optional: describe_db_instances resolved it into
+    # parameters.AvailabilityZone (None for Aurora when not supplied). Only
+    # pin the AZ when one is known.
+    az = params.get("AvailabilityZone") or event.get("PreferredAZ")
+    if az:
+        instance_params["AvailabilityZone"] = az
+    if params.get("DBParameterGroupName"):
+        instance_params["DBParameterGroupName"] = params["DBParameterGroupName"]
+    if write_optimized(event):
+        instance_params["EnablePerformanceInsights"] = False
+        instance_params["MonitoringInterval"] = 0
+    return instance_params
+
+
+# --- Staging instance sizing ------------------------------------------------
+
+STAGING_PROFILES = ("source", "performance")
+
+# Keys accepted in the "StagingInstance" execution input.
+OVERRIDE_KEYS = ("DBInstanceClass", "StorageType", "Iops", "StorageThroughput", "MinCapacity", "MaxCapacity")
+
+INSTANCE_SIZES = (
+    "micro", "small", "medium", "large", "xlarge", "2xlarge", "4xlarge",
+    "8xlarge", "12xlarge", "16xlarge", "24xlarge", "32xlarge", "48xlarge",
+)
+
+# Engine family -> what StagingProfile "performance" provisions. "MinSize"
+# raises the instance class to at least that size within the source's
+# family (db.r6g.large -> db.r6g.2xlarge); storage settings apply to RDS
+# instances, "MinCapacity" / "MaxCapacity" (ACUs) to Aurora Serverless v2
+# writers.
+PERFORMANCE_POLICY = {
+    "postgres": {"MinSize": "2xlarge", "StorageType": "gp3", "Iops": 20000, "StorageThroughput": 1000},
+    "mysql": {"MinSize": "2xlarge", "StorageType": "gp3", "Iops": 20000, "StorageThroughput": 1000},
+    "mariadb": {"MinSize": "2xlarge", "StorageType": "gp3", "Iops": 20000, "StorageThroughput": 1000},
+    "oracle": {"MinSize": "2xlarge", "StorageType": "gp3", "Iops": 20000, "StorageThroughput": 1000},
+    "sqlserver": {"MinSize": "2xlarge", "StorageType": "gp3", "Iops": 12000, "StorageThroughput": 500},
+    "aurora-postgresql": {"MinSize": "2xlarge", "MinCapacity": 8, "MaxCapacity": 64},
+    "aurora-mysql": {"MinSize": "2xlarge", "MinCapacity": 8, "MaxCapacity": 64},
+}
+
+# Serverless v2 capacity (ACUs) for a bound neither the source nor the
+# "StagingInstance" input gives, under StagingProfile "source".
+SERVERLESS_V2_DEFAULTS = {"MinCapacity": 0.5, "MaxCapacity": 64}
+
+# gp3 IOPS and throughput can only be provisioned at or above this much
+# allocated storage (GiB); below it the volume gets the gp3 baseline.
+GP3_THRESHOLD_GIB = {"oracle": 200, "sqlserver": 20}
+GP3_THRESHOLD_GIB_DEFAULT = 400
+
+# Highest provisioned IOPS per GiB of allocated storage.
+MAX_IOPS_PER_GIB = {"gp3": 500, "io1": 50, "io2": 1000}
+
+
+def engine_family(engine: str) -> str:
+    """``"oracle-ee"`` -> ``"oracle"``; Aurora engines are kept whole."""
+    return engine if engine.startswith("aurora") else engine.split("-")[0]
+
+
+def scaled_instance_class(instance_class: str, min_size: str) -> str:
+    """``instance_class`` raised to at least ``min_size`` within its family."""
+    family, _, size = instance_class.rpartition(".")
+    if size not in INSTANCE_SIZES or INSTANCE_SIZES.index(size) >= INSTANCE_SIZES.index(min_size):
+        return instance_class
+    return f"{family}.{min_size}"
+
+
+def override_errors(overrides) -> list:
+    """Why a "StagingInstance" input is invalid (empty if it is fine)."""
+    if overrides is None:
+        return []
+    if not isinstance(overrides, dict):
+        return ["StagingInstance must be an object"]
+    errors = [f"Unknown StagingInstance key {key}" for key in overrides if key not in OVERRIDE_KEYS]
+    for key in ("Iops", "StorageThroughput", "MinCapacity", "MaxCapacity"):
+        value = overrides.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+            errors.append(f"StagingInstance {key} must be a positive number")
+    for key in ("DBInstanceClass", "StorageType"):
+        if key in overrides and not isinstance(overrides[key], str):
+            errors.append(f"StagingInstance {key} must be a string")
+    if not errors and overrides.get("MinCapacity") and overrides.get("MaxCapacity"):
+        if overrides["MinCapacity"] > overrides["MaxCapacity"]:
+            errors.append("StagingInstance MinCapacity must not exceed MaxCapacity")
+    return errors
+
+
+def _storage_settings(policy: dict, source: dict) -> dict:
+    family = engine_family(source["Engine"])
+    storage_type = source.get("StorageType")
+    allocated = source.get("AllocatedStorage") or 0
+    if storage_type in ("io1", "io2"):
+        # Already provisioned IOPS: keep the volume type, raise its IOPS.
+        iops = max(source.get("Iops") or 0, policy["Iops"])
+        return {"StorageType": storage_type, "Iops": _within_ratio(iops, storage_type, allocated)}
+    settings = {"StorageType": policy["StorageType"]}
+    if allocated >= GP3_THRESHOLD_GIB.get(family, GP3_THRESHOLD_GIB_DEFAULT):
+        settings["Iops"] = _within_ratio(policy["Iops"], "gp3", allocated)
+        settings["StorageThroughput"] = policy["StorageThroughput"]
+    return settings
+
+
+def _within_ratio(iops: int, storage_type: str, allocated: int) -> int:
+    return min(iops, MAX_IOPS_PER_GIB[storage_type] * allocated) if allocated else iops
+
+
+def apply_profile(parameters: dict, db_type: str, source: dict, profile: str | None = None, overrides: dict | None = None) -> dict:
+    """
+    Set the staging instance class, storage and Serverless v2 capacity in
+    ``parameters`` and return it.
+
+    ``source`` describes the source database (``Engine``,
+    ``DBInstanceClass``, and for RDS ``StorageType``, ``AllocatedStorage``,
+    ``Iops``; for Aurora ``ServerlessV2ScalingConfiguration``). Profile
+    ``"source"`` (the default) copies the source class and capacity and
+    leaves storage as restored; ``"performance"`` applies
+    ``PERFORMANCE_POLICY``. ``overrides`` ("StagingInstance") win over both.
+    With ``MinCapacity`` / ``MaxCapacity`` and no class, an Aurora writer
+    becomes ``db.serverless``; a bound given by neither the source nor the
+    overrides comes from the profile (``SERVERLESS_V2_DEFAULTS`` for
+    ``"source"``). Raises ValueError if the capacity range is inverted.
+    """
+    overrides = overrides or {}
+    parameters["DBInstanceClass"] = source["DBInstanceClass"]
+    scaling = dict(source.get("ServerlessV2ScalingConfiguration") or {}) if db_type == "Aurora" else {}
+
+    policy = PERFORMANCE_POLICY.get(engine_family(source["Engine"])) if profile == "performance" else None
+    if policy:
+        parameters["DBInstanceClass"] = scaled_instance_class(source["DBInstanceClass"], policy["MinSize"])
+        if db_type == "RDS":
+            parameters.update(_storage_settings(policy, source))
+        elif parameters["DBInstanceClass"] == "db.serverless":
+            scaling["MinCapacity"] = max(scaling.get("MinCapacity", 0), policy["MinCapacity"])
+            scaling["MaxCapacity"] = max(scaling.get("MaxCapacity", 0), policy["MaxCapacity"])
+
+    for key in ("DBInstanceClass", "StorageType", "Iops", "StorageThroughput"):
+        if key in overrides:
+            parameters[key] = overrides[key]
+    if db_type == "Aurora":
+        for key in ("MinCapacity", "MaxCapacity"):
+            if key in overrides:
+                scaling[key] = overrides[key]
+                if "DBInstanceClass" not in overrides:
+                    parameters["DBInstanceClass"] = "db.serverless"
+        if scaling:
+            defaults = policy or SERVERLESS_V2_DEFAULTS
+            for key in ("MinCapacity", "MaxCapacity"):
+                scaling.setdefault(key, defaults[key])
+            if scaling["MinCapacity"] > scaling["MaxCapacity"]:
+                raise ValueError(
+                    f"Serverless v2 MinCapacity {scaling['MinCapacity']} exceeds MaxCapacity {scaling['MaxCapacity']}"
+                )
+            parameters["ServerlessV2ScalingConfiguration"] = scaling
+    return parameters
+
+
+# --- Write-optimized staging ------------------------------------------------
+
+# Engine (parameter group family prefix) -> dynamic parameters relaxed in the
+# staging parameter group. A crash can lose the last commits, which does not
+# matter for a copy that is masked from scratch and discarded.
+WRITE_OPTIMIZED_PARAMETERS = {
+    "postgres": {
+        "synchronous_commit": "off",
+        "checkpoint_timeout": "1800",
+        "max_wal_size": "8192",
+    },
+    "mysql": {
+        "innodb_flush_log_at_trx_commit": "2",
+        "sync_binlog": "0",
+    },
+    "mariadb": {
+        "innodb_flush_log_at_trx_commit": "2",
+        "sync_binlog": "0",
+    },
+}
+
+STAGING_PARAMETER_GROUP_PREFIX = "datamasque-staging-"
+
+
+def write_optimized(event: dict) -> bool:
+    return event.get("WriteOptimizedStaging", True) is not False
+
+
+def _parameter_group_engine(family: str) -> str:
+    """``"postgres16"`` -> ``"postgres"``, ``"mysql8.0"`` -> ``"mysql"``."""
+    return family.rstrip("0123456789.")
+
+
+def staging_parameter_group_name(source_group: str, family: str) -> str:
+    # Default groups ("default.postgres16") are named after their family;
+    # parameter group names only allow letters, digits and hyphens.
+    base = family if source_group.startswith("default.") else source_group
+    name = (STAGING_PARAMETER_GROUP_PREFIX + base.replace(".", "-"))[:255]
+    return name.rstrip("-")
+
+
+def staging_parameter_group(client, source_group: str | None) -> str | None:
+    """
+    The write-optimized staging parameter group for ``source_group``,
+    created on first use and re-tuned on every run.
+
+    A custom source group is copied, so the staging database keeps its
+    settings; a default group is replaced by a new group of the same family.
+    Returns ``source_group`` unchanged when the engine has no tuning or the
+    group cannot be prepared.
+    """
+    if not source_group:
+        return source_group
+    from botocore.exceptions import ClientError
+
+    try:
+        family = client.describe_db_parameter_groups(DBParameterGroupName=source_group)["DBParameterGroups"][0][
+            "DBParameterGroupFamily"
+        ]
+        tuning = WRITE_OPTIMIZED_PARAMETERS.get(_parameter_group_engine(family))
+        if not tuning:
+            return source_group
+        name = staging_parameter_group_name(source_group, family)
+        description = f"DataMasque write-optimized staging parameters ({source_group})"
+        try:
+            if source_group.startswith("default."):
+                client.create_db_parameter_group(
+                    DBParameterGroupName=name, DBParameterGroupFamily=family, Description=description
+                )
+            else:
+                client.copy_db_parameter_group(
+                    SourceDBParameterGroupIdentifier=source_group,
+                    TargetDBParameterGroupIdentifier=name,
+                    TargetDBParameterGroupDescription=description,
+                )
+            logger.info("Created staging parameter group %s", name)
+        except client.exceptions.DBParameterGroupAlreadyExistsFault:
+            pass
+        client.modify_db_parameter_group(
+            DBParameterGroupName=name,
+            Parameters=[
+                {"ParameterName": key, "ParameterValue": value, "ApplyMethod": "immediate"}
+                for key, value in sorted(tuning.items())
+            ],
+        )
+        return name
+    except ClientError as e:
+        rds.raise_if_throttled(e)
+        logger.warning("Using %s: could not prepare a staging parameter group: %s", source_group, e)
+        return source_group
@@ -0,0 +1,127 @@
+"""
+Small key/value store shared across executions and invocations.
+
+Items are JSON-serialisable dicts addressed by ``(kind, key)``, e.g.
+``("masking_run", "<run id>")``. ``items(kind)`` lists every live item of a
+kind, which is how the watcher finds all in-flight runs in one query.
+
+Backends:
+
+- ``DynamoDBStore``: a table with partition key ``kind`` and sort key ``key``
+  (both strings); the value is stored as a JSON string and ``expires_at``
+  (epoch seconds) is the table's TTL attribute. Expired items are also
+  filtered on read, since DynamoDB removes them lazily.
+- ``MemoryStore``: process-local, for tests and local runs.
+
+``get_store()`` returns the DynamoDB store when ``STATE_TABLE_NAME`` is set
+and a process-wide memory store otherwise.
+"""
+import json
+import os
+import threading
+import time
+
+from blueprint_common import aws
+
+
+class MemoryStore:
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def put(self, kind: str, key: str, value: dict, ttl_seconds: float | None = None) -> None:
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._items[(kind, key)] = (json.loads(json.dumps(value)), expires_at)
+
+    def get(self, kind: str, key: str) -> dict | None:
+        with self._lock:
+            entry = self._items.get((kind, key))
+        if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+            return None
+        return json.loads(json.dumps(entry[0]))
+
+    def delete(self, kind: str, key: str) -> None:
+        with self._lock:
+            self._items.pop((kind, key), None)
+
+    def items(self, kind: str) -> list:
+        now = time.time()
+        with self._lock:
+            entries = [(k[1], v) for k, v in self._items.items() if k[0] == kind]
+        return [(key, json.loads(json.dumps(value))) for key, (value, expires) in entries if expires is None or expires > now]
+
+
+class DynamoDBStore:
+    def __init__(self, table_name: str, client=None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = aws.client("dynamodb")
+        return self._client
+
+    def put(self, kind: str, key: str, value: dict, ttl_seconds: float | None = None) -> None:
+        item = {"kind": {"S": kind}, "key": {"S": key}, "value": {"S": json.dumps(value)}}
+        if ttl_seconds:
+            item["expires_at"] = {"N": str(int(time.time() + ttl_seconds))}
+        self.client.put_item(TableName=self.table_name, Item=item)
+
+    def get(self, kind: str, key: str) -> dict | None:
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"kind": {"S": kind}, "key": {"S": key}},
+            ConsistentRead=True,
+        )
+        item = response.get("Item")
+        return self._value(item, time.time()) if item else None
+
+    def delete(self, kind: str, key: str) -> None:
+        self.client.delete_item(TableName=self.table_name, Key={"kind": {"S": kind}, "key": {"S": key}})
+
+    def items(self, kind: str) -> list:
+        now = time.time()
+        results = []
+        paginator = self.client.get_paginator("query")
+        for page in paginator.paginate(
+            TableName=self.table_name,
+            KeyConditionExpression="#kind = :kind",
+            ExpressionAttributeNames={"#kind": "kind"},
+            ExpressionAttributeValues={":kind": {"S": kind}},
+        ):
+            for item in page["Items"]:
+                value = self._value(item, now)
+                if value is not None:
+                    results.append((item["key"]["S"], value))
+        return results
+
+    @staticmethod
+    def _value(item: dict, now: float) -> dict | None:
+        expires_at = item.get("expires_at")
+        if expires_at is not None and float(expires_at["N"]) <= now:
+            return None
+        return json.loads(item["value"]["S"])
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The per-container store, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                table_name = os.environ.get("STATE_TABLE_NAME")
+                _store = DynamoDBStore(table_name) if table_name else MemoryStore()
+    return _store
+
+
+def reset_store() -> None:
+    """Drop the per-container store; the next ``get_store()`` builds a new one."""
+    global _store
+    with _store_lock:
+        _store = None
@@ -0,0 +1,68 @@
+"""
+Overlapping independent calls within one invocation, with per-step timings.
+
+Handlers submit independent network calls (Secrets Manager lookups,
+DataMasque requests) to a per-container thread pool so their round trips
+overlap, and record how long each step took. boto3 clients, the DataMasque
+connection pools, and the token and secrets caches are all safe to share
+between these threads.
+
+Configuration (optional environment variable):
+    BLUEPRINT_MAX_WORKERS  threads in the per-container pool (default 4)
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor() -> ThreadPoolExecutor:
+    """The per-container thread pool, created on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                try:
+                    workers = int(os.environ.get("BLUEPRINT_MAX_WORKERS", 4))
+                except ValueError:
+                    workers = 4
+                _executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="blueprint")
+    return _executor
+
+
+class StepTimer:
+    """
+    Wall-clock milliseconds per named step of one invocation.
+
+    Steps may run concurrently; ``as_dict()`` adds the ``total`` elapsed
+    since the timer was created, which is less than the sum of the steps
+    when they overlapped.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def submit(self, name: str, fn, *args, **kwargs) -> Future:
+        """Run ``fn(*args, **kwargs)`` on the pool, timed as step ``name``."""
+
+        def timed():
+            with self.step(name):
+                return fn(*args, **kwargs)
+
+        return executor().submit(timed)
+
+    def as_dict(self) -> dict:
+        return {**self.timings, "total": round((time.perf_counter() - self._start) * 1000, 1)}
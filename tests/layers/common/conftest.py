@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Make the layer package importable as `blueprint_common`, as it is from
+# /opt/python inside Lambda. The tests live outside layers/common so they
+# are not packaged into the layer.
+_layer = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "layers", "common"))
+if _layer not in sys.path:
+    sys.path.insert(0, _layer)
@@ -0,0 +1,26 @@
+"""
+Unit tests for blueprint_common.aws.
+
+Run from this directory:
+    pytest test_aws.py -v
+"""
+import os
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from blueprint_common import aws
+
+
+def test_client_is_built_once_per_service():
+    aws.reset_clients()
+
+    assert aws.client("rds") is aws.client("rds")
+    assert aws.client("rds") is not aws.client("secretsmanager")
+
+
+def test_reset_clients_forces_a_new_client():
+    first = aws.client("rds")
+
+    aws.reset_clients()
+
+    assert aws.client("rds") is not first
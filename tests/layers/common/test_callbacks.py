@@ -0,0 +1,65 @@
+"""
+Unit tests for blueprint_common.callbacks.
+
+Run from this directory:
+    pytest test_callbacks.py -v
+"""
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from blueprint_common import callbacks, state_store
+
+
+class _FakeStepFunctions:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def _call(self, operation, kwargs):
+        self.calls.append((operation, kwargs))
+        if self.error:
+            raise ClientError({"Error": {"Code": self.error}}, operation)
+
+    def send_task_success(self, **kwargs):
+        self._call("SendTaskSuccess", kwargs)
+
+    def send_task_failure(self, **kwargs):
+        self._call("SendTaskFailure", kwargs)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    monkeypatch.delenv("STATE_TABLE_NAME", raising=False)
+    state_store.reset_store()
+    yield state_store.get_store()
+    state_store.reset_store()
+
+
+def test_register_parks_token_without_run_secret(store):
+    callbacks.register("masking_run", "42", "tok", {"MaskRunId": 42, "RunSecret": "hush"}, Extra=1)
+
+    assert store.get("masking_run", "42") == {"TaskToken": "tok", "Output": {"MaskRunId": 42}, "Extra": 1}
+
+
+def test_succeed_sends_output(monkeypatch):
+    sfn = _FakeStepFunctions()
+    monkeypatch.setattr(callbacks.aws, "client", lambda name: sfn)
+
+    assert callbacks.succeed("tok", {"MaskRunStatus": "finished"}) is True
+    assert sfn.calls == [("SendTaskSuccess", {"taskToken": "tok", "output": json.dumps({"MaskRunStatus": "finished"})})]
+
+
+@pytest.mark.parametrize("code", sorted(callbacks.GONE_ERRORS))
+def test_gone_task_is_not_an_error(monkeypatch, code):
+    monkeypatch.setattr(callbacks.aws, "client", lambda name: _FakeStepFunctions(code))
+
+    assert callbacks.fail("tok", "Boom", "cause") is False
+
+
+def test_other_errors_propagate(monkeypatch):
+    monkeypatch.setattr(callbacks.aws, "client", lambda name: _FakeStepFunctions("ThrottlingException"))
+
+    with pytest.raises(ClientError):
+        callbacks.succeed("tok", {})
@@ -0,0 +1,312 @@
+"""
+Unit tests for the pooled DataMasque client in blueprint_common.datamasque.
+
+Run from this directory:
+    pytest test_datamasque.py -v
+"""
+import json
+
+import pytest
+from urllib3.exceptions import NewConnectionError, ProtocolError, ReadTimeoutError
+
+from blueprint_common import datamasque
+from blueprint_common.datamasque import DataMasqueClient, get_client
+
+
+class _FakeResponse:
+    """Stands in for a urllib3.HTTPResponse."""
+
+    def __init__(self, status, headers=None, payload=None):
+        self.status = status
+        self.headers = headers or {}
+        self.data = json.dumps(payload if payload is not None else {}).encode()
+
+
+class _FakeStream(_FakeResponse):
+    """A preload_content=False response that hands its body out in small chunks."""
+
+    def __init__(self, payload, chunk_size=7):
+        super().__init__(200, payload=payload)
+        self.chunk_size = chunk_size
+        self.chunks_read = 0
+        self.closed = False
+
+    def stream(self, amt):
+        for i in range(0, len(self.data), self.chunk_size):
+            self.chunks_read += 1
+            yield self.data[i:i + self.chunk_size]
+
+    def close(self):
+        self.closed = True
+
+    def release_conn(self):
+        pass
+
+
+class _FakePool:
+    """Replays a scripted list of responses / exceptions and records calls."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    fake = _FakePool([])
+    monkeypatch.setattr(datamasque, "get_pool", lambda verify: fake)
+    monkeypatch.setattr(datamasque.time, "sleep", lambda s: None)
+    datamasque.clear_tokens()
+    yield fake
+    datamasque.clear_tokens()
+
+
+def _client(**kwargs):
+    kwargs.setdefault("max_attempts", 3)
+    return DataMasqueClient("https://dm/", verify=False, **kwargs)
+
+
+def test_get_retries_transient_status_then_succeeds(pool):
+    pool.outcomes = [_FakeResponse(503), _FakeResponse(429), _FakeResponse(200)]
+    client = _client()
+
+    response = client.get("api/runs/1/", name="runs")
+
+    assert response.status_code == 200
+    assert len(pool.calls) == 3
+    assert client.metrics["runs"]["calls"] == 1
+    assert client.metrics["runs"]["retries"] == 2
+    assert client.metrics["runs"]["errors"] == 0
+
+
+def test_request_passes_url_timeouts_and_json_body(pool):
+    pool.outcomes = [_FakeResponse(200, payload=[{"id": "c1"}])]
+
+    response = _client(connect_timeout=1, read_timeout=2).post(
+        "api/connections/", json={"name": "x"}, headers={"Authorization": "Token t"}
+    )
+
+    method, url, kwargs = pool.calls[0]
+    assert (method, url) == ("POST", "https://dm/api/connections/")
+    assert (kwargs["timeout"].connect_timeout, kwargs["timeout"].read_timeout) == (1, 2)
+    assert kwargs["retries"] is False
+    assert json.loads(kwargs["body"]) == {"name": "x"}
+    assert kwargs["headers"] == {"Authorization": "Token t", "Content-Type": "application/json"}
+    assert response.json() == [{"id": "c1"}]
+
+
+def test_post_is_not_retried_on_server_error_by_default(pool):
+    pool.outcomes = [_FakeResponse(502)]
+    client = _client()
+
+    response = client.post("api/runs/", json={}, name="create_run")
+
+    assert response.status_code == 502
+    assert len(pool.calls) == 1
+    assert client.metrics["create_run"]["errors"] == 1
+
+
+def test_post_opted_in_retries_connection_reset(pool):
+    pool.outcomes = [ProtocolError("reset"), _FakeResponse(200)]
+
+    response = _client().post("api/auth/token/login/", retry=True)
+
+    assert response.status_code == 200
+    assert len(pool.calls) == 2
+
+
+def test_post_retries_connect_failure_even_without_opt_in(pool):
+    pool.outcomes = [NewConnectionError(None, "refused"), _FakeResponse(201)]
+
+    assert _client().post("api/runs/").status_code == 201
+
+
+def test_get_retries_new_connection_error(pool):
+    pool.outcomes = [NewConnectionError(None, "Name or service not known"), _FakeResponse(200)]
+    client = _client()
+
+    assert client.get("api/runs/1/", name="runs").status_code == 200
+    assert client.metrics["runs"]["retries"] == 1
+
+
+def test_get_retries_read_timeout_but_post_does_not(pool):
+    pool.outcomes = [ReadTimeoutError(None, "https://dm/api/runs/1/", "read timed out"), _FakeResponse(200)]
+    assert _client().get("api/runs/1/").status_code == 200
+    assert len(pool.calls) == 2
+
+    pool.outcomes = [ReadTimeoutError(None, "https://dm/api/runs/", "read timed out")]
+    with pytest.raises(ReadTimeoutError):
+        _client().post("api/runs/")
+    assert len(pool.calls) == 3
+
+
+def test_exhausted_connection_errors_are_raised(pool):
+    pool.outcomes = [ProtocolError("reset")] * 3
+    client = _client()
+
+    with pytest.raises(ProtocolError):
+        client.get("api/runs/1/", name="runs")
+    assert len(pool.calls) == 3
+    assert client.metrics["runs"]["errors"] == 1
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= datamasque.backoff_delay(attempt) <= datamasque.BACKOFF_CAP_SECONDS
+
+
+def test_get_client_is_reused_per_base_url():
+    assert get_client("https://a/") is get_client("https://a/")
+    assert get_client("https://a/") is not get_client("https://b/")
+
+
+# --- auth token cache ------------------------------------------------------
+
+
+def _login_response(key, expires="2999-01-01T00:00:00.000000Z"):
+    return _FakeResponse(200, payload={"key": key, "date_time_expires": expires})
+
+
+def test_login_is_cached_across_calls_and_clients(pool):
+    pool.outcomes = [_login_response("tok-1")]
+
+    first = _client().login("admin", "pw")
+    second = _client().login("admin", "pw")
+
+    assert first["key"] == second["key"] == "tok-1"
+    assert len(pool.calls) == 1
+
+
+def test_login_refreshes_near_expiry_and_logs_out_superseded_token(pool, monkeypatch):
+    pool.outcomes = [
+        _login_response("old", expires="2030-01-01T00:00:00Z"),
+        _login_response("new"),
+        _FakeResponse(204),
+    ]
+    client = _client()
+    client.login("admin", "pw")
+
+    # Jump to within the refresh margin of the first token's expiry.
+    expires_at = datamasque._parse_expiry("2030-01-01T00:00:00Z")
+    monkeypatch.setattr(datamasque.time, "time", lambda: expires_at - 60)
+
+    assert client.login("admin", "pw")["key"] == "new"
+    logout_method, logout_url, logout_kwargs = pool.calls[2]
+    assert (logout_method, logout_url) == ("POST", "https://dm/" + datamasque.LOGOUT_API)
+    assert logout_kwargs["headers"]["Authorization"] == "Token old"
+
+
+def test_failed_login_is_not_cached(pool):
+    pool.outcomes = [
+        _FakeResponse(400, payload={"non_field_errors": ["bad creds"]}),
+        _login_response("tok"),
+    ]
+    client = _client()
+
+    assert "key" not in client.login("admin", "wrong")
+    assert client.login("admin", "pw")["key"] == "tok"
+
+
+@pytest.mark.parametrize("content_type", ["text/html", None])
+def test_login_with_a_non_json_body_raises_runtime_error(pool, content_type):
+    page = _FakeResponse(502, headers={"Content-Type": content_type} if content_type else {})
+    page.data = b"<html><body>502 Bad Gateway</body></html>"
+    pool.outcomes = [page]
+
+    with pytest.raises(RuntimeError, match="status 502"):
+        _client(max_attempts=1).login("admin", "pw")
+
+
+def test_401_reauthenticates_and_resends_once(pool):
+    pool.outcomes = [
+        _login_response("stale"),
+        _FakeResponse(401),
+        _login_response("fresh"),
+        _FakeResponse(204),  # logout of the superseded token
+        _FakeResponse(200),
+    ]
+    client = _client()
+    token = {"Authorization": "Token " + client.login("admin", "pw")["key"]}
+
+    response = client.get("api/runs/1/", headers=token)
+
+    assert response.status_code == 200
+    assert pool.calls[-1][2]["headers"]["Authorization"] == "Token fresh"
+
+
+def test_401_with_unknown_token_is_returned(pool):
+    pool.outcomes = [_FakeResponse(401)]
+
+    response = _client().get("api/runs/1/", headers={"Authorization": "Token foreign"})
+
+    assert response.status_code == 401
+    assert len(pool.calls) == 1
+
+
+# --- streamed list lookups -------------------------------------------------
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_iter_json_array_handles_arrays_and_pages_split_anywhere(chunk_size):
+    page = json.dumps({"count": 2, "next": "https://dm/api/x/?offset=2", "results": [{"a": [1, 2]}, 10.5]})
+    chunks = [page[i:i + chunk_size].encode() for i in range(0, len(page), chunk_size)]
+    meta = {}
+
+    assert list(datamasque.iter_json_array(chunks, meta)) == [{"a": [1, 2]}, 10.5]
+    assert meta == {"count": 2, "next": "https://dm/api/x/?offset=2"}
+    assert list(datamasque.iter_json_array(["[1, 23", "4, []]"])) == [1, 234, []]
+    assert list(datamasque.iter_json_array(["[ ]"])) == []
+
+
+def test_iter_json_array_decodes_characters_split_across_chunks():
+    body = json.dumps([{"name": "café_ruleset"}, {"name": "客户"}], ensure_ascii=False).encode()
+    split = body.index("é".encode()) + 1  # between the two bytes of "é"
+    chunks = [body[:split], body[split:split + 9], body[split + 9:]]
+
+    assert list(datamasque.iter_json_array(chunks)) == [{"name": "café_ruleset"}, {"name": "客户"}]
+
+
+def test_iter_json_array_stops_reading_at_early_exit():
+    reads = []
+
+    def chunks():
+        for item in ['[{"name": "a"},', '{"name": "b"},', '{"name": "c"}]']:
+            reads.append(item)
+            yield item
+
+    items = datamasque.iter_json_array(chunks())
+    assert next(items) == {"name": "a"}
+    items.close()
+    assert len(reads) == 1
+
+
+def test_iter_list_sends_params_follows_next_and_closes_on_early_exit(pool):
+    first = _FakeStream({"next": "https://dm/api/connections/?limit=2&offset=2", "results": [{"id": 1}, {"id": 2}]})
+    second = _FakeStream({"next": None, "results": [{"id": 3}] + [{"id": n} for n in range(4, 50)]})
+    pool.outcomes = [first, second]
+    client = _client()
+
+    items = client.iter_list("api/connections/", name="connections", params={"name": "x y", "limit": 2})
+    found = next(item for item in items if item["id"] == 3)
+    items.close()
+
+    assert found == {"id": 3}
+    assert pool.calls[0][1] == "https://dm/api/connections/?name=x+y&limit=2"
+    assert pool.calls[1][1] == "https://dm/api/connections/?limit=2&offset=2"
+    assert pool.calls[0][2]["preload_content"] is False
+    assert first.closed and second.closed
+    assert second.chunks_read < len(second.data) / second.chunk_size / 2
+
+
+def test_iter_list_raises_on_error_status(pool):
+    pool.outcomes = [_FakeResponse(403, payload={"detail": "nope"})]
+
+    with pytest.raises(RuntimeError, match="403"):
+        list(_client().iter_list("api/connections/"))
@@ -0,0 +1,125 @@
+"""
+Unit tests for blueprint_common.polling.
+
+Run from this directory:
+    pytest test_polling.py -v
+"""
+import pytest
+
+from blueprint_common import polling
+
+
+def test_wait_grows_while_status_is_unchanged_and_is_capped():
+    event = {}
+    waits = [polling.schedule(event, "db_availability", "creating", now=t) for t in range(8)]
+
+    assert waits == [60, 90, 135, 202, 300, 300, 300, 300]
+    assert event["NextWaitSeconds"] == 300
+
+
+def test_status_change_resets_to_initial_wait():
+    event = {}
+    polling.schedule(event, "db_availability", "creating", now=0)
+    polling.schedule(event, "db_availability", "creating", now=60)
+
+    assert polling.schedule(event, "db_availability", "backing-up", now=150) == 60
+
+
+def test_percent_progress_schedules_the_poll_at_the_eta():
+    event = {}
+    polling.schedule(event, "masked_snapshot", "creating", percent=10, now=0)
+
+    # 10% -> 40% in 60s: 60% left at 0.5%/s is 120s, plus the margin.
+    assert polling.schedule(event, "masked_snapshot", "creating", percent=40, now=60) == 125
+    # Nearly done: clamped to the policy minimum.
+    assert polling.schedule(event, "masked_snapshot", "creating", percent=99, now=185) == 15
+
+
+def test_pollers_keep_separate_state():
+    event = {}
+    polling.schedule(event, "masking_run", "running", now=0)
+    polling.schedule(event, "masking_run", "running", now=30)
+
+    assert polling.schedule(event, "masked_snapshot", "creating", now=60) == 30
+    assert set(event["PollState"]) == {"masking_run", "masked_snapshot"}
+
+
+class _Context:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+class _Clock:
+    """Fake monotonic clock advanced by sleep() and by each poll."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(polling.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(polling.time, "sleep", fake.sleep)
+    return fake
+
+
+def _poller(clock, statuses):
+    statuses = iter(statuses)
+
+    def poll_once(event):
+        clock.now += 1  # each poll takes a second
+        event["status"] = next(statuses)
+        polling.schedule(event, "db_availability", event["status"], now=clock.now)
+        return event
+
+    return poll_once
+
+
+def _done(event):
+    return event["status"] == "available"
+
+
+def test_poll_internally_stops_at_terminal_status(clock):
+    event = polling.poll_internally(
+        {}, _Context(900_000), _poller(clock, ["creating", "creating", "available"]), _done
+    )
+
+    assert event["status"] == "available"
+    assert event["InternalPolls"] == 3
+    assert clock.sleeps == [60, 90]
+
+
+def test_poll_internally_returns_before_the_next_wait_overruns_the_budget(clock, monkeypatch):
+    monkeypatch.setenv("POLL_INTERNAL_MAX_SECONDS", "200")
+
+    event = polling.poll_internally({}, _Context(900_000), _poller(clock, ["creating"] * 10), _done)
+
+    # 60 + 90 fit in 200s; the following 135s wait is left to the state machine.
+    assert clock.sleeps == [60, 90]
+    assert event["InternalPolls"] == 3
+    assert event["NextWaitSeconds"] == 135
+
+
+def test_poll_internally_respects_lambda_remaining_time(clock):
+    event = polling.poll_internally({}, _Context(70_000), _poller(clock, ["creating"] * 10), _done)
+
+    # 70s remaining less the 15s margin: not even the first 60s wait fits.
+    assert clock.sleeps == []
+    assert event["InternalPolls"] == 1
+
+
+def test_internal_mode():
+    assert polling.internal_mode({"PollMode": "internal"})
+    assert not polling.internal_mode({})
@@ -0,0 +1,110 @@
+"""
+Unit tests for blueprint_common.rds.
+
+Run from this directory:
+    pytest test_rds.py -v
+"""
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from blueprint_common import aws, rds
+from blueprint_common.rds import DynamoDBBucket, MemoryBucket, RateLimiter
+
+
+def _throttled():
+    return ClientError({"Error": {"Code": "Throttling", "Message": "Rate exceeded"}}, "DescribeDBInstances")
+
+
+@pytest.fixture(autouse=True)
+def clean(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "x")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "x")
+    monkeypatch.delenv("RDS_RATE_LIMIT_PER_SECOND", raising=False)
+    aws.reset_clients()
+    rds.reset_metrics()
+    yield
+    aws.reset_clients()
+    rds.reset_metrics()
+
+
+def test_client_uses_adaptive_retries_and_is_reused():
+    client = rds.client()
+
+    assert client is rds.client()
+    assert client.meta.config.retries["mode"] == "adaptive"
+
+
+def test_memory_bucket_refills_at_rate():
+    bucket = MemoryBucket()
+
+    assert [bucket.take("rds", 2, 2, 100.0) for _ in range(2)] == [0, 0]
+    assert bucket.take("rds", 2, 2, 100.0) == pytest.approx(0.5)
+    assert bucket.take("rds", 2, 2, 100.5) == 0
+
+
+def test_limiter_sleeps_until_a_token_is_free():
+    now = [100.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter("rds", 1, 1, MemoryBucket(), sleep=sleep, clock=lambda: now[0])
+
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert slept == [pytest.approx(1.0)]
+
+
+def test_limiter_fails_open():
+    class Broken:
+        def take(self, *args):
+            raise RuntimeError("table gone")
+
+    assert RateLimiter("rds", 1, 1, Broken()).acquire() == 0
+
+
+def test_dynamodb_bucket_retries_on_contention():
+    client = boto3.client("dynamodb")
+    key = {"kind": {"S": "rate_limit"}, "key": {"S": "rds"}}
+    item = {**key, "tokens": {"N": "1.0"}, "updated_at": {"N": "99.0"}}
+    with Stubber(client) as stubber:
+        stubber.add_response("get_item", {"Item": item})
+        stubber.add_client_error("put_item", "ConditionalCheckFailedException")
+        stubber.add_response("get_item", {"Item": {**item, "tokens": {"N": "0.0"}, "updated_at": {"N": "100.0"}}})
+
+        assert DynamoDBBucket("state", client).take("rds", 2, 4, 100.0) == pytest.approx(0.5)
+        stubber.assert_no_pending_responses()
+
+
+def test_calls_are_counted_and_rate_limited(monkeypatch):
+    monkeypatch.setenv("RDS_RATE_LIMIT_PER_SECOND", "5")
+    acquired = []
+    monkeypatch.setattr(RateLimiter, "acquire", lambda self: acquired.append(self.rate) or 0.2)
+    client = rds.client()
+    with Stubber(client) as stubber:
+        stubber.add_response("describe_db_instances", {"DBInstances": []})
+        client.describe_db_instances()
+
+    assert acquired == [5.0]
+    assert rds.metrics()["calls"] == 1
+    assert rds.metrics()["throttle_wait_ms"] == 200.0
+
+
+def test_handler_turns_throttling_into_retryable_error():
+    @rds.handler
+    def throttled(event, context):
+        raise _throttled()
+
+    @rds.handler
+    def broken(event, context):
+        raise KeyError("StageDB")
+
+    with pytest.raises(rds.RdsThrottled):
+        throttled({}, None)
+    with pytest.raises(KeyError):
+        broken({}, None)
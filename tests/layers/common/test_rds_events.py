@@ -0,0 +1,100 @@
+"""
+Unit tests for blueprint_common.rds_events.
+
+Run from this directory:
+    pytest test_rds_events.py -v
+"""
+import json
+
+import pytest
+
+from blueprint_common import callbacks, rds_events, state_store
+
+
+def _rds_event(identifier, detail_type="RDS DB Snapshot Event", event_id="RDS-EVENT-0042"):
+    return {
+        "source": "aws.rds",
+        "detail-type": detail_type,
+        "detail": {
+            "EventID": event_id,
+            "Message": "Manual snapshot created",
+            "SourceIdentifier": identifier,
+            "SourceType": "SNAPSHOT",
+        },
+    }
+
+
+class _FakeStepFunctions:
+    def __init__(self):
+        self.succeeded = {}
+
+    def send_task_success(self, taskToken, output):
+        self.succeeded[taskToken] = json.loads(output)
+
+
+@pytest.fixture
+def sfn(monkeypatch):
+    monkeypatch.delenv("STATE_TABLE_NAME", raising=False)
+    state_store.reset_store()
+    fake = _FakeStepFunctions()
+    monkeypatch.setattr(callbacks.aws, "client", lambda name: fake)
+    yield fake
+    state_store.reset_store()
+
+
+@pytest.mark.parametrize(
+    "wait, state, targets",
+    [
+        ("source_snapshot", {"DBSnapshotIdentifier": "snap"}, ["snap"]),
+        ("masked_snapshot", {"MaskedDBSnapshotIdentifier": "masked"}, ["masked"]),
+        ("db_availability", {"StageDB": "stg"}, ["stg"]),
+        ("db_availability", {"StageDB": "stg", "StgDbInstanceId": "stg-1"}, ["stg", "stg-1"]),
+    ],
+)
+def test_wait_targets(wait, state, targets):
+    assert rds_events.wait_targets(wait, state) == targets
+
+
+@pytest.mark.parametrize(
+    "state, expected",
+    [
+        ({"RdsEvent": {"EventID": "RDS-EVENT-0005", "Date": "2026-10-18T10:00:00.500Z"}}, 1792317600.5),
+        ({"RdsEvent": {"Error": "States.Timeout", "Cause": "..."}}, None),
+        ({}, None),
+    ],
+)
+def test_event_time(state, expected):
+    assert rds_events.event_time(state) == expected
+
+
+def test_every_waiter_on_the_identifier_is_resumed_once(sfn):
+    rds_events.park(["snap"], "token-a", "source_snapshot")
+    rds_events.park(["snap"], "token-b", "source_snapshot")
+    rds_events.park(["other"], "token-c", "masked_snapshot")
+
+    identifier, summary = rds_events.parse(_rds_event("snap"))
+    assert rds_events.resume(identifier, summary) == 2
+    assert rds_events.resume(identifier, summary) == 0
+
+    assert sorted(sfn.succeeded) == ["token-a", "token-b"]
+    assert sfn.succeeded["token-a"]["EventID"] == "RDS-EVENT-0042"
+
+
+def test_a_waiter_on_cluster_and_writer_is_resumed_by_either_once(sfn):
+    rds_events.park(["stg", "stg-1"], "token-a", "db_availability")
+
+    assert rds_events.resume("stg", {"EventID": "RDS-EVENT-0170"}) == 1
+    assert rds_events.resume("stg-1", {"EventID": "RDS-EVENT-0005"}) == 0
+    assert state_store.get_store().items("rds_wait:stg-1") == []
+
+
+@pytest.mark.parametrize(
+    "event",
+    [
+        {"source": "aws.ec2", "detail-type": "RDS DB Snapshot Event", "detail": {"SourceIdentifier": "x"}},
+        {"source": "aws.rds", "detail-type": "RDS DB Proxy Event", "detail": {"SourceIdentifier": "x"}},
+        {"source": "aws.rds", "detail-type": "RDS DB Instance Event", "detail": {}},
+    ],
+)
+def test_parse_ignores_unrelated_events(event):
+    assert rds_events.parse(event) is None
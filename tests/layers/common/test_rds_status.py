@@ -0,0 +1,103 @@
+"""
+Unit tests for blueprint_common.rds_status.
+
+Run from this directory:
+    pytest test_rds_status.py -v
+"""
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from blueprint_common import rds_status, state_store
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    monkeypatch.delenv("STATE_TABLE_NAME", raising=False)
+    state_store.reset_store()
+    yield state_store.get_store()
+    state_store.reset_store()
+
+
+@pytest.fixture
+def rds():
+    client = boto3.client("rds", region_name="us-east-1", aws_access_key_id="x", aws_secret_access_key="x")
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_read_is_a_miss_until_the_poller_publishes(rds):
+    client, stubber = rds
+    for db in ("stg-a", "stg-b", "stg-c"):
+        rds_status.watch("db-instance", db)
+        assert rds_status.read("db-instance", db, now=1000) is None
+    rds_status.watch("snapshot", "masked-a")
+    assert rds_status.read("snapshot", "masked-a", now=1000) is None
+    stubber.add_response(
+        "describe_db_instances",
+        {
+            "DBInstances": [
+                {"DBInstanceIdentifier": "stg-a", "DBInstanceStatus": "Available"},
+                {"DBInstanceIdentifier": "stg-b", "DBInstanceStatus": "creating"},
+            ]
+        },
+        {"Filters": [{"Name": "db-instance-id", "Values": ["stg-a", "stg-b", "stg-c"]}]},
+    )
+    stubber.add_response(
+        "describe_db_snapshots",
+        {"DBSnapshots": [{"DBSnapshotIdentifier": "masked-a", "Status": "creating", "PercentProgress": 40}]},
+        {"Filters": [{"Name": "db-snapshot-id", "Values": ["masked-a"]}]},
+    )
+
+    assert rds_status.poll(client, now=1000) == {"db-instance": 1, "snapshot": 1}
+
+    assert rds_status.read("db-instance", "stg-a", now=1010)["Status"] == "available"
+    assert rds_status.read("db-instance", "stg-c", now=1010) is None
+    assert rds_status.read("snapshot", "masked-a", now=1010)["PercentProgress"] == 40
+
+
+def test_stale_status_is_a_miss(monkeypatch):
+    monkeypatch.setenv("RDS_STATUS_MAX_AGE_SECONDS", "60")
+    state_store.get_store().put(
+        rds_status.STATUS_KIND, "db-cluster:stg", {"Status": "available", "PercentProgress": None, "ObservedAt": 1000}
+    )
+
+    assert rds_status.read("db-cluster", "stg", now=1030)["Status"] == "available"
+    assert rds_status.read("db-cluster", "stg", now=1100) is None
+
+
+def test_status_observed_before_since_is_a_miss():
+    state_store.get_store().put(
+        rds_status.STATUS_KIND, "db-instance:stg", {"Status": "creating", "PercentProgress": None, "ObservedAt": 1000}
+    )
+
+    assert rds_status.read("db-instance", "stg", now=1030, since=990)["Status"] == "creating"
+    assert rds_status.read("db-instance", "stg", now=1030, since=1010) is None
+
+
+def test_read_does_not_write_and_unwatch_stops_polling(rds, store):
+    client, _ = rds
+    rds_status.read("db-instance", "unwatched")
+    assert store.items(rds_status.WATCH_KIND) == []
+
+    rds_status.watch("db-instance", "stg")
+    rds_status.unwatch("db-instance", "stg")
+
+    assert rds_status.poll(client) == {}
+
+
+def test_poll_batches_identifiers(rds, monkeypatch):
+    client, stubber = rds
+    monkeypatch.setattr(rds_status, "BATCH_SIZE", 2)
+    for db in ("a", "b", "c"):
+        rds_status.watch("db-cluster", db)
+    stubber.add_response("describe_db_clusters", {"DBClusters": []}, {"Filters": [{"Name": "db-cluster-id", "Values": ["a", "b"]}]})
+    stubber.add_response("describe_db_clusters", {"DBClusters": []}, {"Filters": [{"Name": "db-cluster-id", "Values": ["c"]}]})
+
+    assert rds_status.poll(client) == {"db-cluster": 2}
+
+
+def test_poll_without_watches_makes_no_calls(rds):
+    client, _ = rds
+    assert rds_status.poll(client) == {}
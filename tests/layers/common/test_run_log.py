@@ -0,0 +1,111 @@
+"""
+Unit tests for blueprint_common.run_log.
+
+Run from this directory:
+    pytest test_run_log.py -v
+"""
+import pytest
+
+from blueprint_common import run_log
+from blueprint_common.datamasque import Response
+
+
+class _Chunks:
+    """Stands in for a streamed urllib3 response body."""
+
+    def __init__(self, data, size=5):
+        self.data, self.size = data, size
+
+    def stream(self, amt):
+        for i in range(0, len(self.data), self.size):
+            yield self.data[i:i + self.size]
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class _FakeClient:
+    def __init__(self, log, honours_range=True):
+        self.log = log
+        self.honours_range = honours_range
+        self.requests = []
+
+    def get(self, api, headers=None, name=None, stream=False):
+        self.requests.append((api, headers["Range"]))
+        offset = int(headers["Range"][len("bytes="):-1])
+        if not self.honours_range:
+            return Response(200, {}, b"", raw=_Chunks(self.log))
+        if offset >= len(self.log):
+            return Response(416, {}, b"")
+        return Response(206, {}, b"", raw=_Chunks(self.log[offset:]))
+
+
+@pytest.mark.parametrize("honours_range", [True, False])
+def test_fetch_new_lines_reads_only_complete_new_lines(honours_range):
+    client = _FakeClient(b"line one\nline two\npartial", honours_range)
+
+    lines, offset = run_log.fetch_new_lines(client, "run-1", 0, {"Authorization": "Token t"})
+    assert lines == ["line one", "line two"]
+    assert offset == 18
+
+    client.log += b" line\n"
+    lines, offset = run_log.fetch_new_lines(client, "run-1", offset, {})
+    assert lines == ["partial line"]
+    assert offset == len(client.log)
+    assert client.requests[0] == ("api/runs/run-1/log/", "bytes=0-")
+
+
+def test_fetch_new_lines_with_nothing_new():
+    client = _FakeClient(b"done\n")
+
+    assert run_log.fetch_new_lines(client, "run-1", 5, {}) == ([], 5)
+
+
+def test_fetch_new_lines_caps_bytes_per_poll():
+    client = _FakeClient(b"aaaa\nbbbb\ncccc\n")
+
+    lines, offset = run_log.fetch_new_lines(client, "run-1", 0, {}, max_bytes=12)
+
+    assert lines == ["aaaa", "bbbb"]
+    assert offset == 10
+
+
+@pytest.mark.parametrize(
+    "line, parsed",
+    [
+        ('{"message": "masking", "table_name": "t1", "rows_masked": 50}', ("t1", 50, False)),
+        ("Masked 12,500 rows in table \"public.customers\"", ("public.customers", 12500, False)),
+        ("Table orders completed", ("orders", None, True)),
+        ("Connecting to database", None),
+        ("", None),
+    ],
+)
+def test_parse_line(line, parsed):
+    assert run_log.parse_line(line) == parsed
+
+
+def test_update_progress_rates_and_stall():
+    progress = run_log.update_progress(None, ["Masked 100 rows in table a"], now=0.0)
+    progress = run_log.update_progress(progress, ["Masked 600 rows in table a"], now=10.0)
+    assert progress["rows_masked"] == 600
+    assert progress["rows_per_sec"] == 50.0
+    assert progress["tables"]["a"]["rows_per_sec"] == 50.0
+
+    progress = run_log.update_progress(progress, [], now=70.0)
+    assert progress["rows_per_sec"] == 0.0
+    assert progress["stalled_seconds"] == 60
+
+
+def test_update_progress_bounds_table_entries(monkeypatch):
+    monkeypatch.setattr(run_log, "MAX_TABLES", 2)
+    lines = [f"Masked 10 rows in table t{i}" for i in range(4)] + [f"Table t{i} done" for i in range(3)]
+
+    progress = run_log.update_progress(None, lines, now=0.0)
+
+    assert len(progress["tables"]) == 2
+    assert progress["rows_masked"] == 40
+    assert progress["tables_seen"] == 4
+    assert progress["tables_completed"] == 3
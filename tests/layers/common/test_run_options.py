@@ -0,0 +1,115 @@
+"""
+Unit tests for blueprint_common.run_options.
+
+Run from this directory:
+    pytest test_run_options.py -v
+"""
+import pytest
+
+from blueprint_common import run_options
+from blueprint_common.state_store import get_store, reset_store
+
+
+@pytest.fixture(autouse=True)
+def memory_store(monkeypatch):
+    monkeypatch.delenv("STATE_TABLE_NAME", raising=False)
+    reset_store()
+    yield
+    reset_store()
+
+
+def _run(buffer_size, seconds):
+    return {
+        "status": "finished",
+        "options": {"buffer_size": buffer_size},
+        "start_time": "2024-05-01T10:00:00Z",
+        "end_time": f"2024-05-01T10:{seconds // 60:02d}:{seconds % 60:02d}Z",
+    }
+
+
+def test_defaults_are_the_historic_options():
+    assert run_options.resolve({"DataMasqueRulesetId": "r"}) == {
+        "dry_run": False,
+        "buffer_size": 10000,
+        "continue_on_failure": False,
+    }
+
+
+@pytest.mark.parametrize(
+    "instance_class, scaling, memory",
+    [
+        ("db.r6g.large", None, 16),
+        ("db.m5.2xlarge", None, 32),
+        ("db.t3.medium", None, 4),
+        ("db.serverless", {"MinCapacity": 2, "MaxCapacity": 16}, 32),
+        ("db.custom.thing", None, None),
+        (None, None, None),
+    ],
+)
+def test_instance_memory_gib(instance_class, scaling, memory):
+    assert run_options.instance_memory_gib(instance_class, scaling) == memory
+
+
+def test_memory_buffer_size_is_clamped():
+    assert run_options.memory_buffer_size(8) == 10000
+    assert run_options.memory_buffer_size(0.5) == run_options.MIN_BUFFER_SIZE
+    assert run_options.memory_buffer_size(1024) == run_options.MAX_BUFFER_SIZE
+    assert run_options.memory_buffer_size(None) == 10000
+
+
+def test_auto_uses_instance_memory_without_history():
+    event = {"DataMasqueRulesetId": "r", "RunOptions": {"buffer_size": "auto"}, "parameters": {"DBInstanceClass": "db.t3.medium"}}
+
+    assert run_options.resolve(event)["buffer_size"] == 5000
+
+
+def test_auto_prefers_the_best_recorded_buffer_size():
+    get_store().put(
+        run_options.HISTORY_KIND,
+        "r",
+        {"5000": {"RowsPerSecond": 900.0, "Runs": 1}, "20000": {"RowsPerSecond": 1500.0, "Runs": 3}},
+    )
+    event = {"DataMasqueRulesetId": "r", "RunOptions": {"buffer_size": "auto"}, "parameters": {"DBInstanceClass": "db.t3.medium"}}
+
+    assert run_options.resolve(event)["buffer_size"] == 20000
+
+
+def test_benchmark_runs_each_size_and_records_throughput():
+    event = {"DataMasqueRulesetId": "r", "BenchmarkBufferSizes": [5000, 20000]}
+
+    assert run_options.resolve(event)["buffer_size"] == 5000
+    assert event["Benchmark"]["Remaining"] == 1
+    event["MaskRunProgress"] = {"rows_masked": 60000}
+    run_options.record_result(event, _run(5000, 120), now=1.0)
+
+    assert run_options.resolve(event)["buffer_size"] == 20000
+    assert event["Benchmark"]["Remaining"] == 0
+    event["MaskRunProgress"] = {"rows_masked": 60000}
+    run_options.record_result(event, _run(20000, 60), now=2.0)
+
+    assert [r["RowsPerSecond"] for r in event["Benchmark"]["Results"]] == [500.0, 1000.0]
+    assert run_options.history("r") == {
+        5000: {"RowsPerSecond": 500.0, "Runs": 1, "UpdatedAt": 1.0},
+        20000: {"RowsPerSecond": 1000.0, "Runs": 1, "UpdatedAt": 2.0},
+    }
+    assert run_options.tuned_buffer_size(event)[0] == 20000
+
+
+def test_history_averages_runs_and_skips_runs_without_rows():
+    event = {"DataMasqueRulesetId": "r", "MaskRunProgress": {"rows_masked": 1000}}
+    run_options.record_result(event, _run(10000, 10), now=1.0)
+    event["MaskRunProgress"] = {"rows_masked": 3000}
+    run_options.record_result(event, _run(10000, 10), now=2.0)
+
+    result = run_options.record_result({"DataMasqueRulesetId": "r"}, _run(10000, 10), now=3.0)
+
+    assert result == {"BufferSize": 10000, "Seconds": 10.0, "Rows": None, "RowsPerSecond": None}
+    assert run_options.history("r") == {10000: {"RowsPerSecond": 200.0, "Runs": 2, "UpdatedAt": 2.0}}
+
+
+def test_option_errors():
+    assert run_options.option_errors(None) == []
+    assert run_options.option_errors({"buffer_size": "auto", "dry_run": True}) == []
+    assert run_options.option_errors({"buffer_size": 0}) == ['RunOptions buffer_size must be a positive integer or "auto"']
+    assert run_options.option_errors({"run_secret": "x"}) == ["Unknown RunOptions key run_secret"]
+    assert run_options.option_errors({"dry_run": "yes"}) == ["RunOptions dry_run must be true or false"]
@@ -0,0 +1,124 @@
+"""
+Unit tests for blueprint_common.secrets_cache.
+
+Run from this directory:
+    pytest test_secrets_cache.py -v
+"""
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from blueprint_common import secrets_cache
+from blueprint_common.secrets_cache import SecretsCache
+
+
+@pytest.fixture
+def client():
+    client = MagicMock()
+    client.get_secret_value.side_effect = lambda **kw: {
+        "ARN": kw["SecretId"],
+        "SecretString": f'{{"id": "{kw["SecretId"]}", "stage": "{kw.get("VersionStage", "AWSCURRENT")}"}}',
+        "ResponseMetadata": {"RequestId": "x"},
+    }
+    return client
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(secrets_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _not_found():
+    return ClientError(
+        {"Error": {"Code": "ResourceNotFoundException", "Message": "nope"}}, "GetSecretValue"
+    )
+
+
+def test_hit_within_ttl_reuses_value(client, clock):
+    cache = SecretsCache(client, ttl=300)
+
+    first = cache.get_secret_value(SecretId="a")
+    second = cache.get_secret_value(SecretId="a")
+
+    assert first == second
+    assert "ResponseMetadata" not in first
+    client.get_secret_value.assert_called_once_with(SecretId="a")
+
+
+def test_entry_expires_after_ttl(client, clock):
+    cache = SecretsCache(client, ttl=300)
+    cache.get_secret_value(SecretId="a")
+
+    clock[0] += 301
+    cache.get_secret_value(SecretId="a")
+
+    assert client.get_secret_value.call_count == 2
+
+
+def test_version_stages_are_cached_separately(client, clock):
+    cache = SecretsCache(client)
+
+    assert cache.get_secret_json("a")["stage"] == "AWSCURRENT"
+    pending = cache.get_secret_value(SecretId="a", VersionStage="AWSPENDING")
+
+    assert '"AWSPENDING"' in pending["SecretString"]
+    assert client.get_secret_value.call_count == 2
+    # An explicit AWSCURRENT shares the entry with the default lookup.
+    cache.get_secret_value(SecretId="a", VersionStage="AWSCURRENT")
+    assert client.get_secret_value.call_count == 2
+
+
+def test_max_entries_evicts_least_recently_used(client, clock):
+    cache = SecretsCache(client, max_entries=2)
+    cache.get_secret_value(SecretId="a")
+    cache.get_secret_value(SecretId="b")
+    cache.get_secret_value(SecretId="a")  # refresh "a"
+    cache.get_secret_value(SecretId="c")  # evicts "b"
+
+    client.get_secret_value.reset_mock()
+    cache.get_secret_value(SecretId="a")
+    cache.get_secret_value(SecretId="b")
+
+    client.get_secret_value.assert_called_once_with(SecretId="b")
+
+
+def test_not_found_is_negatively_cached(clock):
+    client = MagicMock()
+    client.get_secret_value.side_effect = _not_found()
+    cache = SecretsCache(client, negative_ttl=60)
+
+    for _ in range(3):
+        with pytest.raises(ClientError):
+            cache.get_secret_value(SecretId="missing")
+    assert client.get_secret_value.call_count == 1
+
+    clock[0] += 61
+    with pytest.raises(ClientError):
+        cache.get_secret_value(SecretId="missing")
+    assert client.get_secret_value.call_count == 2
+
+
+def test_other_errors_are_not_cached(clock):
+    client = MagicMock()
+    client.get_secret_value.side_effect = ClientError(
+        {"Error": {"Code": "ThrottlingException", "Message": "slow down"}}, "GetSecretValue"
+    )
+    cache = SecretsCache(client)
+
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            cache.get_secret_value(SecretId="a")
+    assert client.get_secret_value.call_count == 2
+
+
+def test_invalidate_drops_entries(client, clock):
+    cache = SecretsCache(client)
+    cache.get_secret_value(SecretId="a")
+
+    cache.invalidate("a")
+    cache.get_secret_value(SecretId="a")
+
+    assert client.get_secret_value.call_count == 2
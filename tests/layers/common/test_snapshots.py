@@ -0,0 +1,106 @@
+"""
+Unit tests for blueprint_common.snapshots.
+
+Run from this directory:
+    pytest test_snapshots.py -v
+"""
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from blueprint_common import snapshots
+
+NOW = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+
+
+def _snap(name, hours_old, status="available"):
+    snapshot = {"DBSnapshotIdentifier": name, "Status": status}
+    if hours_old is not None:
+        snapshot["SnapshotCreateTime"] = NOW - timedelta(hours=hours_old)
+    return snapshot
+
+
+@pytest.fixture
+def rds():
+    client = boto3.client("rds", region_name="us-east-1", aws_access_key_id="x", aws_secret_access_key="x")
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_newest_available_snapshot_across_pages(rds):
+    client, stubber = rds
+    params = {"DBInstanceIdentifier": "src", "IncludeShared": True, "IncludePublic": False}
+    stubber.add_response(
+        "describe_db_snapshots",
+        {"DBSnapshots": [_snap("old", 48), _snap("broken", 1, "failed")], "Marker": "m"},
+        params,
+    )
+    stubber.add_response(
+        "describe_db_snapshots",
+        {"DBSnapshots": [_snap("newest", 2), _snap("older", 26), _snap("running", None, "creating")]},
+        {**params, "Marker": "m"},
+    )
+
+    snapshot = snapshots.latest_snapshot(client, "RDS", "src")
+
+    assert snapshot["DBSnapshotIdentifier"] == "newest"
+    assert snapshots.age_hours(snapshot, NOW) == 2.0
+
+
+def test_filters_types_and_shared(rds):
+    client, stubber = rds
+    stubber.add_response(
+        "describe_db_cluster_snapshots",
+        {"DBClusterSnapshots": [{"DBClusterSnapshotIdentifier": "c", "Status": "creating"}]},
+        {
+            "DBClusterIdentifier": "src",
+            "IncludeShared": False,
+            "Filters": [{"Name": "snapshot-type", "Values": ["automated"]}],
+        },
+    )
+
+    snapshot = snapshots.latest_snapshot(client, "Aurora", "src", snapshot_types=["automated"], include_shared=False)
+
+    assert snapshots.snapshot_identifier("Aurora", snapshot) == "c"
+    assert snapshots.age_hours(snapshot) is None
+
+
+def test_nothing_usable(rds):
+    client, stubber = rds
+    stubber.add_response("describe_db_snapshots", {"DBSnapshots": [_snap("broken", 1, "failed")]})
+
+    assert snapshots.latest_snapshot(client, "RDS", "src") is None
+
+
+@pytest.mark.parametrize(
+    "snapshot, max_age, fresh",
+    [
+        (_snap("s", 30), None, True),
+        (_snap("s", 30), 24, False),
+        (_snap("s", 2), 24, True),
+        (_snap("s", None, "creating"), 24, True),
+        (None, 24, False),
+    ],
+)
+def test_is_fresh(snapshot, max_age, fresh):
+    assert snapshots.is_fresh(snapshot, max_age, NOW) is fresh
+
+
+def test_latest_restorable_time_needs_automated_backups(rds):
+    client, stubber = rds
+    stubber.add_response(
+        "describe_db_instances",
+        {"DBInstances": [{"BackupRetentionPeriod": 7, "LatestRestorableTime": NOW}]},
+        {"DBInstanceIdentifier": "src"},
+    )
+    stubber.add_response(
+        "describe_db_instances",
+        {"DBInstances": [{"BackupRetentionPeriod": 0}]},
+        {"DBInstanceIdentifier": "src"},
+    )
+
+    assert snapshots.latest_restorable_time(client, "RDS", "src") == NOW
+    assert snapshots.latest_restorable_time(client, "RDS", "src") is None
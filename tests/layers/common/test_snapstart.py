@@ -0,0 +1,50 @@
+"""
+Unit tests for blueprint_common.snapstart.
+
+Run from this directory:
+    pytest test_snapstart.py -v
+"""
+from unittest.mock import MagicMock
+
+from blueprint_common import datamasque, snapstart
+
+
+def test_init_does_not_prime_on_demand(monkeypatch):
+    monkeypatch.delenv("AWS_LAMBDA_INITIALIZATION_TYPE", raising=False)
+    built = MagicMock()
+    monkeypatch.setattr(snapstart.aws, "client", built)
+
+    snapstart.init({"rds": ["DescribeDBInstances"]})
+
+    built.assert_not_called()
+
+
+def test_init_primes_clients_and_models_under_snapstart(monkeypatch):
+    monkeypatch.setenv("AWS_LAMBDA_INITIALIZATION_TYPE", "snap-start")
+    client = MagicMock()
+    monkeypatch.setattr(snapstart.aws, "client", lambda name, **kwargs: client)
+    pools = []
+    monkeypatch.setattr(snapstart.datamasque, "get_pool", pools.append)
+
+    snapstart.init({"rds": ["DescribeDBInstances", "DescribeDBClusters"]}, datamasque_pool=True)
+
+    client.meta.service_model.operation_model.assert_any_call("DescribeDBInstances")
+    client.meta.service_model.operation_model.assert_any_call("DescribeDBClusters")
+    assert pools == [True, False]
+
+
+def test_after_restore_drops_sockets_tokens_and_secrets(monkeypatch):
+    datamasque._tokens[("https://dm/", "admin")] = {"login": {"key": "k"}, "expires_at": 0}
+    reset = MagicMock()
+    monkeypatch.setattr(snapstart.datamasque, "reset_pools", reset)
+    cache = MagicMock()
+    monkeypatch.setattr(snapstart.secrets_cache, "get_secrets_cache", lambda: cache)
+    seeded = MagicMock()
+    monkeypatch.setattr(snapstart.random, "seed", seeded)
+
+    snapstart.after_restore()
+
+    reset.assert_called_once_with()
+    assert datamasque._tokens == {}
+    cache.invalidate.assert_called_once_with()
+    seeded.assert_called_once_with()
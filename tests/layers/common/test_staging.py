@@ -0,0 +1,250 @@
+"""
+Unit tests for blueprint_common.staging.
+
+Run from this directory:
+    pytest test_staging.py -v
+"""
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from blueprint_common import staging
+
+
+def _event(**parameters):
+    return {
+        "parameters": {
+            "DBInstanceIdentifier": "stg",
+            "DBInstanceClass": "db.r6g.large",
+            "Engine": "aurora-postgresql",
+            "DBSubnetGroupName": "subnets",
+            **parameters,
+        }
+    }
+
+
+def test_clone_mode():
+    assert staging.clone_mode({"StagingMode": "clone"})
+    assert not staging.clone_mode({"StagingMode": "restore"})
+    assert not staging.clone_mode({})
+
+
+def test_writer_instance_params_minimal():
+    assert staging.writer_instance_params(_event(AvailabilityZone=None, DBParameterGroupName=None)) == {
+        "DBInstanceIdentifier": "stg-1",
+        "DBInstanceClass": "db.r6g.large",
+        "Engine": "aurora-postgresql",
+        "DBClusterIdentifier": "stg",
+        "DBSubnetGroupName": "subnets",
+        "EnablePerformanceInsights": False,
+        "MonitoringInterval": 0,
+    }
+
+
+def test_writer_instance_params_pins_known_az_and_parameter_group():
+    params = staging.writer_instance_params(_event(AvailabilityZone="ap-southeast-2a", DBParameterGroupName="pg"))
+    assert params["AvailabilityZone"] == "ap-southeast-2a"
+    assert params["DBParameterGroupName"] == "pg"
+
+    event = _event()
+    event["PreferredAZ"] = "ap-southeast-2b"
+    assert staging.writer_instance_params(event)["AvailabilityZone"] == "ap-southeast-2b"
+
+
+RDS_SOURCE = {
+    "Engine": "postgres",
+    "DBInstanceClass": "db.r6g.large",
+    "StorageType": "gp2",
+    "AllocatedStorage": 1000,
+    "Iops": 3000,
+}
+
+
+def test_scaled_instance_class():
+    assert staging.scaled_instance_class("db.r6g.large", "2xlarge") == "db.r6g.2xlarge"
+    assert staging.scaled_instance_class("db.r6g.8xlarge", "2xlarge") == "db.r6g.8xlarge"
+    assert staging.scaled_instance_class("db.serverless", "2xlarge") == "db.serverless"
+    assert staging.scaled_instance_class("db.m5d.metal", "2xlarge") == "db.m5d.metal"
+
+
+def test_source_profile_copies_the_source_class_only():
+    assert staging.apply_profile({}, "RDS", RDS_SOURCE) == {"DBInstanceClass": "db.r6g.large"}
+
+
+def test_performance_profile_scales_class_and_storage():
+    parameters = staging.apply_profile({}, "RDS", RDS_SOURCE, profile="performance")
+
+    assert parameters == {
+        "DBInstanceClass": "db.r6g.2xlarge",
+        "StorageType": "gp3",
+        "Iops": 20000,
+        "StorageThroughput": 1000,
+    }
+
+
+def test_performance_profile_leaves_gp3_baseline_below_threshold():
+    source = dict(RDS_SOURCE, AllocatedStorage=100)
+
+    parameters = staging.apply_profile({}, "RDS", source, profile="performance")
+
+    assert parameters["StorageType"] == "gp3"
+    assert "Iops" not in parameters and "StorageThroughput" not in parameters
+
+
+def test_performance_profile_keeps_provisioned_iops_volume_within_ratio():
+    source = dict(RDS_SOURCE, StorageType="io1", AllocatedStorage=200, Iops=5000)
+
+    parameters = staging.apply_profile({}, "RDS", source, profile="performance")
+
+    assert parameters["StorageType"] == "io1"
+    assert parameters["Iops"] == 10000  # 50 IOPS/GiB on io1
+
+
+def test_overrides_win_over_the_profile():
+    parameters = staging.apply_profile(
+        {}, "RDS", RDS_SOURCE, profile="performance", overrides={"DBInstanceClass": "db.r6i.4xlarge", "Iops": 40000}
+    )
+
+    assert parameters["DBInstanceClass"] == "db.r6i.4xlarge"
+    assert parameters["Iops"] == 40000
+
+
+def test_aurora_capacity_overrides_make_the_writer_serverless():
+    source = {"Engine": "aurora-postgresql", "DBInstanceClass": "db.r6g.large"}
+
+    parameters = staging.apply_profile({}, "Aurora", source, overrides={"MinCapacity": 4, "MaxCapacity": 32})
+
+    assert parameters == {
+        "DBInstanceClass": "db.serverless",
+        "ServerlessV2ScalingConfiguration": {"MinCapacity": 4, "MaxCapacity": 32},
+    }
+
+
+@pytest.mark.parametrize(
+    "profile, overrides, expected",
+    [
+        (None, {"MinCapacity": 4}, {"MinCapacity": 4, "MaxCapacity": 64}),
+        (None, {"MaxCapacity": 2}, {"MinCapacity": 0.5, "MaxCapacity": 2}),
+        ("performance", {"MaxCapacity": 32}, {"MinCapacity": 8, "MaxCapacity": 32}),
+    ],
+)
+def test_missing_capacity_bound_comes_from_the_profile(profile, overrides, expected):
+    source = {"Engine": "aurora-postgresql", "DBInstanceClass": "db.r6g.large"}
+
+    parameters = staging.apply_profile({}, "Aurora", source, profile=profile, overrides=overrides)
+
+    assert parameters["ServerlessV2ScalingConfiguration"] == expected
+
+
+def test_inverted_capacity_range_is_rejected():
+    source = {
+        "Engine": "aurora-mysql",
+        "DBInstanceClass": "db.serverless",
+        "ServerlessV2ScalingConfiguration": {"MinCapacity": 2, "MaxCapacity": 16},
+    }
+
+    with pytest.raises(ValueError, match="MinCapacity 32 exceeds MaxCapacity 16"):
+        staging.apply_profile({}, "Aurora", source, overrides={"MinCapacity": 32})
+
+
+def test_performance_profile_raises_serverless_capacity():
+    source = {
+        "Engine": "aurora-mysql",
+        "DBInstanceClass": "db.serverless",
+        "ServerlessV2ScalingConfiguration": {"MinCapacity": 0.5, "MaxCapacity": 128},
+    }
+
+    parameters = staging.apply_profile({}, "Aurora", source, profile="performance")
+
+    assert parameters["DBInstanceClass"] == "db.serverless"
+    assert parameters["ServerlessV2ScalingConfiguration"] == {"MinCapacity": 8, "MaxCapacity": 128}
+
+
+def test_override_errors():
+    assert staging.override_errors(None) == []
+    assert staging.override_errors({"DBInstanceClass": "db.r6g.xlarge", "MinCapacity": 0.5}) == []
+    assert staging.override_errors("big") == ["StagingInstance must be an object"]
+    assert staging.override_errors({"MaxCapacity": True}) == ["StagingInstance MaxCapacity must be a positive number"]
+    assert staging.override_errors({"MinCapacity": 8, "MaxCapacity": 4}) == [
+        "StagingInstance MinCapacity must not exceed MaxCapacity"
+    ]
+
+
+def _rds_client():
+    return boto3.client("rds", region_name="us-east-1")
+
+
+def _family(stubber, group, family):
+    stubber.add_response(
+        "describe_db_parameter_groups",
+        {"DBParameterGroups": [{"DBParameterGroupName": group, "DBParameterGroupFamily": family}]},
+        {"DBParameterGroupName": group},
+    )
+
+
+def _tuned(stubber, name, parameters):
+    stubber.add_response(
+        "modify_db_parameter_group",
+        {"DBParameterGroupName": name},
+        {
+            "DBParameterGroupName": name,
+            "Parameters": [
+                {"ParameterName": key, "ParameterValue": value, "ApplyMethod": "immediate"}
+                for key, value in sorted(parameters.items())
+            ],
+        },
+    )
+
+
+def test_staging_parameter_group_copies_a_custom_group():
+    client = _rds_client()
+    with Stubber(client) as stubber:
+        _family(stubber, "prod-pg", "postgres16")
+        stubber.add_response(
+            "copy_db_parameter_group",
+            {},
+            {
+                "SourceDBParameterGroupIdentifier": "prod-pg",
+                "TargetDBParameterGroupIdentifier": "datamasque-staging-prod-pg",
+                "TargetDBParameterGroupDescription": "DataMasque write-optimized staging parameters (prod-pg)",
+            },
+        )
+        _tuned(stubber, "datamasque-staging-prod-pg", staging.WRITE_OPTIMIZED_PARAMETERS["postgres"])
+
+        assert staging.staging_parameter_group(client, "prod-pg") == "datamasque-staging-prod-pg"
+        stubber.assert_no_pending_responses()
+
+
+def test_staging_parameter_group_reuses_an_existing_group_for_a_default():
+    client = _rds_client()
+    with Stubber(client) as stubber:
+        _family(stubber, "default.mysql8.0", "mysql8.0")
+        stubber.add_client_error("create_db_parameter_group", "DBParameterGroupAlreadyExists")
+        _tuned(stubber, "datamasque-staging-mysql8-0", staging.WRITE_OPTIMIZED_PARAMETERS["mysql"])
+
+        assert staging.staging_parameter_group(client, "default.mysql8.0") == "datamasque-staging-mysql8-0"
+        stubber.assert_no_pending_responses()
+
+
+def test_staging_parameter_group_keeps_the_source_group_without_tuning():
+    client = _rds_client()
+    with Stubber(client) as stubber:
+        _family(stubber, "default.sqlserver-se-15.0", "sqlserver-se-15.0")
+
+        assert staging.staging_parameter_group(client, "default.sqlserver-se-15.0") == "default.sqlserver-se-15.0"
+
+
+def test_staging_parameter_group_falls_back_on_errors():
+    client = _rds_client()
+    with Stubber(client) as stubber:
+        stubber.add_client_error("describe_db_parameter_groups", "AccessDenied")
+
+        assert staging.staging_parameter_group(client, "prod-pg") == "prod-pg"
+
+
+def test_writer_instance_params_turn_off_monitoring_unless_opted_out():
+    assert staging.writer_instance_params(_event())["EnablePerformanceInsights"] is False
+
+    event = _event()
+    event["WriteOptimizedStaging"] = False
+    assert "EnablePerformanceInsights" not in staging.writer_instance_params(event)
@@ -0,0 +1,120 @@
+"""
+Unit tests for blueprint_common.state_store.
+
+Run from this directory:
+    pytest test_state_store.py -v
+"""
+import json
+import time
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from blueprint_common import state_store
+from blueprint_common.state_store import DynamoDBStore, MemoryStore
+
+
+def test_memory_store_round_trip_and_listing():
+    store = MemoryStore()
+    store.put("masking_run", "1", {"a": 1})
+    store.put("masking_run", "2", {"a": 2})
+    store.put("other", "1", {"a": 3})
+
+    assert store.get("masking_run", "1") == {"a": 1}
+    assert sorted(store.items("masking_run")) == [("1", {"a": 1}), ("2", {"a": 2})]
+
+    store.delete("masking_run", "1")
+    assert store.get("masking_run", "1") is None
+    assert store.items("masking_run") == [("2", {"a": 2})]
+
+
+def test_memory_store_hides_expired_items(monkeypatch):
+    store = MemoryStore()
+    store.put("k", "1", {"a": 1}, ttl_seconds=10)
+    later = time.time() + 11
+    monkeypatch.setattr(state_store.time, "time", lambda: later)
+
+    assert store.get("k", "1") is None
+    assert store.items("k") == []
+
+
+def test_memory_store_returns_copies():
+    store = MemoryStore()
+    value = {"nested": {"a": 1}}
+    store.put("k", "1", value)
+    value["nested"]["a"] = 2
+
+    got = store.get("k", "1")
+    got["nested"]["a"] = 3
+    assert store.get("k", "1") == {"nested": {"a": 1}}
+
+
+@pytest.fixture
+def dynamodb():
+    client = boto3.client("dynamodb", region_name="us-east-1", aws_access_key_id="x", aws_secret_access_key="x")
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_dynamodb_store_put_sets_ttl(dynamodb, monkeypatch):
+    client, stubber = dynamodb
+    monkeypatch.setattr(state_store.time, "time", lambda: 1000.5)
+    stubber.add_response(
+        "put_item",
+        {},
+        {
+            "TableName": "state",
+            "Item": {
+                "kind": {"S": "masking_run"},
+                "key": {"S": "7"},
+                "value": {"S": json.dumps({"a": 1})},
+                "expires_at": {"N": "1060"},
+            },
+        },
+    )
+
+    DynamoDBStore("state", client).put("masking_run", "7", {"a": 1}, ttl_seconds=60)
+
+
+def test_dynamodb_store_items_skips_expired(dynamodb):
+    client, stubber = dynamodb
+    now = int(time.time())
+    stubber.add_response(
+        "query",
+        {
+            "Items": [
+                {"kind": {"S": "k"}, "key": {"S": "live"}, "value": {"S": '{"a": 1}'}, "expires_at": {"N": str(now + 600)}},
+                {"kind": {"S": "k"}, "key": {"S": "dead"}, "value": {"S": '{"a": 2}'}, "expires_at": {"N": str(now - 600)}},
+                {"kind": {"S": "k"}, "key": {"S": "forever"}, "value": {"S": '{"a": 3}'}},
+            ]
+        },
+        {
+            "TableName": "state",
+            "KeyConditionExpression": "#kind = :kind",
+            "ExpressionAttributeNames": {"#kind": "kind"},
+            "ExpressionAttributeValues": {":kind": {"S": "k"}},
+        },
+    )
+
+    assert DynamoDBStore("state", client).items("k") == [("live", {"a": 1}), ("forever", {"a": 3})]
+
+
+def test_dynamodb_store_get_missing(dynamodb):
+    client, stubber = dynamodb
+    stubber.add_response("get_item", {}, {"TableName": "state", "Key": {"kind": {"S": "k"}, "key": {"S": "1"}}, "ConsistentRead": True})
+
+    assert DynamoDBStore("state", client).get("k", "1") is None
+
+
+def test_get_store_uses_table_when_configured(monkeypatch):
+    monkeypatch.setenv("STATE_TABLE_NAME", "state")
+    state_store.reset_store()
+    try:
+        assert isinstance(state_store.get_store(), DynamoDBStore)
+    finally:
+        state_store.reset_store()
+    monkeypatch.delenv("STATE_TABLE_NAME")
+    assert isinstance(state_store.get_store(), MemoryStore)
+    state_store.reset_store()
@@ -0,0 +1,38 @@
+"""
+Unit tests for blueprint_common.steps.
+
+Run from this directory:
+    pytest test_steps.py -v
+"""
+import time
+
+import pytest
+
+from blueprint_common import steps
+from blueprint_common.steps import StepTimer
+
+
+def test_submitted_steps_overlap_and_are_timed():
+    timer = StepTimer()
+
+    pending = [timer.submit(f"sleep{i}", time.sleep, 0.1) for i in range(3)]
+    for future in pending:
+        future.result()
+
+    timings = timer.as_dict()
+    assert all(timings[f"sleep{i}"] >= 100 for i in range(3))
+    assert timings["total"] < 250
+
+
+def test_failed_step_is_timed_and_raises():
+    timer = StepTimer()
+
+    with pytest.raises(ZeroDivisionError):
+        with timer.step("divide"):
+            1 / 0
+
+    assert "divide" in timer.timings
+
+
+def test_executor_is_reused():
+    assert steps.executor() is steps.executor()